@@ -0,0 +1,572 @@
+"""
+Offline-Benchmarks für datamigration_cb_ev-api.py
+
+Startet einen lokalen Ersatz für die easyVerein-API (contact-details, invoice, invoice-item) mit einstellbarer
+Latenz, Seitengröße und 429-Verhalten, erzeugt synthetische Courtbooking-CSVs und misst die einzelnen Stufen von
+main(): ingest, doublecheck, grouping, member merge, invoice build, submit.
+
+Beispiele:
+    python benchmark_cb_ev-api.py run --sizes 1k 100k --output bench_v1.json
+    python benchmark_cb_ev-api.py run --sizes 1k 100k --baseline bench_v0.json --threshold 1.25
+    python benchmark_cb_ev-api.py serve --port 8080 --latency 0.05 --requests-per-minute 100
+"""
+import argparse
+import contextlib
+import datetime as dt
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from easyverein import EasyvereinAPI
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datamigration_cb_ev-api.py')
+
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+STAGES = ['ingest', 'doublecheck', 'grouping', 'member merge', 'fuzzy match', 'invoice build', 'submit']
+COUNTERS = ['api requests', 'api rate limited']  # Anzahl statt Sekunden, eigener Vergleich in compare_with_baseline
+
+VORNAMEN = ['Max', 'Anna', 'Lukas', 'Charlotte', 'Christian', 'Sophie', 'Jürgen', 'Eva', 'Hans Peter', 'Marie-Luise']
+NACHNAMEN = ['Müller', 'Schmidt', 'Fischer', 'Lechner', 'Dohn', 'Huber', 'Weiß', 'Schäfer', 'Meier-Böhm', 'Wagner']
+GETRAENKE = {'Bier': 2.5, 'Radler': 2.5, 'Wasser': 1.0, 'Spezi': 1.8, 'Apfelschorle': 1.8, 'Kaffee': 1.5}
+GROUP_MITGLIED = 'https://easyverein.com/api/v2.0/contact-details-group/193181080'
+
+
+def load_migration_module():
+    """
+    Lädt datamigration_cb_ev-api.py als Modul (der Bindestrich im Dateinamen verhindert einen normalen import)
+    :return: Modul
+    """
+    spec = importlib.util.spec_from_file_location('datamigration_cb_ev_api', SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+LIST_PARAMS = ('limit', 'page', 'query', 'ordering', 'showCount', 'search')  # keine Filter auf Felder
+FILTER_LOOKUPS = ('', 'in', 'not', 'gt', 'gte', 'lt', 'lte')
+
+
+def _filter_value(value):
+    """
+    Feldwert für den Vergleich mit einem Filter: Verweise (URL, int oder dict) werden zur id, alles andere zu str
+    """
+    if isinstance(value, dict):
+        value = value.get('id')
+    if isinstance(value, str) and value.startswith('http'):
+        value = value.rstrip('/').rsplit('/', 1)[-1]
+    return None if value is None else str(value)
+
+
+def filter_matches(obj, key, value) -> bool:
+    """
+    :param obj: Objekt als dict
+    :param key: Filter-Parameter wie 'invNumber__in', 'relatedInvoice', 'date__gt'
+    :param value: Wert aus der Query
+    :raises ValueError: Lookup, den der Mock nicht kennt
+    """
+    field, _, lookup = key.partition('__')
+    if lookup not in FILTER_LOOKUPS:
+        raise ValueError("unsupported filter %(key)s" % {"key": key})
+    raw = obj.get(field)
+    values = {_filter_value(item) for item in raw} if isinstance(raw, list) else {_filter_value(raw)}
+    if lookup == '':
+        return _filter_value(value) in values
+    if lookup == 'in':
+        return bool(values & {_filter_value(item) for item in value.split(',')})
+    if lookup == 'not':
+        return _filter_value(value) not in values
+    current = _filter_value(raw)
+    if current is None:
+        return False
+    if current.isdigit() and value.isdigit():  # ids und Rechnungsnummern numerisch, Datumsangaben als Text vergleichen
+        current, value = int(current), int(value)
+    return {'gt': current > value, 'gte': current >= value, 'lt': current < value, 'lte': current <= value}[lookup]
+
+
+class MockEasyvereinServer:
+    """
+    Lokaler Ersatz für die REST-Endpunkte, die EasyvereinAPI anspricht. Listen werden wie bei easyVerein paginiert
+    ({"count", "next", "previous", "results"}), POST legt Objekte mit fortlaufender id an, PATCH/PUT ändert sie.
+    Filter-Parameter werden wie von easyVerein angewendet (siehe filter_matches), unbekannte mit 400 abgelehnt.
+    """
+
+    def __init__(self, port=0, latency=0.0, max_page_size=100, requests_per_minute=None, send_retry_after=True):
+        """
+        :param port: 0 = freien Port wählen
+        :param latency: Wartezeit je Request in Sekunden
+        :param max_page_size: größte erlaubte limit-Angabe je Seite
+        :param requests_per_minute: ab dieser Anzahl im gleitenden Minutenfenster wird mit 429 geantwortet
+        :param send_retry_after: bei 429 einen Retry-After Header mitschicken (Sekunden bis das Fenster wieder frei ist)
+        """
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.requests_per_minute = requests_per_minute
+        self.send_retry_after = send_retry_after
+        self.store = {}
+        self.stats = {'requests': 0, 'rate_limited': 0, 'bytes_sent': 0}
+        self._lock = threading.Lock()
+        self._window = deque()
+        self._next_id = 1
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%(port)s/api/' % {"port": self._server.server_address[1]}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add(self, endpoint, objects):
+        """
+        Legt Objekte direkt im Speicher an, z.B. synthetische Kontakte
+        :param endpoint: z.B. 'contact-details'
+        :param objects: Liste von dicts, ohne id wird eine vergeben
+        """
+        with self._lock:
+            table = self.store.setdefault(endpoint, {})
+            for obj in objects:
+                obj = dict(obj)
+                obj.setdefault('id', self._next_id)
+                self._next_id = max(self._next_id, obj['id']) + 1
+                table[obj['id']] = obj
+
+    def _throttled(self):
+        # gleitendes Fenster über die letzten 60 Sekunden
+        if not self.requests_per_minute:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            if len(self._window) >= self.requests_per_minute:
+                self.stats['rate_limited'] += 1
+                return max(0.0, 60 - (now - self._window[0]))
+            self._window.append(now)
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=None, headers=None):
+                payload = json.dumps(body).encode('utf-8') if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+                with server._lock:
+                    server.stats['bytes_sent'] += len(payload)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+            def _route(self):
+                # /api/<version>/<endpoint>[/<id>[/...]]
+                parts = [part for part in urlsplit(self.path).path.split('/') if part]
+                endpoint = parts[2] if len(parts) > 2 else None
+                obj_id = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else None
+                return endpoint, obj_id, parts[4:]
+
+            def _handle(self, method):
+                with server._lock:
+                    server.stats['requests'] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                wait = server._throttled()
+                if wait is not None:
+                    headers = {'Retry-After': str(int(np.ceil(wait)))} if server.send_retry_after else {}
+                    return self._send(429, {'detail': 'Request was throttled.'}, headers)
+                endpoint, obj_id, rest = self._route()
+                if endpoint is None:
+                    return self._send(404, {'detail': 'Not found.'})
+                table = server.store.setdefault(endpoint, {})
+                if method == 'GET' and obj_id is None:
+                    try:
+                        return self._send(200, self._page(endpoint, table))
+                    except ValueError as e:
+                        return self._send(400, {'detail': str(e)})
+                if method == 'POST' and obj_id is None:
+                    obj = self._body()
+                    with server._lock:
+                        obj['id'] = server._next_id
+                        server._next_id += 1
+                        table[obj['id']] = obj
+                    return self._send(201, obj)
+                if obj_id not in table:
+                    return self._send(404, {'detail': 'Not found.'})
+                if method == 'GET':
+                    return self._send(200, table[obj_id])
+                if method in ('PATCH', 'PUT'):
+                    with server._lock:
+                        table[obj_id].update(self._body())
+                    return self._send(200, table[obj_id])
+                if method == 'POST':  # Aktionen wie /invoice/<id>/...
+                    return self._send(200, table[obj_id])
+                if method == 'DELETE':
+                    with server._lock:
+                        del table[obj_id]
+                    return self._send(204)
+                return self._send(405, {'detail': 'Method not allowed.'})
+
+            def _page(self, endpoint, table):
+                query = parse_qs(urlsplit(self.path).query)
+                limit = min(int(query.get('limit', [server.max_page_size])[0]), server.max_page_size)
+                page = int(query.get('page', [1])[0])
+                filters = {key: value[0] for key, value in query.items() if key not in LIST_PARAMS}
+                with server._lock:
+                    objects = [obj for obj in table.values()
+                               if all(filter_matches(obj, key, value) for key, value in filters.items())]
+                results = objects[(page - 1) * limit:page * limit]
+                base = server.url + urlsplit(self.path).path.split('/api/', 1)[-1]
+
+                def link(page_nr):
+                    params = {key: value[0] for key, value in query.items()}
+                    params.update(limit=limit, page=page_nr)
+                    return base + '?' + urlencode(params)
+
+                return {'count': len(objects),
+                        'next': link(page + 1) if page * limit < len(objects) else None,
+                        'previous': link(page - 1) if page > 1 else None,
+                        'results': results}
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_PATCH(self):
+                self._handle('PATCH')
+
+            def do_PUT(self):
+                self._handle('PUT')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+        return Handler
+
+
+def generate_players(n_players, seed=0) -> pd.DataFrame:
+    """
+    Synthetische Spieler mit eindeutigem Vor-/Nachnamen, PLZ und Telefonnummern
+    :param n_players: Anzahl Spieler
+    :return: DataFrame im Format der Courtbooking-Mitgliederliste
+    """
+    rng = np.random.default_rng(seed)
+    idx = np.arange(n_players)
+    vorname = np.array(VORNAMEN, dtype=object)[idx % len(VORNAMEN)]
+    nachname = (pd.Series(np.array(NACHNAMEN, dtype=object)[(idx // len(VORNAMEN)) % len(NACHNAMEN)])
+                + pd.Series(idx // (len(VORNAMEN) * len(NACHNAMEN))).map(lambda i: '' if i == 0 else str(i)))
+    plz = rng.choice([82269, 82256, 82272, 80331], size=n_players).astype(float)
+    plz[rng.random(n_players) < 0.02] = np.nan
+    return pd.DataFrame({
+        'Vorname': vorname,
+        'Nachname': nachname.to_numpy(),
+        'Geschlecht': rng.choice(['Männlich', 'Weiblich'], size=n_players),
+        'PLZ': plz,
+        'Telefonnummer': pd.Series(idx).map(lambda i: '08144 / %06d' % i).to_numpy(),
+        'Handynummer': np.where(rng.random(n_players) < 0.5, None, '0170 1234567'),
+        'E-Mail': pd.Series(idx).map(lambda i: 'spieler%s@example.com' % i).to_numpy(),
+    })
+
+
+def generate_buchungen(df_players, n_bookings, season_start=dt.date(2024, 5, 1), season_days=150, seed=0):
+    """
+    Synthetische Getränkebuchungen im Format von getraenkeliste.csv
+    :param df_players: Spieler aus generate_players
+    :param n_bookings: Anzahl Buchungen
+    :return: DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    player = rng.integers(0, len(df_players), size=n_bookings)
+    minutes = rng.integers(0, season_days, size=n_bookings) * 1440 + rng.integers(9 * 60, 22 * 60, size=n_bookings)
+    kaufdatum = pd.Timestamp(season_start) + pd.to_timedelta(minutes, unit='m')
+    getraenk = rng.choice(list(GETRAENKE), size=n_bookings)
+    preis = pd.Series(getraenk).map(GETRAENKE).map(lambda p: ('%.2f' % p).replace('.', ','))
+    return pd.DataFrame({
+        'Vorname': df_players['Vorname'].to_numpy()[player],
+        'Nachname': df_players['Nachname'].to_numpy()[player],
+        'Kaufdatum': kaufdatum.strftime('%d.%m.%Y %H:%M'),
+        'Getränk': getraenk,
+        'Anzahl': rng.integers(1, 5, size=n_bookings),
+        'Preis': preis.to_numpy(),
+        'Gezahlt': np.where(rng.random(n_bookings) < 0.8, 'Nicht gezahlt', 'Gezahlt'),
+    })
+
+
+def generate_contacts(df_players, share_in_ev=0.9, seed=0) -> list:
+    """
+    easyVerein-Kontakte zu einem Teil der Spieler, im JSON-Format der API
+    :param df_players: Spieler aus generate_players
+    :param share_in_ev: Anteil der Spieler, die in easyVerein angelegt sind
+    :return: Liste von dicts
+    """
+    rng = np.random.default_rng(seed)
+    contacts = []
+    for i, player in enumerate(df_players.to_dict(orient='records')):
+        if rng.random() >= share_in_ev:
+            continue
+        contacts.append({'id': i + 1,
+                         'firstName': player['Vorname'],
+                         'familyName': player['Nachname'],
+                         'salutation': 'Herr' if player['Geschlecht'] == 'Männlich' else 'Frau',
+                         'street': 'Hauptstraße %s' % (i % 100 + 1),
+                         'zip': None if pd.isna(player['PLZ']) else str(int(player['PLZ'])),
+                         'city': 'Grafrath',
+                         'primaryEmail': player['E-Mail'],
+                         'methodOfPayment': 2,
+                         'contactDetailsGroups': [GROUP_MITGLIED]})
+    return contacts
+
+
+def write_dataset(directory, n_bookings, billed_share=0.1, seed=0) -> dict:
+    """
+    Schreibt getraenkeliste.csv, mitgliederliste.csv und Gesamtübersicht_getraenke.csv (semikolon, latin1)
+    :param directory: Zielverzeichnis
+    :param n_bookings: Anzahl Buchungen
+    :param billed_share: Anteil der offenen Buchungen, die schon in der Gesamtübersicht stehen
+    :return: dict mit Pfaden, Spielern und Kontakten
+    """
+    n_players = int(min(max(50, n_bookings // 50), 20000))
+    df_players = generate_players(n_players, seed=seed)
+    df_buchungen = generate_buchungen(df_players, n_bookings, seed=seed)
+    rng = np.random.default_rng(seed)
+    not_paid = df_buchungen.loc[df_buchungen['Gezahlt'] == 'Nicht gezahlt']
+    df_alltime = not_paid.loc[rng.random(len(not_paid)) < billed_share]
+    paths = {'buchungen': os.path.join(directory, 'getraenkeliste.csv'),
+             'mitglieder': os.path.join(directory, 'mitgliederliste.csv'),
+             'alltime': os.path.join(directory, 'Gesamtübersicht_getraenke.csv')}
+    df_buchungen.to_csv(paths['buchungen'], sep=';', encoding='latin1', index=False)
+    df_players.to_csv(paths['mitglieder'], sep=';', encoding='latin1', index=False)
+    df_alltime.to_csv(paths['alltime'], sep=';', encoding='latin1', index=False)
+    return dict(paths, players=df_players, contacts=generate_contacts(df_players, seed=seed))
+
+
+def _timed(timings, stage, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def run_stages(mig, server, dataset, directory, completion_date=dt.date(2024, 9, 30), max_submit=200,
+               max_workers=1, requests_per_minute=6000) -> dict:
+    """
+    Führt die Stufen von main() einzeln aus und misst sie
+    :param mig: geladenes datamigration-Modul
+    :param server: laufender MockEasyvereinServer mit den Kontakten aus dataset
+    :param dataset: Ergebnis von write_dataset
+    :param max_submit: Anzahl Spieler, deren Rechnungen an den Mock geschickt werden
+    :return: dict stage -> Sekunden; Stufen, die es in der geladenen Version noch nicht gibt (fuzzy match vor
+        ContactMatchIndex), fehlen
+    """
+    mig.ev_client = EasyvereinAPI('benchmark', api_version='v2.0', base_url=server.url, logger=None)
+    mig.rate_limiter.set_ceiling(requests_per_minute)
+    timings = {}
+
+    df_todo = _timed(timings, 'ingest', mig.ingest_buchungen, dataset['buchungen'])
+    df_not_paid = df_todo.loc[df_todo['Gezahlt'] == 'Nicht gezahlt']
+    index = mig.FingerprintIndex.from_frame(pd.read_csv(dataset['alltime'], encoding='latin1', sep=';'))
+    df = _timed(timings, 'doublecheck', mig.doublecheck_billing, df_not_paid=df_not_paid, index=index)
+    df['Anzahl'] = df['Anzahl'].astype('int64')
+    df['Getränk'] = df['Getränk'].astype(object)  # ältere group_purchases kommen mit category nicht zurecht
+    df_grouped_all_person = _timed(timings, 'grouping', mig.group_purchases, df)
+
+    def member_merge():
+        df_mitgliederliste = mig.ingest_mitgliederliste(dataset['mitglieder'])
+        df_all_members = mig.get_members_in_ev()
+        return mig.merge_player_data(df_grouped_all_person, df_mitgliederliste, df_all_members)
+
+    merged_all_players_df = _timed(timings, 'member merge', member_merge)
+
+    def fuzzy_match():
+        df_mitgliederliste = mig.ingest_mitgliederliste(dataset['mitglieder'])
+        match_index = mig.ContactMatchIndex(mig.get_members_in_ev())
+        return mig.merge_player_data(df_grouped_all_person, df_mitgliederliste, match_index.df_all_members,
+                                     match_index=match_index)
+
+    if hasattr(mig, 'ContactMatchIndex'):
+        with contextlib.redirect_stdout(io.StringIO()):  # keine Ausgabe je mehrdeutigem Spieler
+            _timed(timings, 'fuzzy match', fuzzy_match)
+    contacts = [contact for contact in merged_all_players_df.to_dict(orient='records')
+                if contact['Gruppe'] in ('Mitglied', 'Gast')]
+
+    allocator = mig.InvoiceNumberAllocator(current_year=completion_date.year,
+                                           fetch_current_invoice_nr=lambda current_year: 0)
+    if hasattr(mig, 'InvoiceBatchBuilder'):
+        builder = mig.InvoiceBatchBuilder(completion_date=completion_date)
+        _timed(timings, 'invoice build', builder.build_batch, contacts)
+    else:  # Versionen vor dem Batch-Builder bauen jede Rechnung einzeln
+        _timed(timings, 'invoice build', lambda: [mig.create_invoice(contact=contact, completion_date=completion_date,
+                                                                     dryrun=True, allocator=allocator)
+                                                  for contact in contacts])
+
+    df_todo_raw = df_todo.drop(columns=mig.DERIVED_BUCHUNGEN_COLUMNS)
+    sent_before = len(server.store.get('invoice', {}))
+    with mig.CsvLedger(os.path.join(directory, 'ledger_submit.csv')) as ledger:
+        _timed(timings, 'submit', mig.submit_invoices, contacts[:max_submit], completion_date=completion_date,
+               dryrun=False, allocator=allocator, ledger=ledger, index=index, df_todo_raw=df_todo_raw,
+               max_workers=max_workers)
+    sent = len(server.store.get('invoice', {})) - sent_before
+    if max_submit and not sent:
+        # sonst stünde eine leere Stufe als Zeitmessung im Bericht (und in jeder späteren Baseline)
+        raise RuntimeError("submit sent no invoice to the mock (%(contacts)s billable contacts), the timings would "
+                           "be meaningless" % {"contacts": len(contacts)})
+    return timings
+
+
+def git_label():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty', '--tags'], capture_output=True, text=True,
+                              cwd=os.path.dirname(SCRIPT_PATH), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare_with_baseline(report, baseline, threshold, min_delta=0.05, count_threshold=1.0) -> list:
+    """
+    :param report: aktueller Bericht aus run_benchmarks
+    :param baseline: früherer Bericht (z.B. letzte Release)
+    :param threshold: Faktor, ab dem eine Stufe als Regression gilt
+    :param min_delta: kleinere absolute Unterschiede werden als Messrauschen ignoriert
+    :param count_threshold: Faktor für die COUNTERS (Anzahl Requests bzw. 429), 1.0 = jede Zunahme
+    :return: Liste von (size, stage, baseline, current), Sekunden bzw. Anzahl bei den COUNTERS
+    """
+    regressions = []
+    for size, timings in report['results'].items():
+        for stage, value in timings.items():
+            before = baseline.get('results', {}).get(size, {}).get(stage)
+            if before is None:
+                continue
+            if stage in COUNTERS:
+                regressed = value > before * count_threshold
+            else:
+                regressed = before > 0 and value > before * threshold and value - before > min_delta
+            if regressed:
+                regressions.append((size, stage, before, value))
+    return regressions
+
+
+def run_benchmarks(sizes, latency=0.0, max_page_size=100, server_requests_per_minute=None, max_submit=200,
+                   max_workers=1, seed=0) -> dict:
+    """
+    Erzeugt je Größe einen Datensatz, startet den Mock-Server und misst alle Stufen
+    :param sizes: Schlüssel aus SIZES, z.B. ['1k', '100k']
+    :return: Bericht als dict (label, Umgebung, results: size -> stage -> Sekunden)
+    """
+    mig = load_migration_module()
+    report = {'label': git_label(),
+              'created': dt.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'pandas': pd.__version__,
+              'numpy': np.__version__,
+              'settings': {'latency': latency, 'max_page_size': max_page_size,
+                           'server_requests_per_minute': server_requests_per_minute, 'max_submit': max_submit,
+                           'max_workers': max_workers},
+              'results': {}}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            dataset = write_dataset(directory, SIZES[size], seed=seed)
+            with MockEasyvereinServer(latency=latency, max_page_size=max_page_size,
+                                      requests_per_minute=server_requests_per_minute) as server:
+                server.add('contact-details', dataset['contacts'])
+                timings = run_stages(mig, server, dataset, directory, max_submit=max_submit, max_workers=max_workers)
+                timings['api requests'] = server.stats['requests']
+                timings['api rate limited'] = server.stats['rate_limited']
+        report['results'][size] = timings
+        print("%(size)6s: %(timings)s" % {"size": size, "timings": ', '.join(
+            '%s %.3f' % (stage, timings[stage]) for stage in STAGES if stage in timings)})
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline-Benchmarks für datamigration_cb_ev-api.py")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser_run = subparsers.add_parser('run', help="generate data, start the mock API and time every stage")
+    parser_run.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['1k', '100k'])
+    parser_run.add_argument('--latency', type=float, default=0.0, help="seconds per mock API request")
+    parser_run.add_argument('--max-page-size', type=int, default=100)
+    parser_run.add_argument('--server-requests-per-minute', type=int, default=None,
+                            help="mock answers with 429 above this rate")
+    parser_run.add_argument('--max-submit', type=int, default=200, help="invoices sent to the mock per size")
+    parser_run.add_argument('--max-workers', type=int, default=1)
+    parser_run.add_argument('--output', help="write the report as json")
+    parser_run.add_argument('--baseline', help="report of an earlier release to compare against")
+    parser_run.add_argument('--threshold', type=float, default=1.25, help="slowdown factor counted as regression")
+    parser_run.add_argument('--min-delta', type=float, default=0.05, help="ignore slowdowns below this many seconds")
+    parser_run.add_argument('--count-threshold', type=float, default=1.0,
+                            help="growth factor of api requests / rate limited counted as regression")
+    parser_serve = subparsers.add_parser('serve', help="only run the mock API")
+    parser_serve.add_argument('--port', type=int, default=8080)
+    parser_serve.add_argument('--latency', type=float, default=0.0)
+    parser_serve.add_argument('--max-page-size', type=int, default=100)
+    parser_serve.add_argument('--requests-per-minute', type=int, default=None)
+    parser_serve.add_argument('--contacts', type=int, default=1000, help="number of synthetic contacts")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        with MockEasyvereinServer(port=args.port, latency=args.latency, max_page_size=args.max_page_size,
+                                  requests_per_minute=args.requests_per_minute) as mock_server:
+            mock_server.add('contact-details', generate_contacts(generate_players(args.contacts)))
+            print("MOCK EASYVEREIN API RUNNING AT %(url)s" % {"url": mock_server.url})
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        sys.exit(0)
+
+    benchmark_report = run_benchmarks(args.sizes, latency=args.latency, max_page_size=args.max_page_size,
+                                      server_requests_per_minute=args.server_requests_per_minute,
+                                      max_submit=args.max_submit, max_workers=args.max_workers)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(benchmark_report, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline_report = json.load(fh)
+        found = compare_with_baseline(benchmark_report, baseline_report, threshold=args.threshold,
+                                      min_delta=args.min_delta, count_threshold=args.count_threshold)
+        for size, stage, before, value in found:
+            if stage in COUNTERS:
+                print("REGRESSION %(size)s %(stage)s: %(before)s -> %(value)s" % {
+                    "size": size, "stage": stage, "before": before, "value": value})
+            else:
+                print("REGRESSION %(size)s %(stage)s: %(before).3f s -> %(value).3f s" % {
+                    "size": size, "stage": stage, "before": before, "value": value})
+        sys.exit(1 if found else 0)
@@ -1,26 +1,530 @@
+import abc
+import argparse
+import contextlib
+import cProfile
+import functools
+import hashlib
+import heapq
+import inspect
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import pstats
+import random
 import re
+import sqlite3
+import sys
+import threading
 import time
+import traceback
+import tracemalloc
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from email.utils import parsedate_to_datetime
 
 import pandas as pd
 import numpy as np
 
 from easyverein import EasyvereinAPI
 from easyverein.models.contact_details import ContactDetailsFilter, ContactDetails
-from easyverein.models.invoice import InvoiceCreate, InvoiceFilter
+from easyverein.models.invoice import InvoiceCreate, InvoiceFilter, InvoiceUpdate
 from easyverein.models.invoice_item import InvoiceItem
 import datetime as dt
 from easyverein.core.exceptions import EasyvereinAPIException
 
 # HIER API-KEY EINTRAGEN
 api_key = ''
+EV_BASE_URL = "https://hexa.easyverein.com/api/"
+EV_API_VERSION = "v2.0"
 
 ev_client = EasyvereinAPI(
     api_key,
-    api_version="v2.0",
-    base_url="https://hexa.easyverein.com/api/",
+    api_version=EV_API_VERSION,
+    base_url=EV_BASE_URL,
     logger=None,
 )
 
+# Vereinsspezifische IDs in easyVerein, weitere Vereine bekommen eine eigene TenantConfig (siehe run_tenants)
+GROUP_ID_GAST = 187854580
+GROUP_ID_MITGLIED = 193181080
+GROUP_ID_NOT = 193181175  # alle Nicht-Firmen filtern, alle Member und ehemaligen member mit member: None
+BILLING_ACCOUNT_GAST = 44093
+BILLING_ACCOUNT_GETRAENK = 44134
+SELECTION_ACC_HAUPTKONTO = 187408412
+GUEST_ITEM_DESCRIPTION = 'Informationen Gästenutzung: https://www.tc-grafrath.de/der-verein/gaeste.html'
+
+EV_REFERENCE_URL = 'https://easyverein.com/api/'  # so verweist easyVerein auf andere Objekte, unabhängig von base_url
+CONTACT_GROUP_URL = 'https://easyverein.com/api/%(version)s/contact-details-group/%(id)s'
+CONTACT_DETAILS_URL = 'https://easyverein.com/api/v1.7/contact-details/%(id)s'
+BILLING_ACCOUNT_URL = 'https://easyverein.com/api/v2.0/billing-account/%(id)s'
+
+
+def get_retry_after(exc):
+    """
+    Prüft, ob eine EasyvereinAPIException ein Rate-Limit (HTTP 429) ist und liest den Retry-After Wert aus.
+    Je nach Version von python-easyverein steckt die Information in Attributen der Exception oder nur in der Meldung.
+    :param exc: EasyvereinAPIException
+    :return: None wenn kein 429, sonst Wartezeit in Sekunden (0.0 wenn kein Retry-After mitgeschickt wurde)
+    """
+    response = getattr(exc, 'response', None)
+    status_code = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    retry_after = getattr(exc, 'retry_after', None)
+    if retry_after is None and response is not None:
+        retry_after = (getattr(response, 'headers', None) or {}).get('Retry-After')
+    message = str(exc)
+    if status_code is None and re.search(r'\b429\b|too many requests', message, re.IGNORECASE):
+        status_code = 429
+    if status_code != 429:
+        return None
+    if retry_after is None:
+        match = re.search(r'retry[- ]after\D{0,5}(\d+(?:\.\d+)?)', message, re.IGNORECASE)
+        retry_after = match.group(1) if match else 0
+    try:
+        return max(0.0, float(retry_after))
+    except (TypeError, ValueError):
+        pass
+    try:  # Retry-After als HTTP-Datum
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RateLimiter:
+    """
+    Token-Bucket um alle Aufrufe an ev_client. Die Rate startet bei der Obergrenze requests_per_minute, wird bei einem
+    429 halbiert (Retry-After wird eingehalten, Backoff mit Jitter) und nach erfolgreichen Aufrufen schrittweise wieder
+    bis zur Obergrenze erhöht. Thread-safe, damit mehrere Submitter sich ein Budget teilen können.
+    Ein Token ist genau ein HTTP-Request: Methoden, die selbst mehrere Requests absetzen (get_all, create_with_items),
+    laufen deshalb nicht über call, sondern über get_all_pages bzw. send_invoice.
+    """
+
+    def __init__(self, requests_per_minute=60, min_requests_per_minute=2, burst=5, max_retries=5, backoff_base=2.0,
+                 recovery_per_minute=1.0):
+        """
+        :param requests_per_minute: Obergrenze der Requests pro Minute
+        :param min_requests_per_minute: Untergrenze, auf die bei wiederholten 429 gedrosselt wird
+        :param burst: Anzahl Requests, die ohne Wartezeit direkt hintereinander erlaubt sind
+        :param max_retries: Anzahl Wiederholungen nach 429, bevor die Exception weitergereicht wird
+        :param backoff_base: Basis des exponentiellen Backoffs, wenn die API kein Retry-After schickt
+        :param recovery_per_minute: Erhöhung der Rate (Requests/Minute) nach jedem erfolgreichen Aufruf
+        """
+        self._lock = threading.Lock()
+        self.min_requests_per_minute = min_requests_per_minute
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.recovery_per_minute = recovery_per_minute
+        self.set_ceiling(requests_per_minute)
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self.throttled_seconds = 0.0
+        self.requests = 0
+        self.rate_limited = 0
+        self.report = None  # RunReport, der jeden Aufruf je Endpunkt mitzählt
+
+    def reset_stats(self):
+        """
+        Setzt requests, rate_limited und throttled_seconds für einen neuen Lauf zurück, die Rate bleibt
+        """
+        with self._lock:
+            self.requests = 0
+            self.rate_limited = 0
+            self.throttled_seconds = 0.0
+
+    def set_ceiling(self, requests_per_minute):
+        """
+        Setzt die Obergrenze neu und startet wieder mit voller Rate
+        :param requests_per_minute: Requests pro Minute
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive, got %(rpm)s" % {"rpm": requests_per_minute})
+        with self._lock:
+            self.max_rate = requests_per_minute / 60.0
+            self.min_rate = min(self.min_requests_per_minute, requests_per_minute) / 60.0
+            self.rate = self.max_rate
+
+    @property
+    def requests_per_minute(self):
+        return self.rate * 60.0
+
+    def _refill(self, now):
+        self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """
+        Reserviert einen Token und wartet, bis er fällig ist
+        :return: gewartete Zeit in Sekunden
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1.0
+            wait = max(-self._tokens / self.rate if self._tokens < 0 else 0.0, self._blocked_until - now)
+            self.throttled_seconds += wait
+            self.requests += 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery_per_minute / 60.0)
+
+    def on_throttle(self, retry_after, attempt):
+        """
+        Halbiert die Rate und sperrt den Bucket für Retry-After (bzw. exponentiellen Backoff) plus Jitter
+        :param retry_after: Wartezeit aus der API in Sekunden, 0 wenn unbekannt
+        :param attempt: Nummer des fehlgeschlagenen Versuchs (0-basiert)
+        """
+        delay = retry_after if retry_after else self.backoff_base ** attempt
+        delay += random.uniform(0, 0.5 * delay)
+        with self._lock:
+            self.rate_limited += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Führt einen einzelnen Request gedrosselt aus und wiederholt ihn bei 429. Ein 429 heißt, dass easyVerein den
+        Request nicht verarbeitet hat, daher ist die Wiederholung auch für create sicher.
+        :param func: ev_client-Methode, die genau einen Request absetzt, z.B. ev_client.invoice.create
+        :return: Rückgabe von func
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except EasyvereinAPIException as e:
+                retry_after = get_retry_after(e)
+                if retry_after is None or attempt == self.max_retries:
+                    if self.report is not None:
+                        self.report.record_api_call(func, args, kwargs, None, time.perf_counter() - started,
+                                                    retries=attempt, error=e)
+                    raise
+                self.on_throttle(retry_after=retry_after, attempt=attempt)
+                continue
+            self.on_success()
+            if self.report is not None:
+                self.report.record_api_call(func, args, kwargs, result, time.perf_counter() - started, retries=attempt)
+            return result
+
+
+rate_limiter = RateLimiter(requests_per_minute=60)
+
+
+class TenantConfig:
+    """
+    Alles Vereinsspezifische eines Laufs: ev_client mit eigenem rate_limiter (eigenes Budget je API-Key), Gruppen,
+    Buchungskonten und die URLs, über die easyVerein auf Kontakte, Gruppen und Buchungskonten verweist. main reicht
+    sie an alle Funktionen mit API-Zugriff weiter; ohne Angabe gilt der Verein aus den Einstellungen oben (resolve).
+    """
+
+    def __init__(self, ev_client, rate_limiter, contact_group_url, contact_details_url, billing_account_url,
+                 group_gast=GROUP_ID_GAST, group_mitglied=GROUP_ID_MITGLIED, group_not=GROUP_ID_NOT,
+                 billing_account_gast=BILLING_ACCOUNT_GAST, billing_account_getraenk=BILLING_ACCOUNT_GETRAENK,
+                 selection_acc=SELECTION_ACC_HAUPTKONTO, guest_item_description=GUEST_ITEM_DESCRIPTION, name=None):
+        """
+        :param contact_group_url: URL einer Kontaktgruppe mit %(id)s, ebenso contact_details_url und
+            billing_account_url
+        :param name: Name des Vereins für Logs und Reports
+        """
+        self.name = name
+        self.ev_client = ev_client
+        self.rate_limiter = rate_limiter
+        self.contact_group_url = contact_group_url
+        self.contact_details_url = contact_details_url
+        self.billing_account_url = billing_account_url
+        self.group_gast = group_gast
+        self.group_mitglied = group_mitglied
+        self.group_not = group_not
+        self.billing_account_gast = billing_account_gast
+        self.billing_account_getraenk = billing_account_getraenk
+        self.selection_acc = selection_acc
+        self.guest_item_description = guest_item_description
+
+    @classmethod
+    def resolve(cls, tenant=None):
+        """
+        :param tenant: TenantConfig oder None
+        :return: tenant, ohne Angabe der Verein aus den Modul-Einstellungen (ev_client, rate_limiter, GROUP_ID_* ...)
+        """
+        if tenant is not None:
+            return tenant
+        return cls(ev_client=ev_client, rate_limiter=rate_limiter,
+                   contact_group_url=CONTACT_GROUP_URL % {"version": EV_API_VERSION, "id": '%(id)s'},
+                   contact_details_url=CONTACT_DETAILS_URL, billing_account_url=BILLING_ACCOUNT_URL)
+
+    @classmethod
+    def from_dict(cls, tenant):
+        """
+        :param tenant: tenant-dict aus load_tenant_config; die URLs folgen reference_url und api_version des Vereins
+        :return: TenantConfig mit eigenem ev_client und rate_limiter
+        """
+        api_version = tenant.get("api_version", EV_API_VERSION)
+        url = tenant.get("reference_url", EV_REFERENCE_URL) + api_version + '/%(path)s/%%(id)s'
+        groups = tenant.get("groups", {})
+        billing_accounts = tenant.get("billing_accounts", {})
+        return cls(ev_client=EasyvereinAPI(tenant["api_key"], api_version=api_version,
+                                           base_url=tenant.get("base_url", EV_BASE_URL), logger=None),
+                   rate_limiter=RateLimiter(requests_per_minute=tenant.get("requests_per_minute", 60)),
+                   contact_group_url=url % {"path": 'contact-details-group'},
+                   contact_details_url=url % {"path": 'contact-details'},
+                   billing_account_url=url % {"path": 'billing-account'},
+                   group_gast=groups.get("Gast", GROUP_ID_GAST),
+                   group_mitglied=groups.get("Mitglied", GROUP_ID_MITGLIED),
+                   group_not=groups.get("not", GROUP_ID_NOT),
+                   billing_account_gast=billing_accounts.get("Gast", BILLING_ACCOUNT_GAST),
+                   billing_account_getraenk=billing_accounts.get("Getränk", BILLING_ACCOUNT_GETRAENK),
+                   selection_acc=tenant.get("selection_acc", SELECTION_ACC_HAUPTKONTO),
+                   guest_item_description=tenant.get("guest_item_description", GUEST_ITEM_DESCRIPTION),
+                   name=tenant["name"])
+
+    @property
+    def contact_groups(self) -> dict:
+        """
+        :return: URL der Kontaktgruppe -> 'Gast' bzw. 'Mitglied'
+        """
+        return {self.contact_group_url % {"id": self.group_gast}: 'Gast',
+                self.contact_group_url % {"id": self.group_mitglied}: 'Mitglied'}
+
+    @property
+    def contact_filter_not_group(self) -> str:
+        return str(self.group_not)
+
+
+EV_PAGE_SIZE = 100  # größte Seitengröße, die easyVerein je Request zulässt
+
+
+def get_all_pages(resource, search=None, limit_per_page=EV_PAGE_SIZE, tenant=None) -> list:
+    """
+    Wie resource.get_all, aber jede Seite ist ein eigener Request über den rate_limiter: jede Seite zählt gegen
+    requests_per_minute und ein 429 wiederholt nur diese Seite
+    :param resource: z.B. ev_client.invoice
+    :param search: Filter wie bei get_all
+    :param limit_per_page: Objekte je Seite
+    :param tenant: TenantConfig, deren rate_limiter die Requests zählt
+    :return: Liste aller Objekte
+    """
+    limiter = TenantConfig.resolve(tenant).rate_limiter
+    objects = []
+    page = 1
+    while True:
+        output = limiter.call(resource.get, search=search, limit=limit_per_page, page=page)
+        results, count = output if isinstance(output, tuple) else (output, None)
+        objects.extend(results)
+        if not results or len(results) < limit_per_page or (count is not None and len(objects) >= count):
+            return objects
+        page += 1
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Obergrenzen der Latenz-Histogramme in Sekunden
+RUN_REPORT_FILENAME = 'run_report_%Y%m%d_%H%M%S.json'
+
+
+def _endpoint_name(func) -> str:
+    """
+    Name eines ev_client-Aufrufs für die Statistik, z.B. 'invoice.create'
+    :param func: gebundene Methode eines ev_client-Endpunkts
+    """
+    resource = getattr(func, '__self__', None)
+    endpoint = None
+    if resource is not None:
+        endpoint = getattr(resource, 'endpoint_name', None) or type(resource).__name__
+    return "%(endpoint)s.%(method)s" % {"endpoint": endpoint or 'ev_client',
+                                        "method": getattr(func, '__name__', 'call')}
+
+
+def _payload_bytes(value) -> int:
+    """
+    Größe der übertragenen Nutzdaten, geschätzt über die JSON-Serialisierung der easyVerein-Modelle
+    (ohne HTTP-Header und Paginierungshülle)
+    """
+    if value is None:
+        return 0
+    if isinstance(value, tuple):  # get(...) -> (Liste, Anzahl)
+        return sum(_payload_bytes(v) for v in value if not isinstance(v, int))
+    if isinstance(value, (list, set)):
+        return sum(_payload_bytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_payload_bytes(v) for v in value.values())
+    if hasattr(value, 'model_dump_json'):
+        return len(value.model_dump_json(exclude_unset=True).encode('utf-8'))
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 0
+
+
+class RunReport:
+    """
+    Messwerte eines Laufs: Laufzeit und Speicher-Peak je Stufe, Aufrufe, Seiten, Bytes, Latenzen und Wiederholungen je
+    easyVerein-Endpunkt sowie optional ein cProfile der Rechnungserstellung. Wird am Ende jedes Laufs als JSON
+    geschrieben, damit Läufe vergleichbar sind.
+    """
+
+    def __init__(self, trace_memory=False, profile=False):
+        """
+        :param trace_memory: Speicher-Peak je Stufe über tracemalloc messen; aus, weil tracemalloc jede Allokation
+            mitschreibt und einen Lauf mit vielen kleinen Objekten um ein Vielfaches verlangsamt
+        :param profile: cProfile um die Erstellung der Rechnungen (Payload-Aufbau) legen
+        """
+        self._lock = threading.Lock()
+        self.trace_memory = trace_memory
+        self.started_at = dt.datetime.now()
+        self._started = time.perf_counter()
+        self.stages = {}
+        self.api = {}
+        self.profile = profile
+        self._profilers = []
+        self._local = threading.local()
+        self.profile_path = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Misst eine Stufe des Laufs, mehrfach genutzte Namen werden aufsummiert
+        :param name: z.B. 'ingest'
+        """
+        own_trace = self.trace_memory and not tracemalloc.is_tracing()
+        if own_trace:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            if own_trace:
+                tracemalloc.stop()
+            with self._lock:
+                entry = self.stages.setdefault(name, {"seconds": 0.0, "peak_mb": None, "runs": 0})
+                entry["seconds"] += seconds
+                entry["runs"] += 1
+                if peak is not None:
+                    entry["peak_mb"] = max(entry["peak_mb"] or 0.0, peak / 2 ** 20)
+
+    def record_api_call(self, func, args, kwargs, result, seconds, retries=0, error=None):
+        """
+        Zählt einen Aufruf aus RateLimiter.call
+        :param func: aufgerufene ev_client-Methode
+        :param result: Rückgabe (None bei Fehler), daraus werden die Antwort-Bytes geschätzt
+        :param seconds: Latenz des letzten Versuchs
+        :param retries: Anzahl Wiederholungen nach 429
+        """
+        name = _endpoint_name(func)
+        pages = int(error is None)  # jeder Aufruf ist ein Request, siehe get_all_pages
+        bytes_sent = _payload_bytes(args) + _payload_bytes(kwargs)
+        bytes_received = _payload_bytes(result)
+        bucket = next((str(limit) for limit in LATENCY_BUCKETS if seconds <= limit), 'inf')
+        with self._lock:
+            entry = self.api.setdefault(name, {"calls": 0, "errors": 0, "retries": 0, "pages": 0, "bytes_sent": 0,
+                                               "bytes_received": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                               "latency_histogram": {}})
+            entry["calls"] += 1
+            entry["errors"] += error is not None
+            entry["retries"] += retries
+            entry["pages"] += pages
+            entry["bytes_sent"] += bytes_sent
+            entry["bytes_received"] += bytes_received
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["latency_histogram"][bucket] = entry["latency_histogram"].get(bucket, 0) + 1
+
+    @contextlib.contextmanager
+    def profiled(self):
+        """
+        cProfile um einen Abschnitt, je Thread ein eigener Profiler (die Submitter laufen parallel)
+        """
+        if not self.profile:
+            yield
+            return
+        profiler = getattr(self._local, 'profiler', None)
+        if profiler is None:
+            profiler = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profilers.append(profiler)
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+
+    def profile_stats(self, limit=25) -> list:
+        """
+        Fasst die Profiler aller Threads zusammen
+        :param limit: Anzahl Funktionen mit der höchsten kumulierten Zeit
+        :return: Liste von dicts für den Report
+        """
+        if not self._profilers:
+            return []
+        stats = pstats.Stats(self._profilers[0])
+        for profiler in self._profilers[1:]:
+            stats.add(profiler)
+        if self.profile_path:
+            stats.dump_stats(self.profile_path)
+        rows = []
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({"function": "%(file)s:%(line)s(%(function)s)" % {"file": os.path.basename(filename),
+                                                                          "line": line, "function": function},
+                         "calls": ncalls, "tottime": round(tottime, 6), "cumtime": round(cumtime, 6)})
+        return sorted(rows, key=lambda row: row["cumtime"], reverse=True)[:limit]
+
+    def to_dict(self, **extra) -> dict:
+        """
+        :param extra: weitere Angaben zum Lauf (Parameter, Ergebnisse, Rate Limiter)
+        """
+        with self._lock:
+            report = {"started_at": self.started_at.isoformat(timespec='seconds'),
+                      "total_seconds": time.perf_counter() - self._started,
+                      "stages": json.loads(json.dumps(self.stages)),
+                      "api": json.loads(json.dumps(self.api))}
+        report["api_totals"] = {key: sum(entry[key] for entry in report["api"].values())
+                                for key in ("calls", "errors", "retries", "pages", "bytes_sent", "bytes_received")}
+        report.update(extra)
+        if self.profile:
+            report["profile"] = {"path": self.profile_path, "top": self.profile_stats()}
+        return report
+
+    def write(self, path, **extra) -> dict:
+        """
+        Schreibt den Report als JSON (atomar über eine temporäre Datei)
+        :param path: Zieldatei
+        :return: geschriebener Report
+        """
+        report = self.to_dict(**extra)
+        _atomic_write_json(report, path)
+        print("WROTE RUN REPORT TO %(path)s" % {"path": path})
+        return report
+
+
+def _atomic_write_json(data, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+def profile_hotpath(tenant=None):
+    """
+    cProfile des laufenden Reports um einen Abschnitt, ohne Report bzw. ohne profile=True ein No-op
+    """
+    report = TenantConfig.resolve(tenant).rate_limiter.report
+    return report.profiled() if report is not None else contextlib.nullcontext()
+
+
+def print_stage_timings(report):
+    for name, entry in report.stages.items():
+        print("STAGE %(name)s: %(seconds).2f s%(peak)s" % {
+            "name": name, "seconds": entry["seconds"],
+            "peak": "" if entry["peak_mb"] is None else ", peak %.1f MB" % entry["peak_mb"]})
+
 # TODO bis 14.09 müssten die Gastspieler Daten in CB jetzt soweit passen
 # TODO: Wenn Gast (bzw. nicht Mitglied) immer Rechnung
 # TODO Erstellung Gastspieler mit IBAN Feldern (sepaMandate = Mandatsreferenz "EV...")?
@@ -28,20 +532,25 @@ ev_client = EasyvereinAPI(
 dryrun = True
 
 
-def create_guestplayer(contact,
-                       contactDetailsGroup_Guest=['https://easyverein.com/api/v1.7/contact-details-group/187854580'],
-                       dryrun=False):
+def create_guestplayer(contact, contactDetailsGroup_Guest=None, dryrun=False, tenant=None):
     """
     Nimmt Informationen aus Courtbooking und baut ein contact-obj daraus. Bei bestimmten Feldern wird im Falle des nicht
     Vorhandenseins (np.nan) der Wert auf "" gesetzt, da immer noch eine Rechnungserstellung mittels E-Mail möglich ist
 
     :param contact: contact_obj
-    :param contactDetailsGroup_Guest: Definition für Gastgruppe in eV
+    :param contactDetailsGroup_Guest: Definition für Gastgruppe in eV, default die Gastgruppe des Vereins
     :param dryrun: true or false
+    :param tenant: TenantConfig
     :return:
     """
-    keys_to_check = ["Ort", "Straße", "Handynummer", "Telefonnummer", "IBAN", "BIC", "Mandatsreferenz", "plz"]
-    contact = {k: ("" if v is np.nan and k in keys_to_check else v) for k, v in contact.items()}
+    tenant = TenantConfig.resolve(tenant)
+    if contactDetailsGroup_Guest is None:
+        contactDetailsGroup_Guest = [tenant.contact_group_url % {"id": tenant.group_gast}]
+    keys_to_check = ["Ort", "Straße", "Handynummer", "Telefonnummer", "IBAN", "BIC", "Mandatsreferenz", "plz",
+                     "Zahlungsart"]
+    contact = {k: ("" if k in keys_to_check and (v is None or v == 'nan' or (isinstance(v, float) and np.isnan(v)))
+                   else v) for k, v in contact.items()}
+    contact.update({k: "" for k in keys_to_check if k not in contact})  # Spalte fehlt in der Mitgliederliste
 
     guest_player = ContactDetails(firstName=contact["Vorname"], familyName=contact["Nachname"], isCompany=False,
                                   primaryEmail=contact['E-Mail'],
@@ -61,80 +570,118 @@ def create_guestplayer(contact,
                                   )
     guest_player.contactDetailsGroups = contactDetailsGroup_Guest
     if not dryrun:
-        output = ev_client.contact_details.create(
-            guest_player)
+        output = tenant.rate_limiter.call(tenant.ev_client.contact_details.create, guest_player)
         contact["contact_obj"] = output
     else:
         output = "Dryrun"
     return contact
 
 
-def create_invoice(contact, completion_date, dryrun=False, account='Hauptkonto'):
-    current_year = dt.datetime.now().year
-    current_invoice_nr = get_current_invoice_nr(current_year=current_year)
+def build_invoice(contact, completion_date, account='Hauptkonto', invNumber=None, tenant=None):
+    """
+    Baut Rechnung und Rechnungsposten eines Spielers, ohne etwas an easyVerein zu senden
+    :param invNumber: bereits für den Spieler vergebene Nummer, sonst None (create_invoice vergibt die Nummer erst
+        direkt vor dem Senden)
+    :return: (InvoiceCreate, Liste InvoiceItem)
+    """
+    builder = InvoiceBatchBuilder(completion_date=completion_date, account=account, tenant=tenant)
+    builder.validate(contact)
+    return builder.build(contact, invNumber=invNumber)
+
 
-    invoice = InvoiceCreate(
-        invNumber=create_invoice_id(current_year=current_year, current_invoice_nr=current_invoice_nr),
-        # invNumber zB 2024-631
-        totalPrice=calculate_preis(preisliste=contact["_Preis"], art='Getränk'),
-        relatedAddress=contact["contact_obj"],
-        paymentInformation=paymentInformation(contact["contact_obj"].methodOfPayment))
-    invoice.kind = "revenue"  # Einnahme des Vereins
-    invoice.receiver = create_receiver_string(
-        contact_obj=contact["contact_obj"])
-    if account == 'Hauptkonto':
-        invoice.selectionAcc = 187408412
-    invoice.relatedAddress = 'https://easyverein.com/api/v1.7/contact-details/' + str(contact["contact_obj"].id)
+def create_invoice(contact, completion_date, dryrun=False, account='Hauptkonto', allocator=None, on_built=None,
+                   invNumber=None, payload=None, tenant=None):
+    """
+    :param invNumber: siehe build_invoice
+    :param on_built: wird mit der fertigen Rechnung aufgerufen, bevor sie gesendet wird (z.B. RunJournal)
+    :param payload: bereits von InvoiceBatchBuilder.build_batch gebaute (Rechnung, Posten)
+    :param tenant: TenantConfig des Vereins, an den gesendet wird
+    """
+    if allocator is None:
+        allocator = InvoiceNumberAllocator(current_year=dt.datetime.now().year,
+                                           fetch_current_invoice_nr=lambda current_year: get_current_invoice_nr(
+                                               current_year=current_year, tenant=tenant))
 
-    items = create_invoice_items(contact=contact, art='Getränk', completion_date=completion_date)
+    if payload is not None:
+        invoice, items = payload
+    else:
+        with profile_hotpath(tenant=tenant):
+            invoice, items = build_invoice(contact, completion_date=completion_date, account=account,
+                                           invNumber=invNumber, tenant=tenant)
 
     if not dryrun:
-        output = ev_client.invoice.create_with_items(invoice, items=items)
+        if not invoice.invNumber:
+            invoice.invNumber = allocator.next()  # erst jetzt, damit ein ungültiger Spieler keine Nummer verbraucht
+        try:
+            output = _send_numbered_invoice(invoice, items, allocator=allocator, on_built=on_built, tenant=tenant)
+        except EasyvereinAPIException as e:
+            if isinstance(e, InvoiceItemsError) or not is_duplicate_invoice_nr(e):
+                raise
+            # Nummer wurde zwischenzeitlich außerhalb dieses Laufs vergeben => neu synchronisieren und einmal
+            # wiederholen
+            allocator.resync()
+            invoice.invNumber = allocator.next()
+            output = _send_numbered_invoice(invoice, items, allocator=allocator, on_built=on_built, tenant=tenant)
     else:
         output = "Dryrun"
     return output
 
 
-def create_invoice_items(contact, art, completion_date):
-    items = []
-    if art == 'Gast':
-        data = {
-            'Vorname': contact["Vorname"],
-            'Nachname': contact["Nachname"],
-            '_Preis': contact["_Preis"],
-            'Buchungszeit': contact["Buchungszeit"],
-            'Dauer': contact["Dauer"]
-        }
-        for i in range(len(data['_Preis'])):
-            buchungstext = "Gastspielerposten am %(date)s, Dauer: %(duration)s" % {"date": data['Buchungszeit'][i],
-                                                                                   "duration": data['Dauer'][i]}
-            invoice_item = InvoiceItem(title=buchungstext, quantity=1, unitPrice=data['_Preis'][i],
-                                       description='Informationen Gästenutzung: https://www.tc-grafrath.de/der-verein/gaeste.html',
-                                       taxRate=0.00, taxName=' ')
-            invoice_item.billingAccount = 'https://easyverein.com/api/v2.0/billing-account/44093'
-            items.append(invoice_item)
-
-    elif art == 'Getränk':
-        data = {
-            'Vorname': contact["Vorname"],
-            'Nachname': contact["Nachname"],
-            '_Preis': contact["_Preis"],
-            'Kaufdatum': contact["_Kaufdatum"],
-            'Anzahl': contact["Anzahl"],
-            'Getränk': [list(set(i)) for i in contact['Getränk']] # damit im Posten das Getränk nur einmal steht
-        }
-        for i in range(len(data['_Preis'])):
-            buchungstext = "Getränkebuchung am %(date)s, Anzahl Getränke: %(Anzahl)s aus Listenposten: %(Posten)s" % {
-                "date": data['Kaufdatum'][i].strftime(format='%d.%m.%Y'),
-                "Anzahl": sum(data['Anzahl'][i]),
-                "Posten": ', '.join(data['Getränk'][i])}
-            invoice_item = InvoiceItem(title=buchungstext, quantity=1, unitPrice=sum(data['_Preis'][i]),
-                                       description=get_description(kaufdatum=contact["_Kaufdatum"][i],
-                                                                   completion_date=completion_date),
-                                       taxRate=0.00, taxName=' ')
-            invoice_item.billingAccount = 'https://easyverein.com/api/v2.0/billing-account/44134'
-            items.append(invoice_item)
-    return items
+def _send_numbered_invoice(invoice, items, allocator, on_built=None, tenant=None):
+    """
+    send_invoice mit Rückgabe der Nummer an den allocator, wenn easyVerein die Rechnung ablehnt (außer als doppelt):
+    es wurde nichts angelegt, die Nummer bekommt die nächste Rechnung, damit keine Lücke entsteht
+    """
+    if on_built is not None:
+        on_built(invoice)
+    try:
+        return send_invoice(invoice, items, tenant=tenant)
+    except EasyvereinAPIException as e:
+        if not isinstance(e, InvoiceItemsError) and not is_duplicate_invoice_nr(e):
+            allocator.release(invoice.invNumber)
+            invoice.invNumber = None
+            if on_built is not None:
+                on_built(invoice)  # Journal darf nicht mehr auf die freigegebene Nummer zeigen
+        raise
+
+
+class InvoiceItemsError(EasyvereinAPIException):
+    """
+    Die Rechnung wurde angelegt, aber nicht alle Posten: sie bleibt als Entwurf in easyVerein stehen und darf nicht
+    unter neuer Nummer ein zweites Mal angelegt werden
+    """
+
+
+def send_invoice(invoice, items, tenant=None):
+    """
+    Legt Rechnung und Posten an wie ev_client.invoice.create_with_items, aber jeder Request einzeln über den
+    rate_limiter. Ein 429 wiederholt so nur den abgelehnten Request und nie den POST der schon angelegten Rechnung.
+    Die Rechnung ist Entwurf, bis alle Posten angelegt sind.
+    :param invoice: InvoiceCreate
+    :param items: Liste InvoiceItem
+    :param tenant: TenantConfig
+    :return: angelegte Invoice
+    :raises EasyvereinAPIException: die Rechnung selbst wurde abgelehnt (z.B. doppelte invNumber), es existiert nichts
+    :raises InvoiceItemsError: ein Posten wurde abgelehnt, die Rechnung existiert als Entwurf
+    """
+    tenant = TenantConfig.resolve(tenant)
+    limiter, client = tenant.rate_limiter, tenant.ev_client
+    output = limiter.call(client.invoice.create, invoice.model_copy(update={"isDraft": True}))
+    try:
+        for item in items:
+            item.relatedInvoice = output.id
+            limiter.call(client.invoice_item.create, item)
+        if not invoice.isDraft:
+            output = limiter.call(client.invoice.update, output.id, InvoiceUpdate(isDraft=False))
+    except EasyvereinAPIException as e:
+        raise InvoiceItemsError("invoice %(invNumber)s (id %(id)s) was created as draft, but not completed: "
+                                "%(error)s" % {"invNumber": invoice.invNumber, "id": output.id, "error": str(e)}
+                                ) from e
+    return output
+
+
+def create_invoice_items(contact, art, completion_date, tenant=None):
+    return InvoiceBatchBuilder(completion_date=completion_date, tenant=tenant).items(contact, art)
 
 
 def get_description(kaufdatum, completion_date):
@@ -148,15 +695,29 @@ def calculate_preis(preisliste, art):
     if art == 'Gast':
         return sum(preisliste)
     elif art == "Getränk":
+        if isinstance(preisliste, PlayerPurchases):
+            return preisliste.total  # per np.add.reduceat vorberechnet
         return sum([sum(i) for i in preisliste])
 
 
-def get_current_invoice_nr(current_year):
+def get_invoices_of_year(current_year, tenant=None) -> list:
+    tenant = TenantConfig.resolve(tenant)
     first_day_of_year = dt.datetime(current_year, 1, 1).date().strftime("%Y-%m-%d")
     search = InvoiceFilter(
         date__gt=first_day_of_year
     )
-    all_invoices = ev_client.invoice.get_all(search=search, limit_per_page=1000)
+    return get_all_pages(tenant.ev_client.invoice, search=search, tenant=tenant)
+
+
+def get_current_invoice_nr(current_year, tenant=None):
+    return max_invoice_nr(get_invoices_of_year(current_year=current_year, tenant=tenant))
+
+
+def max_invoice_nr(all_invoices) -> int:
+    """
+    :param all_invoices: Rechnungen aus get_invoices_of_year
+    :return: höchste laufende Nummer der invNumbers, 0 wenn es noch keine gibt
+    """
     pattern = r'^\d{4}-(\d{3,5})'
     current_invoice_nr = 0
     for inv in all_invoices:
@@ -179,6 +740,140 @@ def create_invoice_id(current_year, current_invoice_nr) -> str:
     return invoice_id
 
 
+INVOICE_NR_FIELD_PATTERN = re.compile(r'inv_?number|inv number|rechnungsnummer', re.IGNORECASE)
+DUPLICATE_PATTERN = re.compile(r'already exists?|must be unique|bereits (vergeben|vorhanden|existiert)|'
+                               r'existiert bereits', re.IGNORECASE)
+
+
+def is_duplicate_invoice_nr(exc) -> bool:
+    """
+    Erkennt, ob easyVerein die Rechnung wegen einer bereits vergebenen Rechnungsnummer abgelehnt hat. Die Meldung muss
+    das Feld der Rechnungsnummer und einen Hinweis auf Eindeutigkeit enthalten; andere Fehler zur invNumber (Format,
+    Pflichtfeld) oder zu anderen Objekten zählen nicht.
+    :param exc: EasyvereinAPIException
+    :return: True bei doppelter invNumber
+    """
+    if getattr(exc, 'status_code', None) == 429:
+        return False
+    message = str(exc)
+    return bool(INVOICE_NR_FIELD_PATTERN.search(message) and DUPLICATE_PATTERN.search(message))
+
+
+class InvoiceNumberAllocator:
+    """
+    Vergibt die Rechnungsnummern eines Laufs lokal. Die höchste Nummer des Jahres wird nur einmal über
+    get_current_invoice_nr geholt, danach wird hochgezählt. Neu synchronisiert wird nur, wenn die API eine Nummer als
+    doppelt ablehnt. Nummern abgelehnter Rechnungen kommen per release zurück und werden zuerst wieder vergeben, damit
+    die Nummernfolge lückenlos bleibt. Thread-safe, Blöcke von Nummern können für parallele Submitter reserviert
+    werden.
+    """
+
+    def __init__(self, current_year, fetch_current_invoice_nr=None):
+        """
+        :param current_year: Jahr der Rechnungsnummern (Präfix der invNumber)
+        :param fetch_current_invoice_nr: Funktion, die die höchste vergebene Nummer liefert, default
+        get_current_invoice_nr
+        """
+        self.current_year = current_year
+        self._fetch_current_invoice_nr = fetch_current_invoice_nr or get_current_invoice_nr
+        self._lock = threading.Lock()
+        self._current_invoice_nr = None
+        self._released = []  # Heap freigegebener Nummern
+        self._floor = 0
+        self.syncs = 0
+        self.synced_invoice_nr = None  # höchste Nummer laut easyVerein beim letzten Abruf, ohne lokale Reservierungen
+
+    def _sync(self):
+        fetched = self._fetch_current_invoice_nr(current_year=self.current_year)
+        self.synced_invoice_nr = fetched
+        # lokal bereits reservierte Nummern nie wieder freigeben
+        self._current_invoice_nr = max(fetched, self._current_invoice_nr or 0, self._floor)
+        # freigegebene Nummern, die inzwischen in easyVerein vergeben sind, nicht mehr anbieten
+        self._released = [number for number in self._released if number > fetched]
+        heapq.heapify(self._released)
+        self.syncs += 1
+
+    def seed(self, current_invoice_nr):
+        """
+        Startet ohne Abruf bei easyVerein ab einer bekannten Nummer, z.B. der höchsten aus dem RunJournal eines
+        abgebrochenen Laufs. Ist die Nummer inzwischen vergeben, greift der Resync über is_duplicate_invoice_nr.
+        :param current_invoice_nr: höchste bekannte vergebene Nummer
+        """
+        with self._lock:
+            self._current_invoice_nr = max(current_invoice_nr, self._current_invoice_nr or 0)
+
+    def floor(self, invoice_nr):
+        """
+        Vergibt keine Nummer bis einschließlich invoice_nr, fragt easyVerein aber trotzdem ab. Für Nummern aus dem
+        RunJournal, die easyVerein evtl. nie erreicht haben und beim Wiederaufsetzen für ihren Spieler reserviert
+        bleiben; anders als seed kann ein veraltetes Journal so nicht hinter den Stand von easyVerein zurückfallen.
+        :param invoice_nr: höchste reservierte Nummer
+        """
+        with self._lock:
+            self._floor = max(self._floor, invoice_nr)
+            if self._current_invoice_nr is not None:
+                self._current_invoice_nr = max(self._current_invoice_nr, invoice_nr)
+
+    def resync(self):
+        """
+        Holt die höchste Nummer erneut von easyVerein, z.B. nachdem eine Nummer als doppelt abgelehnt wurde
+        """
+        with self._lock:
+            self._sync()
+
+    @property
+    def known_invoice_nr(self):
+        """
+        Zuletzt vergebene Nummer ohne Abruf bei easyVerein, None solange noch nicht synchronisiert wurde
+        """
+        with self._lock:
+            return self._current_invoice_nr
+
+    @property
+    def current_invoice_nr(self):
+        with self._lock:
+            if self._current_invoice_nr is None:
+                self._sync()
+            return self._current_invoice_nr
+
+    def next(self) -> str:
+        """
+        :return: kleinste freigegebene bzw. nächste freie invNumber, z.B. 2024-632
+        """
+        with self._lock:
+            if self._released:
+                return create_invoice_id(current_year=self.current_year,
+                                         current_invoice_nr=heapq.heappop(self._released) - 1)
+        return self.reserve(1)[0]
+
+    def release(self, invNumber):
+        """
+        Gibt eine vergebene, aber nicht angelegte Nummer zurück (easyVerein hat die Rechnung abgelehnt)
+        :param invNumber: z.B. 2024-632; Nummern anderer Jahre werden ignoriert
+        """
+        match = re.match(r'^%(year)s-(\d+)$' % {"year": self.current_year}, invNumber or '')
+        if match is None:
+            return
+        with self._lock:
+            number = int(match.group(1))
+            if self._current_invoice_nr is not None and number <= self._current_invoice_nr \
+                    and number not in self._released:
+                heapq.heappush(self._released, number)
+
+    def reserve(self, count) -> list:
+        """
+        Reserviert einen zusammenhängenden Block von Rechnungsnummern
+        :param count: Anzahl Nummern
+        :return: Liste von invNumbers
+        """
+        with self._lock:
+            if self._current_invoice_nr is None:
+                self._sync()
+            start = self._current_invoice_nr
+            self._current_invoice_nr += count
+        return [create_invoice_id(current_year=self.current_year, current_invoice_nr=start + i) for i in range(count)]
+
+
 def create_receiver_string(contact_obj) -> str:
     """
     Anschrift der Rechnung auf Rechnungs-pdf
@@ -244,235 +939,2711 @@ def paymentInformation(methodOfPayment) -> str:
         return "other"
 
 
-def clean_buchungen(df) -> pd.DataFrame:
+INVOICE_BATCH_SIZE = 500  # Spieler, deren Rechnungen in der Vorschau gemeinsam gebaut werden
+
+
+class InvoiceBatchBuilder:
+    """
+    Baut Rechnungen und Rechnungsposten vieler Spieler in einem Durchlauf. Je Art wird ein InvoiceItem einmal validiert
+    und danach per model_copy mit Titel, Preis und Beschreibung befüllt; da model_copy selbst nicht validiert, werden
+    diese Felder vorher einzeln validiert (siehe _fill). Buchungstexte und Beschreibungen entstehen je PurchaseTable in
+    einem Schritt, Anschriften nur einmal je Kontakt. Rechnungsnummern vergibt der Builder nicht, sie kommen erst beim
+    Senden dazu (create_invoice).
+    """
+
+    def __init__(self, completion_date, account='Hauptkonto', tenant=None):
+        """
+        :param tenant: TenantConfig, liefert Buchungskonten, Beschreibung der Gastposten und die URLs
+        """
+        self.completion_date = completion_date
+        self.account = account
+        self.tenant = tenant = TenantConfig.resolve(tenant)
+        self._templates = {
+            'Gast': self._template(
+                description=tenant.guest_item_description,
+                billingAccount=tenant.billing_account_url % {"id": tenant.billing_account_gast}),
+            'Getränk': self._template(
+                description=get_description(kaufdatum=None, completion_date=completion_date),
+                billingAccount=tenant.billing_account_url % {"id": tenant.billing_account_getraenk})}
+        self._texts = (None, None, None)
+        self._receivers = {}
+
+    @staticmethod
+    def _template(description, billingAccount):
+        template = InvoiceItem(title='', quantity=1, unitPrice=0.0, description=description, taxRate=0.00, taxName=' ')
+        template.billingAccount = billingAccount
+        return template
+
+    @staticmethod
+    def _fill(template, **fields):
+        """
+        model_copy der Vorlage mit validierten Feldern
+        :raises ValueError: pydantic.ValidationError, z.B. ein Preis, der keine Zahl ist
+        """
+        return template.model_copy(update=InvoiceItem.model_validate(fields).model_dump(exclude_unset=True))
+
+    def texts(self, table):
+        """
+        Buchungstexte und Beschreibungen aller Tage einer PurchaseTable; Datum und Beschreibung werden nur je
+        unterschiedlichem Kaufdatum erzeugt. Gemerkt wird nur die letzte Tabelle (Streaming: eine je Batch).
+        :param table: PurchaseTable
+        :return: (titles, descriptions) als object-Arrays parallel zu table.days
+        """
+        if self._texts[0] is not table:
+            days, inverse = np.unique(table.days, return_inverse=True)
+            days = days.astype(object)
+            dates = np.array([kaufdatum.strftime(format='%d.%m.%Y') for kaufdatum in days], dtype=object)
+            descriptions = np.array([get_description(kaufdatum=kaufdatum, completion_date=self.completion_date)
+                                     for kaufdatum in days], dtype=object)
+            titles = ("Getränkebuchung am " + dates[inverse] + ", Anzahl Getränke: "
+                      + table.day_anzahl.astype(str).astype(object) + " aus Listenposten: " + table.day_drinks)
+            self._texts = (table, titles, descriptions[inverse])
+        return self._texts[1], self._texts[2]
+
+    def receiver(self, contact_obj):
+        receiver = self._receivers.get(contact_obj.id)
+        if receiver is None:
+            receiver = self._receivers[contact_obj.id] = create_receiver_string(contact_obj=contact_obj)
+        return receiver
+
+    def validate(self, contact):
+        """
+        Prüft, was beim Befüllen der Vorlagen nicht mehr validiert wird
+        :param contact: contact-dict
+        :raises KeyError: fehlende Information
+        :raises ValueError: kein easyVerein-Kontakt, keine Buchungen oder ein Preis ist keine endliche Zahl
+        """
+        contact_obj = contact["contact_obj"]
+        if getattr(contact_obj, "id", None) is None:
+            raise ValueError("%(first_name)s %(last_name)s has no easyVerein contact" % {
+                "first_name": contact["Vorname"], "last_name": contact["Nachname"]})
+        prices = contact["_purchases"].prices
+        if not len(prices):
+            raise ValueError("%(first_name)s %(last_name)s has no open bookings" % {
+                "first_name": contact["Vorname"], "last_name": contact["Nachname"]})
+        if not np.isfinite(prices).all():
+            raise ValueError("%(first_name)s %(last_name)s has bookings without a valid price" % {
+                "first_name": contact["Vorname"], "last_name": contact["Nachname"]})
+
+    def items(self, contact, art):
+        items = []
+        if art == 'Gast':
+            template = self._templates['Gast']
+            for preis, buchungszeit, dauer in zip(contact["_Preis"], contact["Buchungszeit"], contact["Dauer"]):
+                buchungstext = "Gastspielerposten am %(date)s, Dauer: %(duration)s" % {"date": buchungszeit,
+                                                                                       "duration": dauer}
+                items.append(self._fill(template, title=buchungstext, unitPrice=preis))
+
+        elif art == 'Getränk':
+            template = self._templates['Getränk']
+            # Summen, Getränke und Texte je Tag sind für die ganze PurchaseTable vorberechnet
+            purchases = contact["_purchases"]
+            titles, descriptions = self.texts(purchases.table)
+            start, end = purchases.table.day_range(purchases.player)
+            for buchungstext, preis, description in zip(titles[start:end], purchases.prices.tolist(),
+                                                        descriptions[start:end]):
+                items.append(self._fill(template, title=buchungstext, unitPrice=preis, description=description))
+        return items
+
+    def build(self, contact, invNumber):
+        """
+        :param invNumber: Rechnungsnummer, z.B. 2024-631
+        :return: (InvoiceCreate, Liste InvoiceItem) wie build_invoice
+        """
+        contact_obj = contact["contact_obj"]
+        invoice = InvoiceCreate(
+            invNumber=invNumber,
+            totalPrice=calculate_preis(preisliste=contact["_purchases"], art='Getränk'),
+            relatedAddress=contact_obj,
+            paymentInformation=paymentInformation(contact_obj.methodOfPayment))
+        invoice.kind = "revenue"  # Einnahme des Vereins
+        invoice.receiver = self.receiver(contact_obj)
+        if self.account == 'Hauptkonto':
+            invoice.selectionAcc = self.tenant.selection_acc
+        invoice.relatedAddress = self.tenant.contact_details_url % {"id": contact_obj.id}
+        return invoice, self.items(contact, art='Getränk')
+
+    def build_batch(self, contacts, invNumbers=None) -> list:
+        """
+        Prüft und baut die Rechnungen aller Spieler. Neue Rechnungen bleiben ohne Nummer, create_invoice vergibt sie
+        erst direkt vor dem Senden, damit eine abgebrochene oder fehlgeschlagene Rechnung keine Nummer verbraucht.
+        :param contacts: Liste von contact-dicts
+        :param invNumbers: je Spieler bereits vergebene Nummer oder None (siehe build_invoice)
+        :return: Liste je Spieler: (InvoiceCreate, Liste InvoiceItem) oder die KeyError/ValueError der Prüfung
+        """
+        if invNumbers is None:
+            invNumbers = [None] * len(contacts)
+        payloads = []
+        for contact, invNumber in zip(contacts, invNumbers):
+            try:
+                self.validate(contact)
+                payloads.append(self.build(contact, invNumber=invNumber))
+            except (KeyError, ValueError) as e:
+                payloads.append(e)
+        return payloads
+
+
+def clean_buchungen(df, return_malformed=False):
     """
     data-cleaning of csv from Courtbooking
+    Spaltenweise über die .str-Accessoren. Zeilen, deren Spieler-Feld sich nicht in Zahler (Vorname Nachname) und
+    Nichtzahler zerlegen lässt, werden nicht abgebrochen, sondern aussortiert.
     :param df: DataFrame of buchungs-csv from Courtbooking
-    :return: cleaned DataFrame
-    """
-    doc_list = []
-    for doc in df.to_dict(orient='records'):
-        doc["Buchungszeit"] = doc["_Datum"].date().strftime(format='%d.%m.%Y') + " " + doc["_Von"].isoformat()
-        doc["Spieler_cleaned"] = doc["Spieler"].replace("  ", " ").replace("; ", ";").replace(" ;", ";")
-        doc["Zahler"] = doc["Spieler_cleaned"].split(";")[0]
-        match = re.match(r"^(\S+)\s+(.+)$", doc["Zahler"])
-        doc["Vorname"] = match.groups()[0].replace(' ', '')
-        doc["Vorname"] = match.groups()[0].replace('- ', '-')
-        doc["Nachname"] = match.groups()[1].replace(' ', '')
-        doc["Nachname"] = match.groups()[1].replace('- ', '-')
-        doc["Nichtzahler"] = doc["Spieler_cleaned"].split(";")[1]
-        doc_list.append(doc)
-    df_cleaned_buchungen = pd.DataFrame(doc_list)
+    :param return_malformed: zusätzlich die aussortierten Zeilen zurückgeben
+    :return: cleaned DataFrame, bei return_malformed (cleaned DataFrame, DataFrame mit fehlerhaften Zeilen)
+    """
+    df_cleaned_buchungen = df.copy()
+    df_cleaned_buchungen["Buchungszeit"] = (df_cleaned_buchungen["_Datum"].dt.strftime('%d.%m.%Y') + " "
+                                            + df_cleaned_buchungen["_Von"].astype(str))
+    spieler = (df_cleaned_buchungen["Spieler"].astype(str)
+               .str.replace("  ", " ", regex=False)
+               .str.replace("; ", ";", regex=False)
+               .str.replace(" ;", ";", regex=False))
+    df_cleaned_buchungen["Spieler_cleaned"] = spieler
+    # reindex: auch ohne ';' (bzw. bei leerem Export) gibt es beide Spalten, als Text statt float
+    spieler_split = spieler.str.split(";", n=2, expand=True).reindex(columns=[0, 1]).astype(object)
+    df_cleaned_buchungen["Zahler"] = spieler_split[0]
+    names = spieler_split[0].str.extract(r"^(\S+)\s+(.+)$")
+    df_cleaned_buchungen["Vorname"] = names[0].str.replace('- ', '-', regex=False)
+    df_cleaned_buchungen["Nachname"] = names[1].str.replace('- ', '-', regex=False)
+    df_cleaned_buchungen["Nichtzahler"] = spieler_split[1]
+
+    malformed = df["Spieler"].isna() | names[0].isna() | spieler_split[1].isna()
+    if malformed.any():
+        print("ACHTUNG %(count)s BUCHUNGEN MIT UNGUELTIGEM SPIELER-FELD AUSSORTIERT" % {"count": int(malformed.sum())})
+    df_malformed = df.loc[malformed]
+    df_cleaned_buchungen = df_cleaned_buchungen.loc[~malformed]
+    if return_malformed:
+        return df_cleaned_buchungen, df_malformed
     return df_cleaned_buchungen
 
 
-def get_members_in_ev() -> pd.DataFrame:
+CONTACT_MODIFIED_FILTER = 'modifiedAt__gte'
+CONTACT_SNAPSHOT_FILENAME = 'easyverein_contacts.sqlite'
+INVOICE_NR_META = 'last_invoice_nr_%(year)s'
+INVOICE_PREVIEW_FILENAME = 'invoice_preview_%Y%m%d_%H%M%S.csv'
+
+
+class ContactSnapshot:
     """
-    Request and transformation of all contacts from easyVerein to pandas DataFrame
+    Lokaler Stand der easyVerein-Kontakte in SQLite (ein JSON-Dokument je Kontakt). Innerhalb der ttl wird nur lokal
+    gelesen, danach werden nur seit dem letzten Sync geänderte Kontakte geholt. Gelöschte Kontakte erkennt nur ein
+    Komplettabruf, der spätestens nach full_refresh_after erfolgt.
+    """
+
+    def __init__(self, path, ttl=dt.timedelta(hours=12), full_refresh_after=dt.timedelta(days=7)):
+        """
+        :param path: SQLite-Datei
+        :param ttl: so lange gilt der Stand ohne Abfrage bei easyVerein als aktuell
+        :param full_refresh_after: Abstand, nach dem statt inkrementell wieder alle Kontakte geholt werden
+        """
+        self.path = path
+        self.ttl = ttl
+        self.full_refresh_after = full_refresh_after
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS contacts (id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+            self._conn.commit()
+
+    def last_invoice_nr(self, current_year):
+        """
+        :return: zuletzt gespeicherte höchste Rechnungsnummer des Jahres (für den Offline-Dryrun) oder None
+        """
+        value = self.get_meta(INVOICE_NR_META % {"year": current_year})
+        return int(value) if value is not None else None
+
+    def set_last_invoice_nr(self, current_year, current_invoice_nr):
+        self.set_meta(INVOICE_NR_META % {"year": current_year}, str(current_invoice_nr))
+
+    def _get_time(self, key):
+        value = self.get_meta(key)
+        return dt.datetime.fromisoformat(value) if value else None
+
+    @property
+    def last_sync(self):
+        return self._get_time('last_sync')
+
+    @property
+    def last_full_sync(self):
+        return self._get_time('last_full_sync')
+
+    def is_fresh(self, now=None) -> bool:
+        last_sync = self.last_sync
+        now = now or dt.datetime.now(dt.timezone.utc)
+        return last_sync is not None and now - last_sync < self.ttl
+
+    def needs_full_refresh(self, now=None) -> bool:
+        last_full_sync = self.last_full_sync
+        now = now or dt.datetime.now(dt.timezone.utc)
+        return last_full_sync is None or now - last_full_sync >= self.full_refresh_after
+
+    def load(self) -> list:
+        """
+        :return: alle Kontakte des Snapshots als ContactDetails
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM contacts ORDER BY id').fetchall()
+        return [ContactDetails.model_validate_json(row[0]) for row in rows]
+
+    def upsert(self, contacts):
+        """
+        Speichert neue bzw. geänderte Kontakte, z.B. nach inkrementellem Sync oder nach Anlage eines Gastspielers
+        :param contacts: Liste von ContactDetails
+        """
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO contacts (id, data) VALUES (?, ?)',
+                                   [(mem.id, mem.model_dump_json()) for mem in contacts])
+            self._conn.commit()
+
+    def replace_all(self, contacts):
+        with self._lock:
+            self._conn.execute('DELETE FROM contacts')
+            self._conn.executemany('INSERT INTO contacts (id, data) VALUES (?, ?)',
+                                   [(mem.id, mem.model_dump_json()) for mem in contacts])
+            self._conn.commit()
+
+
+def _modified_since_filter(since, tenant):
+    """
+    Filter für alle seit since geänderten Kontakte. Kennt die installierte easyverein-Version das Feld nicht (wird
+    von pydantic ignoriert oder abgelehnt), gibt es None zurück und es wird komplett abgerufen.
+    """
+    try:
+        search = ContactDetailsFilter(contactDetailsGroups__not=tenant.contact_filter_not_group,
+                                      **{CONTACT_MODIFIED_FILTER: since.isoformat()})
+    except (TypeError, ValueError):
+        return None
+    if CONTACT_MODIFIED_FILTER not in search.model_dump(exclude_none=True):
+        return None
+    return search
+
+
+def sync_contacts(snapshot, force_full_refresh=False, tenant=None) -> list:
+    """
+    Bringt den Snapshot auf den aktuellen Stand: innerhalb der ttl ohne API-Aufruf, sonst inkrementell über das
+    Änderungsdatum bzw. komplett, wenn force_full_refresh gesetzt ist oder der letzte Komplettabruf zu alt ist.
+    :param snapshot: ContactSnapshot
+    :param force_full_refresh: alle Kontakte neu abrufen
+    :param tenant: TenantConfig
+    :return: Liste aller Kontakte (ContactDetails)
+    """
+    tenant = TenantConfig.resolve(tenant)
+    now = dt.datetime.now(dt.timezone.utc)
+    if not force_full_refresh and snapshot.is_fresh(now=now):
+        return snapshot.load()
+    search = None
+    if not force_full_refresh and not snapshot.needs_full_refresh(now=now):
+        search = _modified_since_filter(snapshot.last_sync, tenant=tenant)
+    if search is not None:
+        changed_contacts = get_all_pages(tenant.ev_client.contact_details, search=search, tenant=tenant)
+        snapshot.upsert(changed_contacts)
+        print("SYNCED %(count)s CHANGED CONTACTS FROM EASYVEREIN" % {"count": len(changed_contacts)})
+    else:
+        search = ContactDetailsFilter(contactDetailsGroups__not=tenant.contact_filter_not_group)
+        all_contacts = get_all_pages(tenant.ev_client.contact_details, search=search, tenant=tenant)
+        snapshot.replace_all(all_contacts)
+        snapshot.set_meta('last_full_sync', now.isoformat())
+        print("DOWNLOADED ALL %(count)s CONTACTS FROM EASYVEREIN" % {"count": len(all_contacts)})
+    snapshot.set_meta('last_sync', now.isoformat())
+    return snapshot.load()
+
+
+def contacts_to_frame(all_contacts, tenant=None) -> pd.DataFrame:
+    """
+    Transformation der easyVerein-Kontakte in ein DataFrame, spaltenweise statt Zeile für Zeile
+    :param all_contacts: Liste von ContactDetails
+    :param tenant: TenantConfig, deren Gruppen 'Gast' und 'Mitglied' ergeben
     :return: DataFrame with all contacts
     """
-    search = ContactDetailsFilter(
-        contactDetailsGroups__not="193181175"
-        # alle Nicht-Firmen filtern, alle Member und ehemaligen member mit member: None
-    )
-    all_contacts = ev_client.contact_details.get_all(search=search)
-    all_members = []
-    for mem in all_contacts:
-        doc = {}
-        doc["Vorname"] = mem.firstName
-        doc["iban"] = mem.iban
-        doc["Nachname"] = mem.familyName
-        doc["email"] = mem.primaryEmail
-        doc["strasse"] = mem.street
-        doc["stadt"] = mem.city
-        doc["plz"] = str(mem.zip)
-        doc["stadt"] = mem.city
-        if mem.contactDetailsGroups == ['https://easyverein.com/api/v2.0/contact-details-group/187854580']:
-            doc["Gruppe"] = "Gast"
-            doc["contact_obj"] = mem
-        elif mem.contactDetailsGroups == ['https://easyverein.com/api/v2.0/contact-details-group/193181080']:
-            doc["Gruppe"] = "Mitglied"
-            doc["contact_obj"] = mem
-        else:
-            print("ACHTUNG UNBEKANNTE KONTAKTGRUPPE! - Zeile 215 Skript! - %(mem)s" % {"mem": mem})
-        all_members.append(doc)
-    df_all_members = pd.DataFrame(all_members)
+    contact_groups = TenantConfig.resolve(tenant).contact_groups
+    # python-easyverein liefert die Gruppen je nach Version als str oder als pydantic Url
+    groups = [[str(group) for group in mem.contactDetailsGroups] if isinstance(mem.contactDetailsGroups, list)
+              else None for mem in all_contacts]
+    df_all_members = pd.DataFrame({
+        "Vorname": [mem.firstName for mem in all_contacts],
+        "iban": [mem.iban for mem in all_contacts],
+        "Nachname": [mem.familyName for mem in all_contacts],
+        "email": [mem.primaryEmail for mem in all_contacts],
+        "strasse": [mem.street for mem in all_contacts],
+        "stadt": [mem.city for mem in all_contacts],
+        "plz": [str(mem.zip) for mem in all_contacts],
+        "Gruppe": [contact_groups.get(mem_groups[0]) if mem_groups is not None and len(mem_groups) == 1 else None
+                   for mem_groups in groups],
+        "contact_obj": pd.Series(all_contacts, dtype=object),
+    })
+    unknown = df_all_members["Gruppe"].isna()
+    for mem in df_all_members.loc[unknown, "contact_obj"]:
+        print("ACHTUNG UNBEKANNTE KONTAKTGRUPPE! - get_members_in_ev - %(mem)s" % {"mem": mem})
+    df_all_members.loc[unknown, "contact_obj"] = np.nan
     return df_all_members
 
 
-def doublecheck_billing(df_not_paid, df_alltime):
+def get_members_in_ev(snapshot=None, force_full_refresh=False, offline=False, tenant=None) -> pd.DataFrame:
+    """
+    Request and transformation of all contacts from easyVerein to pandas DataFrame
+    :param snapshot: ContactSnapshot, wenn gesetzt werden die Kontakte lokal zwischengespeichert
+    :param force_full_refresh: alle Kontakte neu abrufen, auch wenn der Snapshot noch aktuell ist
+    :param offline: nur den Snapshot lesen, unabhängig von seinem Alter
+    :param tenant: TenantConfig
+    :return: DataFrame with all contacts
+    """
+    tenant = TenantConfig.resolve(tenant)
+    if offline:
+        if snapshot is None or snapshot.last_sync is None:
+            raise ValueError("offline mode needs a contact snapshot, run refresh-snapshot first")
+        print("OFFLINE: USING CONTACT SNAPSHOT FROM %(last_sync)s" % {"last_sync": snapshot.last_sync})
+        all_contacts = snapshot.load()
+    elif snapshot is not None:
+        all_contacts = sync_contacts(snapshot, force_full_refresh=force_full_refresh, tenant=tenant)
+    else:
+        search = ContactDetailsFilter(contactDetailsGroups__not=tenant.contact_filter_not_group)
+        all_contacts = get_all_pages(tenant.ev_client.contact_details, search=search, tenant=tenant)
+    return contacts_to_frame(all_contacts, tenant=tenant)
+
+
+NAME_UMLAUTS = {'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'}
+# Kölner Phonetik: Buchstabe -> Code, Sonderfälle (C, D, T, P, X) in _koelner_code
+KOELNER_CODES = {**dict.fromkeys('AEIJOUY', '0'), 'B': '1', **dict.fromkeys('FVW', '3'), **dict.fromkeys('GKQ', '4'),
+                 'L': '5', **dict.fromkeys('MN', '6'), 'R': '7', **dict.fromkeys('SZ', '8'), 'H': ''}
+
+
+def normalize_names(values) -> pd.Series:
+    """
+    Vergleichbare Schreibweise von Namen: klein, Umlaute ausgeschrieben, Akzente entfernt, Bindestriche und mehrfache
+    Leerzeichen zu einem Leerzeichen ('Marie-Luise ' -> 'marie luise', 'Weiß' -> 'weiss')
+    :param values: Series mit Namen
+    :return: Series mit normalisierten Namen, '' für fehlende Werte
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna('').astype(str), use_na_sentinel=False)
+    names = pd.Series(uniques, dtype=object).str.lower()
+    for umlaut, replacement in NAME_UMLAUTS.items():
+        names = names.str.replace(umlaut, replacement, regex=False)
+    names = (names.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+             .str.replace(r'[-_./,]+', ' ', regex=True)
+             .str.replace(r'[^a-z0-9 ]', '', regex=True)
+             .str.replace(r'\s+', ' ', regex=True)
+             .str.strip())
+    return pd.Series(names.to_numpy(dtype=object)[codes], index=getattr(values, 'index', None), dtype=object)
+
+
+def normalize_plz(values) -> pd.Series:
+    """
+    :param values: PLZ als Text oder Zahl ('82269', 82269.0, 'None', 'nan')
+    :return: fünfstellige PLZ als Text, NaN wenn keine erkennbar ist
+    """
+    text = pd.Series(values, dtype=object).astype(str).str.replace(r'\.0$', '', regex=True)
+    return text.str.extract(r'(\d{5})', expand=False)
+
+
+def _koelner_code(word, i):
+    char = word[i]
+    before = word[i - 1] if i > 0 else ''
+    after = word[i + 1] if i + 1 < len(word) else ''
+    if char == 'C':
+        if i == 0:
+            return '4' if after and after in 'AHKLOQRUX' else '8'
+        return '4' if after and after in 'AHKOQUX' and before not in 'SZ' else '8'
+    if char in 'DT':
+        return '8' if after and after in 'CSZ' else '2'
+    if char == 'P':
+        return '3' if after == 'H' else '1'
+    if char == 'X':
+        return '8' if before and before in 'CKQ' else '48'
+    return KOELNER_CODES.get(char, '')
+
+
+@functools.lru_cache(maxsize=None)
+def koelner_phonetik(word) -> str:
+    """
+    Kölner Phonetik eines Namensteils ('Meier', 'Maier', 'Mayer' -> '67'). Ziffern bleiben am Ende erhalten, damit
+    'Müller 2' und 'Müller' nicht im selben Block landen.
+    :param word: normalisierter Namensteil
+    :return: phonetischer Code
+    """
+    word = word.upper().replace('AE', 'A').replace('OE', 'O').replace('UE', 'U').replace('SS', 'S')
+    digits = ''.join(char for char in word if char.isdigit())
+    word = ''.join(char for char in word if 'A' <= char <= 'Z')
+    code = ''
+    for i in range(len(word)):
+        for digit in _koelner_code(word, i):
+            if not code or code[-1] != digit:
+                code += digit
+    code = code[:1] + code[1:].replace('0', '')
+    return code + digits
+
+
+BIGRAM_BUCKETS = 2 ** 16  # Hash-Raum der Zeichen-Bigramme
+
+
+def _bigram_table(names) -> tuple:
+    """
+    Zeichen-Bigramme je Name, gehasht in BIGRAM_BUCKETS, als sortierte Schlüssel id * BIGRAM_BUCKETS + bigram mit
+    Häufigkeit, dazu die Norm je Name für die Cosinus-Ähnlichkeit
+    :param names: normalisierte Namen, Position = id
+    :return: (np.ndarray Schlüssel, np.ndarray Häufigkeit, np.ndarray Startposition je id, np.ndarray Norm je id)
+    """
+    ids, bigrams = [], []
+    for i, name in enumerate(names):
+        padded = ' ' + name + ' '
+        ids.extend([i] * (len(padded) - 1))
+        bigrams.extend(padded[j:j + 2] for j in range(len(padded) - 1))
+    hashed = pd.util.hash_array(np.asarray(bigrams, dtype=object)) % np.uint64(BIGRAM_BUCKETS)
+    keys, counts = np.unique(np.asarray(ids, dtype=np.int64) * BIGRAM_BUCKETS + hashed.astype(np.int64),
+                             return_counts=True)
+    starts = np.searchsorted(keys, np.arange(len(names) + 1, dtype=np.int64) * BIGRAM_BUCKETS)
+    norms = np.sqrt(np.bincount(keys // BIGRAM_BUCKETS, weights=counts.astype(float) ** 2, minlength=len(names)))
+    return keys, counts, starts, norms
+
+
+def _name_blocks(vorname, nachname, plz, with_plz, refine=None) -> pd.DataFrame:
+    """
+    Block-Schlüssel je Zeile: phonetischer Code jedes Nachnamensteils, mit PLZ bzw. (ohne PLZ) zusätzlich mit dem
+    Code des ersten Vornamens
+    :param refine: zu große PLZ-Blöcke (häufige Nachnamen), die zusätzlich nach dem Vornamen geteilt werden
+    :return: DataFrame row, key
+    """
+    tokens = nachname.str.split(' ').explode()
+    tokens = tokens[tokens.str.len() > 1]
+    codes = tokens.map(koelner_phonetik).to_numpy(dtype=object)
+    rows = tokens.index.to_numpy()
+    first = vorname.str.split(' ').str[0].fillna('').map(koelner_phonetik).reindex(rows).to_numpy(dtype=object)
+    if with_plz:
+        keys = plz.reindex(rows).to_numpy(dtype=object) + '|' + codes
+        if refine:
+            large = np.isin(keys, list(refine))
+            keys[large] = keys[large] + '|' + first[large]
+    else:
+        keys = '*|' + codes + '|' + first
+    return pd.DataFrame({'row': rows, 'key': keys}).drop_duplicates()
+
+
+def _compact_names(names) -> np.ndarray:
+    # normalisierte Namen ohne Leerzeichen: 'hans peter' und 'hanspeter' sind derselbe Name
+    return np.asarray([name.replace(' ', '') for name in names], dtype=object)
+
+
+class ContactMatchIndex:
+    """
+    Fehlertolerante Zuordnung Courtbooking-Spieler -> easyVerein-Kontakt. Kandidaten kommen nur aus denselben Blöcken
+    (PLZ + Kölner Phonetik des Nachnamens; ohne PLZ auf einer Seite Nachname + Vorname), bewertet wird mit der
+    Cosinus-Ähnlichkeit gehashter Zeichen-Bigramme des ganzen Namens. Aufwand wächst mit der Anzahl Kandidatenpaare,
+    nicht mit Spieler x Kontakte.
+    Sicher zugeordnet wird nur ein Kontakt mit demselben Namen nach normalize_names, Leerzeichen nicht mitgezählt
+    (Doppelnamen, Bindestriche, Umlaute, Groß-/Kleinschreibung), und nur wenn kein anderer Spieler denselben Kontakt
+    bekommt. Ähnliche Namen ('Alexandra'/'Alexander', auch bei gleicher Phonetik) werden nur als Kandidaten gemeldet.
+    """
+
+    def __init__(self, df_all_members, candidate=0.6, max_block=50):
+        """
+        :param df_all_members: Kontakte aus get_members_in_ev
+        :param candidate: Mindest-Ähnlichkeit, ab der ein Kontakt als möglicher Treffer gemeldet wird
+        :param max_block: PLZ-Blöcke mit mehr Kontakten werden zusätzlich nach dem Vornamen geteilt
+        """
+        self.df_all_members = df_all_members.reset_index(drop=True)
+        self.candidate = candidate
+        vorname = normalize_names(self.df_all_members['Vorname'])
+        nachname = normalize_names(self.df_all_members['Nachname'])
+        plz = normalize_plz(self.df_all_members['plz'])
+        self._names = (vorname + ' ' + nachname).str.strip().to_numpy(dtype=object)
+        self._compact_names = _compact_names(self._names)
+        self._keys, self._counts, _, self._norms = _bigram_table(self._names)
+        has_plz = plz.notna()
+        self._blocks_plz = _name_blocks(vorname[has_plz], nachname[has_plz], plz[has_plz], with_plz=True)
+        block_sizes = self._blocks_plz['key'].value_counts()
+        self._large_blocks = set(block_sizes.index[block_sizes > max_block])
+        if self._large_blocks:
+            self._blocks_plz = _name_blocks(vorname[has_plz], nachname[has_plz], plz[has_plz], with_plz=True,
+                                            refine=self._large_blocks)
+        self._blocks_name = _name_blocks(vorname, nachname, plz, with_plz=False)
+        self._blocks_name_without_plz = self._blocks_name[~has_plz.to_numpy()[self._blocks_name['row']]]
+
+    def __len__(self):
+        return len(self.df_all_members)
+
+    def _candidate_pairs(self, vorname, nachname, plz) -> pd.DataFrame:
+        has_plz = plz.notna()
+        suffixes = ('_player', '_contact')
+        pairs = [
+            _name_blocks(vorname[has_plz], nachname[has_plz], plz[has_plz], with_plz=True, refine=self._large_blocks)
+            .merge(self._blocks_plz, on='key', suffixes=suffixes),
+            # ohne PLZ auf einer der beiden Seiten nur über den Namen
+            _name_blocks(vorname[~has_plz], nachname[~has_plz], plz[~has_plz], with_plz=False)
+            .merge(self._blocks_name, on='key', suffixes=suffixes),
+            _name_blocks(vorname[has_plz], nachname[has_plz], plz[has_plz], with_plz=False)
+            .merge(self._blocks_name_without_plz, on='key', suffixes=suffixes),
+        ]
+        return (pd.concat(pairs, ignore_index=True)[['row_player', 'row_contact']]
+                .drop_duplicates(ignore_index=True))
+
+    def match(self, df_players) -> pd.DataFrame:
+        """
+        :param df_players: Spieler mit Vorname, Nachname, plz (z.B. nach normalize_player_columns)
+        :return: DataFrame mit dem Index von df_players und den Spalten _contact (Zeile in df_all_members, -1 wenn
+            keine sichere Zuordnung), _match_score, _match_status ('confident', 'ambiguous', 'missed') und
+            _match_candidates (Namen der möglichen Kontakte bei 'ambiguous')
+        """
+        vorname = normalize_names(df_players['Vorname']).reset_index(drop=True)
+        nachname = normalize_names(df_players['Nachname']).reset_index(drop=True)
+        plz = normalize_plz(df_players['plz']).reset_index(drop=True)
+        names = (vorname + ' ' + nachname).str.strip().to_numpy(dtype=object)
+
+        pairs = self._candidate_pairs(vorname, nachname, plz)
+        player_keys, player_counts, player_starts, player_norms = _bigram_table(names)
+        row_player = pairs['row_player'].to_numpy(dtype=np.int64)
+        row_contact = pairs['row_contact'].to_numpy(dtype=np.int64)
+        # je Paar alle Bigramme des Spielers aufzählen und im sortierten Schlüssel-Array der Kontakte nachschlagen
+        lengths = player_starts[row_player + 1] - player_starts[row_player]
+        pair = np.repeat(np.arange(len(pairs)), lengths)
+        offsets = np.arange(len(pair)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entry = player_starts[row_player][pair] + offsets
+        lookup = row_contact[pair] * BIGRAM_BUCKETS + player_keys[entry] % BIGRAM_BUCKETS
+        pos = np.minimum(np.searchsorted(self._keys, lookup), max(len(self._keys) - 1, 0))
+        hit = self._keys[pos] == lookup if len(self._keys) else np.zeros(len(lookup), dtype=bool)
+        dot = np.bincount(pair, weights=np.where(hit, player_counts[entry] * self._counts[pos], 0.0),
+                          minlength=len(pairs))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pairs['score'] = np.nan_to_num(dot / (player_norms[row_player] * self._norms[row_contact]))
+        pairs['exact'] = _compact_names(names)[row_player] == self._compact_names[row_contact]
+        # gleiche Namen zuerst, dann nach Ähnlichkeit
+        pairs = pairs[(pairs['score'] >= self.candidate) | pairs['exact']].sort_values(
+            ['row_player', 'exact', 'score'], ascending=[True, False, False])
+
+        n_players = len(df_players)
+        best = pairs.drop_duplicates('row_player')
+        best_score = np.zeros(n_players)
+        best_score[best['row_player']] = best['score']
+        contact = np.full(n_players, -1, dtype=np.int64)
+        contact[best['row_player']] = best['row_contact']
+
+        # genau ein Kontakt mit gleichem Namen, und kein anderer Spieler landet sicher auf demselben Kontakt
+        confident = np.bincount(pairs.loc[pairs['exact'], 'row_player'], minlength=n_players) == 1
+        shared = pd.Series(contact[confident]).duplicated(keep=False).to_numpy()
+        confident[np.flatnonzero(confident)[shared]] = False
+        status = np.where(confident, 'confident', np.where(contact >= 0, 'ambiguous', 'missed'))
+        candidates = pd.Series([[] for _ in range(n_players)], dtype=object)
+        ambiguous = pairs[status[pairs['row_player']] == 'ambiguous']
+        if not ambiguous.empty:
+            labels = (self.df_all_members['Vorname'].astype(str) + ' ' + self.df_all_members['Nachname'].astype(str)
+                      + ' (' + self.df_all_members['plz'].astype(str) + ')').to_numpy(dtype=object)
+            grouped = pd.Series(labels[ambiguous['row_contact']], index=ambiguous['row_player']).groupby(level=0)
+            for row, values in grouped.agg(list).items():
+                candidates[row] = values
+        return pd.DataFrame({'_contact': np.where(confident, contact, -1), '_match_score': best_score,
+                             '_match_status': status, '_match_candidates': candidates.to_numpy()},
+                            index=df_players.index)
+
+    def contacts_for(self, matches) -> pd.DataFrame:
+        """
+        :param matches: Ergebnis von match
+        :return: Kontaktspalten je Spieler (ohne Vorname, Nachname, plz), NaN ohne sichere Zuordnung
+        """
+        columns = [col for col in self.df_all_members.columns if col not in ('Vorname', 'Nachname', 'plz')]
+        return self.df_all_members[columns].reindex(matches['_contact'].to_numpy()).set_axis(matches.index)
+
+
+def print_contact_matches(df_players, matches):
+    for player, match in zip(df_players[['Vorname', 'Nachname', 'plz']].to_dict(orient='records'),
+                             matches.to_dict(orient='records')):
+        if match['_match_status'] == 'ambiguous':
+            print("AMBIGUOUS CONTACT MATCH FOR PLAYER %(first_name)s %(family_name)s (%(plz)s): %(candidates)s" % {
+                "first_name": player["Vorname"], "family_name": player["Nachname"], "plz": player["plz"],
+                "candidates": ", ".join(match['_match_candidates'])})
+    counts = matches['_match_status'].value_counts()
+    print("CONTACT MATCHING: %(confident)s confident, %(ambiguous)s ambiguous, %(missed)s missed" % {
+        status: int(counts.get(status, 0)) for status in ['confident', 'ambiguous', 'missed']})
+
+
+FINGERPRINT_COLUMNS = ['Vorname', 'Nachname', 'Kaufdatum', 'Getränk', 'Anzahl', 'Preis']
+# hash: Fingerprint wie für idempotency_key, check: unabhängiger zweiter Hash, damit eine Kollision von hash keine
+# offene Buchung als abgerechnet markiert
+FINGERPRINT_DTYPE = np.dtype([('hash', np.uint64), ('check', np.uint64)])
+FINGERPRINT_CHECK_KEY = 'fingerprintcheck'  # hash_key von pd.util.hash_array, 16 Zeichen
+
+
+def booking_fingerprints(df) -> np.ndarray:
+    """
+    Stabiler 128-bit Hash je Buchung über FINGERPRINT_COLUMNS. Werte werden vorher als Text normalisiert, damit z.B.
+    Anzahl 3 (int) und 3.0 (float, durch NaN in der Spalte) denselben Fingerprint ergeben.
+    :param df: Buchungen im Raw-Format des Courtbooking-CSVs
+    :return: np.ndarray (FINGERPRINT_DTYPE), eine Zeile je Buchung
+    """
+    key = None
+    for col in FINGERPRINT_COLUMNS:
+        values = df[col]
+        if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+            values = values.astype('Int64')
+        values = values.astype(str).str.strip()
+        key = values if key is None else key + '\x1f' + values
+    if key is None or key.empty:
+        return np.empty(0, dtype=FINGERPRINT_DTYPE)
+    values = key.to_numpy(dtype=object)
+    fingerprints = np.empty(len(values), dtype=FINGERPRINT_DTYPE)
+    fingerprints['hash'] = pd.util.hash_array(values)
+    fingerprints['check'] = pd.util.hash_array(values, hash_key=FINGERPRINT_CHECK_KEY)
+    return fingerprints
+
+
+class FingerprintIndex:
+    """
+    Persistenter, sortierter Index der Fingerprints aller bereits abgerechneten Buchungen. Wird neben dem Ledger als
+    .npz gespeichert und nur neu aus dem Ledger aufgebaut, wenn sich der Ledger außerhalb des Skripts geändert hat
+    (oder der Index noch 64-bit Fingerprints einer älteren Version enthält).
+    """
+
+    def __init__(self, fingerprints=None, path=None):
+        self.path = path
+        self._fingerprints = np.unique(np.asarray(fingerprints if fingerprints is not None else [],
+                                                  dtype=FINGERPRINT_DTYPE))
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df_alltime, path=None):
+        return cls(booking_fingerprints(df_alltime), path=path)
+
+    @classmethod
+    def for_ledger(cls, ledger):
+        """
+        Lädt den Index zum Ledger oder baut ihn neu auf, wenn er fehlt oder nicht zum aktuellen Stand passt
+        :param ledger: Ledger
+        :return: FingerprintIndex
+        """
+        path = os.path.splitext(ledger.path)[0] + '.fingerprints.npz'
+        if os.path.exists(path):
+            with np.load(path) as data:
+                if data['fingerprints'].dtype == FINGERPRINT_DTYPE and str(data['signature']) == ledger.signature():
+                    return cls(data['fingerprints'], path=path)
+        print("REBUILDING FINGERPRINT INDEX FROM %(path)s" % {"path": ledger.path})
+        return cls.from_frame(ledger.read(), path=path)
+
+    def __len__(self):
+        self._merge_pending()
+        return len(self._fingerprints)
+
+    def _merge_pending(self):
+        with self._lock:
+            if self._pending:
+                self._fingerprints = np.unique(np.concatenate([self._fingerprints] + self._pending))
+                self._pending = []
+
+    def contains(self, fingerprints) -> np.ndarray:
+        """
+        :param fingerprints: Fingerprints aus booking_fingerprints
+        :return: bool-Array, True wenn die Buchung bereits abgerechnet wurde
+        """
+        self._merge_pending()
+        fingerprints = np.asarray(fingerprints, dtype=FINGERPRINT_DTYPE)
+        if len(self._fingerprints) == 0:
+            return np.zeros(len(fingerprints), dtype=bool)
+        pos = np.searchsorted(self._fingerprints, fingerprints)
+        pos[pos == len(self._fingerprints)] = 0
+        return self._fingerprints[pos] == fingerprints
+
+    def add(self, fingerprints):
+        """
+        Nimmt neu abgerechnete Buchungen auf, sortiert wird erst beim nächsten contains/save
+        :param fingerprints: Fingerprints aus booking_fingerprints
+        """
+        if len(fingerprints):
+            with self._lock:
+                self._pending.append(np.asarray(fingerprints, dtype=FINGERPRINT_DTYPE))
+
+    def save(self, signature):
+        """
+        :param signature: Ledger.signature() des Stands, zu dem der Index passt
+        """
+        self._merge_pending()
+        np.savez(self.path, fingerprints=self._fingerprints, signature=np.array(signature))
+
+
+def doublecheck_billing(df_not_paid, df_alltime=None, index=None):
     """
     takes dataframe with current open bills and dataframe with iterative bills from past and returns DataFrame,
     and return dataframe which just contains bill, not paid and accounted in past.
+    Abgleich über die Fingerprints der Buchungen, entweder gegen index oder gegen df_alltime.
+    """
+    if index is None:
+        index = FingerprintIndex.from_frame(df_alltime)
+    already_billed = index.contains(booking_fingerprints(df_not_paid))
+    return df_not_paid.loc[~already_billed].copy()
+
+
+BILLED_ITEM_PATTERN = (r'^Getränkebuchung am (?P<day>\d{2}\.\d{2}\.\d{4}), Anzahl Getränke: (?P<Anzahl>\d+) '
+                       r'aus Listenposten')
+CANCEL_INVOICE_KINDS = ('cancel', 'credit')  # Storno bzw. Gutschrift: ihre Posten heben die ursprünglichen auf
+
+
+def _related_id(value):
+    """
+    id eines verknüpften Objekts, egal ob easyVerein es als int, als URL ('.../contact-details/123', str oder pydantic
+    Url) oder als Modell liefert
     """
-    for col in df_not_paid.columns:
-        if df_not_paid[col].dtype != df_alltime[col].dtype:
-            df_not_paid[col] = df_not_paid[col].astype(str)
-            df_alltime[col] = df_alltime[col].astype(str)
-    df_still_to_pay = df_not_paid.merge(df_alltime, how='outer', indicator=True).query('_merge == "left_only"').drop(
-        columns=['_merge'])
-    return df_still_to_pay
+    if value is None or isinstance(value, int):
+        return value
+    if hasattr(value, 'id'):
+        return value.id
+    match = re.search(r'(\d+)/?$', str(value))
+    return int(match.group(1)) if match else None
+
+
+def player_keys(vorname, nachname) -> pd.Series:
+    """
+    Spielerschlüssel für den Abgleich mit easyVerein: Vor- und Nachname zusammen normalisiert, damit auch
+    Doppelnamen und Umlaut-Varianten zusammenfinden
+    :param vorname: Series
+    :param nachname: Series
+    :return: Series mit Schlüsseln
+    """
+    return normalize_names(vorname.astype(object).fillna('').astype(str) + ' '
+                           + nachname.astype(object).fillna('').astype(str))
+
+
+class ServerBillingIndex:
+    """
+    Was laut easyVerein schon abgerechnet ist, unabhängig von der lokalen Gesamtübersicht: die Getränkeposten der
+    Rechnungen eines Jahres, aus ihren Titeln ("Getränkebuchung am ..., Anzahl Getränke: ...") zurückgelesen und je
+    Spieler und Kaufdatum zu Anzahl und Betrag summiert.
+    """
+
+    def __init__(self, df_billed, invoices=0, items=0, unparsed=0, unresolved=0, cancelled=0, max_invoice_nr=0):
+        """
+        :param df_billed: DataFrame mit _player, _day, Anzahl, Betrag; eine Zeile je Spieler und Kaufdatum
+        :param unparsed: Posten auf dem Getränke-Konto, deren Titel nicht gelesen werden konnte
+        :param unresolved: Getränkeposten, deren Rechnung keinem bekannten Kontakt zugeordnet werden konnte
+        :param cancelled: Getränkeposten aus Stornos, die von den ursprünglichen abgezogen wurden
+        :param max_invoice_nr: höchste Rechnungsnummer des Jahres, siehe max_invoice_nr
+        """
+        self.df_billed = df_billed
+        self.stats = {"invoices": invoices, "items": items, "billed_days": len(df_billed), "unparsed": unparsed,
+                      "unresolved": unresolved, "cancelled": cancelled}
+        self.max_invoice_nr = max_invoice_nr
+
+    def __len__(self):
+        return len(self.df_billed)
+
+    @classmethod
+    def download(cls, df_all_members, current_year, tenant=None):
+        """
+        Lädt die Rechnungen des Jahres mit derselben Abfrage wie get_current_invoice_nr und ihre Posten. easyVerein
+        filtert Posten nur nach einer einzelnen Rechnung (relatedInvoice), die Posten werden deshalb einmal komplett
+        seitenweise geladen und die der Rechnungen des Jahres behalten: jeder Posten kommt genau einmal an, auch von
+        einem Server, der Filter ignoriert
+        :param df_all_members: Kontakte aus get_members_in_ev, für die Zuordnung Rechnung -> Spieler
+        :param current_year: Jahr der Rechnungen
+        :param tenant: TenantConfig
+        """
+        tenant = TenantConfig.resolve(tenant)
+        invoices = get_invoices_of_year(current_year=current_year, tenant=tenant)
+        ids = {invoice.id for invoice in invoices if invoice.id is not None}
+        items = [item for item in get_all_pages(tenant.ev_client.invoice_item, tenant=tenant)
+                 if _related_id(item.relatedInvoice) in ids]
+        return cls.from_invoices(invoices, items, df_all_members, billing_account=tenant.billing_account_getraenk)
+
+    @classmethod
+    def from_invoices(cls, invoices, items, df_all_members, billing_account=BILLING_ACCOUNT_GETRAENK):
+        """
+        :param invoices: Liste Invoice
+        :param items: Liste InvoiceItem dieser Rechnungen
+        :param df_all_members: Kontakte aus get_members_in_ev
+        :param billing_account: Getränke-Buchungskonto des Vereins, für die Zahl nicht lesbarer Posten
+        Posten mit negativem Betrag oder aus Rechnungen der Art CANCEL_INVOICE_KINDS sind Stornos, ihre Anzahl und ihr
+        Betrag werden abgezogen statt addiert; ganz stornierte Tage gelten als nicht abgerechnet.
+        """
+        df_invoices = pd.DataFrame({"invoice": pd.Series([invoice.id for invoice in invoices], dtype='Int64'),
+                                    "contact": pd.Series([_related_id(invoice.relatedAddress) for invoice in invoices],
+                                                         dtype='Int64'),
+                                    "_cancel": np.array([getattr(invoice, "kind", None) in CANCEL_INVOICE_KINDS
+                                                         for invoice in invoices], dtype=bool)})
+        members = df_all_members.loc[df_all_members["contact_obj"].notna()]
+        df_contacts = pd.DataFrame({"contact": pd.Series([contact.id for contact in members["contact_obj"]],
+                                                         dtype='Int64'),
+                                    "_player": player_keys(members["Vorname"], members["Nachname"]).to_numpy()})
+        df_items = pd.DataFrame({
+            "invoice": pd.Series([_related_id(item.relatedInvoice) for item in items], dtype='Int64'),
+            "title": pd.Series([item.title or '' for item in items], dtype=object),
+            "billingAccount": pd.Series([_related_id(item.billingAccount) for item in items], dtype='Int64'),
+            "Betrag": np.array([float(item.unitPrice or 0.0) * float(1 if item.quantity is None else item.quantity)
+                                for item in items], dtype=np.float64)})
+        df_items = df_items.merge(df_invoices.drop_duplicates("invoice"), on="invoice", how="inner")
+        parsed = df_items["title"].str.extract(BILLED_ITEM_PATTERN)
+        matched = parsed["day"].notna()
+        unparsed = int((~matched & (df_items["billingAccount"] == billing_account).fillna(False)).sum())
+        cancel = (df_items["_cancel"] | (df_items["Betrag"] < 0)).to_numpy()[matched.to_numpy()]
+        sign = np.where(cancel, -1, 1)
+        df = df_items.loc[matched, ["contact"]].assign(
+            Betrag=sign * df_items.loc[matched, "Betrag"].abs().to_numpy(),
+            _day=pd.to_datetime(parsed.loc[matched, "day"], format='%d.%m.%Y').to_numpy(dtype='datetime64[D]'),
+            Anzahl=sign * parsed.loc[matched, "Anzahl"].astype('int64').to_numpy())
+        df = df.merge(df_contacts.drop_duplicates("contact"), on="contact", how="left")
+        unresolved = int(df["_player"].isna().sum())
+        df_billed = df.dropna(subset=["_player"]).groupby(["_player", "_day"], as_index=False)[
+            ["Anzahl", "Betrag"]].sum()
+        df_billed = df_billed.loc[df_billed["Anzahl"] > 0].reset_index(drop=True)
+        return cls(df_billed, invoices=len(invoices), items=len(df_items), unparsed=unparsed, unresolved=unresolved,
+                   cancelled=int(cancel.sum()), max_invoice_nr=max_invoice_nr(invoices))
+
+    def check(self, df_open, ledgered=None, tolerance=0.005) -> pd.Series:
+        """
+        Gleicht die offenen Buchungen in einem Durchgang ab. Je Spieler und Kaufdatum muss die Anzahl (und der Betrag)
+        der Posten in easyVerein genau aufgehen, in dieser Reihenfolge:
+        - allein mit den Buchungen aus der Gesamtübersicht => die übrigen Buchungen sind offen
+        - mit den zeitlich ersten übrigen Buchungen (Gesamtübersicht fehlt oder stammt aus anderen Rechnungen)
+        - mit den Buchungen aus der Gesamtübersicht plus den zeitlich ersten übrigen
+        Geht keins davon auf, ist der Tag ein Konflikt.
+        :param df_open: offene Buchungen (Nicht gezahlt) mit _Kaufdatum und _Preis
+        :param ledgered: bool-Array je Zeile, ob sie schon in der Gesamtübersicht steht (FingerprintIndex.contains)
+        :param tolerance: erlaubte Abweichung des Betrags in EUR
+        :return: Series je Zeile von df_open: 'ledgered', 'open', 'billed' oder 'conflict'
+        """
+        if ledgered is None:
+            ledgered = np.zeros(len(df_open), dtype=bool)
+        frame = pd.DataFrame({"_player": player_keys(df_open["Vorname"], df_open["Nachname"]).to_numpy(),
+                              "_day": pd.to_datetime(df_open['_Kaufdatum']).to_numpy(dtype='datetime64[D]'),
+                              # _Kaufdatum ist nur der Tag, die Reihenfolge innerhalb des Tages gibt die Uhrzeit
+                              "_Kaufdatum": pd.to_datetime(df_open['Kaufdatum'], format='%d.%m.%Y %H:%M',
+                                                           cache=True).to_numpy(),
+                              "Anzahl": df_open["Anzahl"].fillna(0).to_numpy(dtype=np.int64),
+                              "_Preis": df_open["_Preis"].to_numpy(dtype=np.float64),
+                              "_ledgered": np.asarray(ledgered, dtype=bool),
+                              "row": np.arange(len(df_open))})
+        frame = frame.merge(self.df_billed.rename(columns={"Anzahl": "_billed", "Betrag": "_billed_betrag"}),
+                            on=["_player", "_day"], how="left")
+        frame = frame.sort_values(["_player", "_day", "_Kaufdatum", "row"], ignore_index=True)
+        keys = [frame["_player"], frame["_day"]]
+        pending = ~frame["_ledgered"]
+        billed = frame["_billed"].fillna(0)
+        betrag = frame["_billed_betrag"].fillna(0.0)
+        ledger_anzahl = frame["Anzahl"].where(frame["_ledgered"], 0).groupby(keys).transform('sum')
+        ledger_preis = frame["_Preis"].where(frame["_ledgered"], 0.0).groupby(keys).transform('sum')
+        cum_anzahl = frame["Anzahl"].where(pending, 0).groupby(keys).cumsum()
+        cum_preis = frame["_Preis"].where(pending, 0.0).groupby(keys).cumsum()
+
+        def hits(target_anzahl, target_betrag):
+            # eine noch nicht abgerechnete Buchung des Tages trifft Anzahl und Betrag genau
+            hit = pending & (cum_anzahl == target_anzahl) & ((cum_preis - target_betrag).abs() < tolerance)
+            return hit.groupby(keys).transform('any') & (target_anzahl > 0)
+
+        by_ledger = (billed == ledger_anzahl) & ((betrag - ledger_preis).abs() < tolerance)
+        by_pending = ~by_ledger & hits(billed, betrag)
+        by_both = ~by_ledger & ~by_pending & hits(billed - ledger_anzahl, betrag - ledger_preis)
+        target = np.where(by_pending, billed, billed - ledger_anzahl)
+        status = np.select([frame["_ledgered"].to_numpy(), (billed == 0).to_numpy() | by_ledger.to_numpy(),
+                            ~(by_pending | by_both).to_numpy(), (cum_anzahl <= target).to_numpy()],
+                           ['ledgered', 'open', 'conflict', 'billed'], 'open')
+        result = np.empty(len(frame), dtype=object)
+        result[frame["row"].to_numpy()] = status
+        return pd.Series(result, index=df_open.index)
+
+
+def print_reconciliation(server_index, df_status):
+    """
+    :param df_status: offene, lokal noch nicht abgerechnete Buchungen mit Spalte _reconcile aus
+        ServerBillingIndex.check
+    """
+    print("RECONCILIATION: %(invoices)s invoices, %(items)s items (%(cancelled)s cancelled), %(billed_days)s billed "
+          "player days in easyVerein" % server_index.stats)
+    if server_index.stats["unparsed"] or server_index.stats["unresolved"]:
+        print("ACHTUNG: %(unparsed)s GETRÄNKEPOSTEN MIT UNBEKANNTEM TITEL, %(unresolved)s OHNE BEKANNTEN KONTAKT"
+              % server_index.stats)
+    for status, message in (('billed', "IN EASYVEREIN ABGERECHNET, FEHLT IN DER GESAMTÜBERSICHT"),
+                            ('conflict', "TAG IN EASYVEREIN MIT ANDERER ANZAHL/BETRAG ABGERECHNET, BITTE PRÜFEN")):
+        rows = df_status.loc[df_status["_reconcile"] == status]
+        for (vorname, nachname), df_player in rows.groupby(["Vorname", "Nachname"], sort=True):
+            print("%(message)s - %(first_name)s %(last_name)s: %(rows)s Buchungen an %(days)s" % {
+                "message": message, "first_name": vorname, "last_name": nachname, "rows": len(df_player),
+                "days": ", ".join(sorted(set(pd.to_datetime(df_player["_Kaufdatum"]).dt.strftime('%d.%m.%Y'))))})
+
+
+def rebuild_ledger(csv_file_path, filename_buchungen, buchungen_alltime, backend='csv', current_year=None,
+                   dryrun=False, tenant=None) -> pd.DataFrame:
+    """
+    Ergänzt die Gesamtübersicht um die Buchungen, die laut easyVerein schon abgerechnet sind, dort aber fehlen (z.B.
+    nachdem die Datei verloren ging oder bearbeitet wurde). Betrachtet werden die Rechnungen des Jahres.
+    :param backend: Ledger-Backend wie bei main
+    :param dryrun: nur anzeigen, nichts schreiben
+    :param tenant: TenantConfig
+    :return: DataFrame der ergänzten Buchungen im Raw-Format
+    """
+    current_year = current_year or dt.datetime.now().year
+    server_index = ServerBillingIndex.download(get_members_in_ev(tenant=tenant), current_year=current_year,
+                                               tenant=tenant)
+    df_todo = ingest_buchungen(csv_file_path + filename_buchungen)
+    df_open = df_todo.loc[df_todo["Gezahlt"] == 'Nicht gezahlt']
+    csv_buchungen_alltime = csv_file_path + buchungen_alltime
+    with open_ledger(csv_buchungen_alltime, backend=backend, read_only=dryrun) as ledger:
+        index = FingerprintIndex.for_ledger(ledger)
+        status = server_index.check(df_open, ledgered=index.contains(booking_fingerprints(df_open)))
+        df_status = df_open.assign(_reconcile=status).loc[status != 'ledgered']
+        print_reconciliation(server_index, df_status)
+        df_missing = df_status.loc[df_status["_reconcile"] == 'billed'].drop(
+            columns=DERIVED_BUCHUNGEN_COLUMNS + ['_reconcile'])
+        if not dryrun and not df_missing.empty:
+            ledger.append(df_missing)
+            ledger.flush()
+            index.add(booking_fingerprints(df_missing))
+            index.save(signature=ledger.signature())
+            if backend != 'csv':
+                ledger.export_csv(csv_buchungen_alltime)
+    print("REBUILT LEDGER %(path)s: %(rows)s bookings billed in easyVerein %(action)s" % {
+        "path": ledger.path, "rows": len(df_missing), "action": "would be added (dryrun)" if dryrun else "added"})
+    return df_missing
+
+
+class Ledger(abc.ABC):
+    """
+    Append-only Speicher aller bereits abgerechneten Buchungen ("alltime") im Raw-Format des Courtbooking-CSVs.
+    append() schreibt nur die neuen Zeilen, fsync bzw. commit erfolgt gebündelt alle fsync_every Aufrufe und beim
+    Schließen. Unterklassen implementieren _read, _append, _flush und _rewrite.
+    """
+    backend = None
+
+    def __init__(self, path, fsync_every=20, read_only=False):
+        """
+        :param path: Datei des Ledgers
+        :param fsync_every: Anzahl append-Aufrufe, nach denen auf die Platte geschrieben wird
+        :param read_only: nur lesen (Dryrun), append, compact und export_csv werden abgelehnt
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError("ledger %(path)s is opened read-only" % {"path": self.path})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self) -> pd.DataFrame:
+        """
+        :return: alle Buchungen des Ledgers, typisiert wie pd.read_csv der Gesamtübersicht
+        """
+        with self._lock:
+            return self._read()
+
+    def append(self, df_rows):
+        """
+        Hängt abgerechnete Buchungen an, O(Anzahl neuer Zeilen)
+        :param df_rows: DataFrame im Raw-Format des Courtbooking-CSVs
+        """
+        if df_rows.empty:
+            return
+        self._check_writable()
+        with self._lock:
+            self._append(df_rows)
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self._flush()
+                self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+
+    def signature(self) -> str:
+        """
+        :return: Größe und Änderungszeit der Ledger-Datei, um veraltete Fingerprint-Indizes zu erkennen
+        """
+        if not os.path.exists(self.path):
+            return ''
+        stat = os.stat(self.path)
+        return '%(size)s:%(mtime)s' % {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def compact(self) -> int:
+        """
+        Entfernt Zeilen, die durch erneutes Anhängen doppelt sind (pro Spieler werden alle Raw-Zeilen angehängt, auch
+        schon früher abgerechnete), und schreibt den Ledger neu. Gleiche Buchungen innerhalb eines Blocks bleiben
+        stehen, siehe reappended_rows.
+        :return: Anzahl entfernter Zeilen
+        """
+        self._check_writable()
+        with self._lock:
+            self._flush()
+            df = self._read()
+            reappended = reappended_rows(df)
+            if reappended.any():
+                self._rewrite(df.loc[~reappended].reset_index(drop=True))
+            return int(reappended.sum())
+
+    def export_csv(self, csv_path):
+        """
+        Schreibt den Ledger im Layout der Gesamtübersicht (Semikolon, latin1) für Excel
+        :param csv_path: Zieldatei
+        """
+        self._check_writable()
+        df = self.read()
+        _atomic_write_csv(df, csv_path)
+
+    @abc.abstractmethod
+    def _read(self):
+        """
+        :return: DataFrame aller Zeilen, typisiert wie pd.read_csv der Gesamtübersicht
+        """
+
+    @abc.abstractmethod
+    def _append(self, df_rows):
+        """
+        Schreibt neue Zeilen, ohne auf fsync/commit zu warten
+        """
+
+    @abc.abstractmethod
+    def _flush(self):
+        """
+        Bringt alle angehängten Zeilen dauerhaft auf die Platte
+        """
+
+    @abc.abstractmethod
+    def _rewrite(self, df):
+        """
+        Ersetzt den gesamten Inhalt atomar durch df
+        """
+
+
+def reappended_rows(df) -> np.ndarray:
+    """
+    Markiert Zeilen, die nur durch erneutes Anhängen doppelt im Ledger stehen. Jeder Aufruf von
+    save_billing_to_alltime schreibt die Zeilen eines Spielers als zusammenhängenden Block; zwei gleiche Buchungen
+    (gleiches Getränk in derselben Minute) stehen im selben Block. Je Zeileninhalt bleiben so viele Zeilen stehen,
+    wie der Block mit den meisten Kopien enthält, die übrigen (späteren) Kopien sind erneut angehängt.
+    :param df: Inhalt des Ledgers in Reihenfolge des Anhängens
+    :return: bool-Array je Zeile
+    """
+    if df.empty:
+        return np.zeros(len(df), dtype=bool)
+    rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    player_columns = [column for column in ('Vorname', 'Nachname') if column in df.columns]
+    players = df[player_columns].astype(object).fillna('')
+    block = (players != players.shift()).any(axis=1).cumsum().to_numpy()
+    per_block = pd.DataFrame({"row": rows, "block": block}).groupby(["row", "block"]).size()
+    keep = per_block.groupby(level="row").max()
+    occurrence = pd.Series(rows).groupby(rows).cumcount().to_numpy()
+    return occurrence >= keep.reindex(rows).to_numpy()
+
 
+def _atomic_write_csv(df, csv_path):
+    tmp_path = csv_path + '.tmp'
+    df.to_csv(tmp_path, sep=";", encoding='latin1', index=False)
+    os.replace(tmp_path, csv_path)
 
-def save_billing_to_alltime(firstName, lastName, df_cleaned_buchungen, csv_buchungen_alltime):
+
+def _typed_like_csv(df) -> pd.DataFrame:
+    # Roundtrip über CSV, damit alle Backends dieselben dtypes liefern wie pd.read_csv der Gesamtübersicht
+    return pd.read_csv(io.StringIO(df.to_csv(sep=';', index=False)), sep=';')
+
+
+def _records(df_rows):
+    return df_rows.astype(object).where(df_rows.notna(), None)
+
+
+class CsvLedger(Ledger):
+    """
+    Die Gesamtübersicht selbst als Ledger: neue Zeilen werden an die Datei angehängt statt sie komplett neu zu
+    schreiben. Spalten werden auf den vorhandenen Header ausgerichtet.
+    """
+    backend = 'csv'
+
+    def __init__(self, path, fsync_every=20, read_only=False):
+        super().__init__(path, fsync_every=fsync_every, read_only=read_only)
+        self._fh = None
+        self.columns = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.columns = list(pd.read_csv(path, encoding='latin1', sep=';', nrows=0).columns)
+
+    def _open(self):
+        if self._fh is None:
+            needs_newline = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, 'rb') as fh:
+                    fh.seek(-1, os.SEEK_END)
+                    needs_newline = fh.read(1) not in (b'\n', b'\r')
+            self._fh = open(self.path, 'a', encoding='latin1', newline='')
+            if needs_newline:
+                self._fh.write(os.linesep)
+        return self._fh
+
+    def _read(self):
+        if self._fh is not None:
+            self._fh.flush()
+        return pd.read_csv(self.path, encoding='latin1', sep=';')
+
+    def _append(self, df_rows):
+        fh = self._open()
+        write_header = self.columns is None
+        if write_header:
+            self.columns = list(df_rows.columns)
+        df_rows.reindex(columns=self.columns).to_csv(fh, sep=';', index=False, header=write_header)
+
+    def _flush(self):
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def _rewrite(self, df):
+        self.close_handle()
+        _atomic_write_csv(df, self.path)
+
+    def close_handle(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def close(self):
+        super().close()
+        self.close_handle()
+
+    def export_csv(self, csv_path):
+        if os.path.abspath(csv_path) != os.path.abspath(self.path):
+            super().export_csv(csv_path)
+
+
+class JsonlLedger(Ledger):
+    """
+    Journal mit einer JSON-Zeile pro Buchung. Ist das Journal noch leer, werden die Zeilen aus import_csv übernommen.
+    """
+    backend = 'jsonl'
+
+    def __init__(self, path, fsync_every=20, import_csv=None, read_only=False):
+        super().__init__(path, fsync_every=fsync_every, read_only=read_only)
+        self._fh = None
+        if import_csv and os.path.exists(import_csv) and not os.path.exists(path) and not read_only:
+            self._rewrite(pd.read_csv(import_csv, encoding='latin1', sep=';'))
+
+    def _read(self):
+        if self._fh is not None:
+            self._fh.flush()
+        if not os.path.exists(self.path):
+            return pd.DataFrame()
+        with open(self.path, encoding='utf-8') as fh:
+            records = [json.loads(line) for line in fh if line.strip()]
+        return _typed_like_csv(pd.DataFrame.from_records(records)) if records else pd.DataFrame()
+
+    def _append(self, df_rows):
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+        for record in _records(df_rows).to_dict(orient='records'):
+            self._fh.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def _flush(self):
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def _rewrite(self, df):
+        self.close_handle()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            for record in _records(df).to_dict(orient='records'):
+                fh.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close_handle(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def close(self):
+        super().close()
+        self.close_handle()
+
+
+class SqliteLedger(Ledger):
+    """
+    Ledger in einer SQLite-Datenbank, eine Spalte pro CSV-Spalte. Ist die Tabelle noch leer, werden die Zeilen aus
+    import_csv übernommen. Commit erfolgt gebündelt.
+    """
+    backend = 'sqlite'
+    table = 'buchungen_alltime'
+
+    def __init__(self, path, fsync_every=20, import_csv=None, read_only=False):
+        super().__init__(path, fsync_every=fsync_every, read_only=read_only)
+        if read_only:  # legt weder die Datei noch die Tabelle an
+            self._conn = sqlite3.connect('file:%(path)s?mode=ro' % {"path": urllib.request.pathname2url(path)},
+                                         uri=True, check_same_thread=False)
+            return
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS "%s" (_seq INTEGER PRIMARY KEY AUTOINCREMENT)' % self.table)
+        self._conn.commit()
+        if import_csv and os.path.exists(import_csv) and not self._columns():
+            self._append(pd.read_csv(import_csv, encoding='latin1', sep=';'))
+            self._conn.commit()
+
+    def _columns(self):
+        return [row[1] for row in self._conn.execute('PRAGMA table_info("%s")' % self.table) if row[1] != '_seq']
+
+    @staticmethod
+    def _quote(column):
+        return '"%s"' % str(column).replace('"', '""')
+
+    def _read(self):
+        columns = self._columns()
+        if not columns:
+            return pd.DataFrame()
+        df = pd.read_sql_query('SELECT %s FROM "%s" ORDER BY _seq' % (', '.join(map(self._quote, columns)),
+                                                                       self.table), self._conn)
+        return _typed_like_csv(df)
+
+    def _append(self, df_rows):
+        columns = self._columns()
+        for col in df_rows.columns:
+            if col not in columns:
+                self._conn.execute('ALTER TABLE "%s" ADD COLUMN %s' % (self.table, self._quote(col)))
+        self._conn.executemany('INSERT INTO "%s" (%s) VALUES (%s)' % (self.table,
+                                                                      ', '.join(map(self._quote, df_rows.columns)),
+                                                                      ', '.join('?' for _ in df_rows.columns)),
+                               _records(df_rows).itertuples(index=False, name=None))
+
+    def _flush(self):
+        self._conn.commit()
+
+    def _rewrite(self, df):
+        self._conn.execute('DELETE FROM "%s"' % self.table)
+        self._append(df)
+        self._conn.commit()
+        self._conn.execute('VACUUM')
+
+    def close(self):
+        super().close()
+        self._conn.close()
+
+
+LEDGER_BACKENDS = {'csv': CsvLedger, 'jsonl': JsonlLedger, 'sqlite': SqliteLedger}
+
+
+def open_ledger(csv_buchungen_alltime, backend='csv', fsync_every=20, read_only=False) -> Ledger:
+    """
+    Öffnet den Ledger zur Gesamtübersicht. Beim jsonl- und sqlite-Backend liegt der Ledger neben dem CSV
+    (gleicher Name, andere Endung) und wird beim ersten Öffnen aus dem CSV befüllt.
+    :param csv_buchungen_alltime: Pfad der Gesamtübersicht (CSV)
+    :param backend: 'csv', 'jsonl' oder 'sqlite'
+    :param fsync_every: Anzahl append-Aufrufe pro fsync/commit
+    :param read_only: für Dryruns: es wird keine Datei angelegt oder befüllt. Gibt es den jsonl- bzw. sqlite-Ledger
+        noch nicht, wird direkt das CSV gelesen, aus dem er beim ersten echten Lauf befüllt würde.
+    :return: Ledger
+    """
+    if backend not in LEDGER_BACKENDS:
+        raise ValueError("unknown ledger backend %(backend)s, choose one of %(backends)s" % {
+            "backend": backend, "backends": ', '.join(LEDGER_BACKENDS)})
+    ledger_path = os.path.splitext(csv_buchungen_alltime)[0] + '.' + backend
+    if backend == 'csv' or (read_only and not os.path.exists(ledger_path)):
+        return CsvLedger(csv_buchungen_alltime, fsync_every=fsync_every, read_only=read_only)
+    return LEDGER_BACKENDS[backend](ledger_path, fsync_every=fsync_every, import_csv=csv_buchungen_alltime,
+                                    read_only=read_only)
+
+
+def compact_ledger(csv_buchungen_alltime, backend='csv'):
+    """
+    Entfernt doppelte Zeilen aus dem Ledger und aktualisiert das CSV der Gesamtübersicht
+    :param csv_buchungen_alltime: Pfad der Gesamtübersicht (CSV)
+    :param backend: 'csv', 'jsonl' oder 'sqlite'
+    """
+    with open_ledger(csv_buchungen_alltime, backend=backend) as ledger:
+        removed = ledger.compact()
+        ledger.export_csv(csv_buchungen_alltime)
+    print("COMPACTED LEDGER %(path)s: removed %(removed)s duplicate rows" % {"path": ledger.path,
+                                                                              "removed": removed})
+
+
+def save_billing_to_alltime(firstName, lastName, df_cleaned_buchungen, csv_buchungen_alltime=None, ledger=None,
+                            index=None):
+    """
+    Hängt die Buchungen eines Spielers an die Gesamtübersicht an
+    :param firstName: Vorname
+    :param lastName: Nachname
+    :param df_cleaned_buchungen: Buchungen im Raw-Format des Courtbooking-CSVs
+    :param csv_buchungen_alltime: Pfad der Gesamtübersicht, wenn kein ledger übergeben wird
+    :param ledger: geöffneter Ledger des Laufs
+    :param index: FingerprintIndex, der um die neuen Buchungen ergänzt wird
+    """
     df_current_getränke = df_cleaned_buchungen[
         (df_cleaned_buchungen["Vorname"] == firstName) & (df_cleaned_buchungen["Nachname"] == lastName)]
-    df_alltime_current = pd.read_csv(csv_buchungen_alltime, encoding='latin1', sep=';')
-    df_combined = pd.concat([df_alltime_current, df_current_getränke], ignore_index=False)
-    df_combined.to_csv(csv_buchungen_alltime, sep=";", encoding='latin1', index=False)
+    if ledger is None:
+        with CsvLedger(csv_buchungen_alltime) as ledger:
+            ledger.append(df_current_getränke)
+    else:
+        ledger.append(df_current_getränke)
+    if index is not None:
+        index.add(booking_fingerprints(df_current_getränke))
+
 
+BUCHUNGEN_DTYPES = {'Vorname': str, 'Nachname': str, 'Kaufdatum': str, 'Preis': str, 'Anzahl': 'Int64',
+                    'Getränk': 'category', 'Gezahlt': 'category'}
+MITGLIEDER_DTYPES = {'Vorname': str, 'Nachname': str, 'Geschlecht': 'category', 'Telefonnummer': str,
+                     'Handynummer': str}
+DERIVED_BUCHUNGEN_COLUMNS = ['_Kaufdatum', '_Preis']
 
-def main(csv_file_path, filename_buchungen, filename_mitglieder, buchungen_alltime, completion_date, dryrun=False):
+
+def ingest_buchungen(csv_buchungen) -> pd.DataFrame:
     """
-    main-function of script
-    :param csv_file_path: Path to the downloaded csvs from Courtbooking
-    :param filename_buchungen: filename of the bookings-csv from Courtbooking
-    :param filename_mitglieder: filename of the members-list-csv from Courtbooking
-    :param dryrun: defines whether writing operations to easyVerein are executed
-    :return:
+    Einlesen der Getränkebuchungen aus Courtbooking mit festen dtypes. Die Raw-Spalten bleiben textgleich zum CSV
+    (Preis z.B. "2,50"), damit Ledger und Fingerprints unverändert bleiben; _Kaufdatum und _Preis werden einmal
+    spaltenweise abgeleitet.
+    :param csv_buchungen: Pfad des Buchungs-CSVs
+    :return: DataFrame mit Raw-Spalten und DERIVED_BUCHUNGEN_COLUMNS
     """
-    csv_buchungen = csv_file_path + filename_buchungen
-    csv_buchungen_alltime = csv_file_path + buchungen_alltime
-    csv_mitglieder = csv_file_path + filename_mitglieder
+    df_todo = pd.read_csv(csv_buchungen, encoding='latin1', sep=';', decimal=',', dtype=BUCHUNGEN_DTYPES)
+    return _derive_buchungen_columns(df_todo)
+
+
+def _derive_buchungen_columns(df_todo):
+    df_todo['_Kaufdatum'] = pd.to_datetime(df_todo['Kaufdatum'], format='%d.%m.%Y %H:%M', cache=True).dt.date
+    df_todo['_Preis'] = pd.to_numeric(df_todo['Preis'].str.replace(',', '.', regex=False))
+    return df_todo
+
+
+def ingest_mitgliederliste(csv_mitglieder) -> pd.DataFrame:
+    """
+    Einlesen der Mitgliederliste aus Courtbooking mit festen dtypes
+    :param csv_mitglieder: Pfad des Mitglieder-CSVs
+    :return: DataFrame
+    """
+    return pd.read_csv(csv_mitglieder, encoding='latin1', sep=';', decimal=',', dtype=MITGLIEDER_DTYPES)
+
 
-    # Einlesen der CSV-Datei mit dem angegebenen Encoding
+def _normalize_phone(values) -> pd.Series:
+    normalized = values.str.replace(" ", "", regex=False).str.replace("/", "", regex=False).astype(object)
+    return normalized.where(values.notna(), None)
+
+
+def normalize_player_columns(merged_df) -> pd.DataFrame:
+    """
+    Anrede, plz und Telefonnummern der Spieler nach dem Merge mit der Mitgliederliste. Ergebnis wie bisher: Spieler
+    ohne Eintrag in der Mitgliederliste bekommen Anrede 'Frau' und plz 'nan'.
+    :param merged_df: gruppierte Buchungen gemergt mit der Mitgliederliste
+    :return: merged_df mit Spalten Anrede, plz, Telefonnummer, Handynummer
+    """
+    merged_df['Anrede'] = np.where(merged_df['Geschlecht'] == 'Männlich', 'Herr', 'Frau')
+    plz = pd.to_numeric(merged_df['PLZ'], errors='coerce')
+    merged_df['plz'] = plz.astype('Int64').astype(str).astype(object).where(plz.notna(), 'nan')
+    merged_df['Telefonnummer'] = _normalize_phone(merged_df['Telefonnummer'].astype(object))
+    merged_df['Handynummer'] = _normalize_phone(merged_df['Handynummer'].astype(object))
+    return merged_df
+
+
+def _legacy_ingest(csv_buchungen, csv_mitglieder):
+    # bisheriger Weg aus main() Zeile für Zeile übernommen (ohne dtypes, zeilenweise Normalisierung), nur für
+    # compare_ingestion. Die Normalisierung lief dort auf dem Merge mit der Mitgliederliste, hier wie bei _typed_ingest
+    # auf der Mitgliederliste selbst.
     df_todo_raw = pd.read_csv(csv_buchungen, encoding='latin1', sep=';')
     df_todo = df_todo_raw.copy()
     df_todo['_Kaufdatum'] = pd.to_datetime(df_todo['Kaufdatum'], format='%d.%m.%Y %H:%M').dt.date
+    df_todo['_Preis'] = df_todo['Preis'].apply(lambda x: float(x.replace(',', '.')))
+    df_todo['Anzahl'] = df_todo['Anzahl'].apply(lambda x: int(x))
+    df_mitgliederliste = pd.read_csv(csv_mitglieder, encoding='latin1', sep=';')
+    df_mitgliederliste['Anrede'] = df_mitgliederliste['Geschlecht'].apply(lambda x: 'Herr' if x == 'Männlich' else 'Frau')
+    df_mitgliederliste['plz'] = df_mitgliederliste['PLZ'].apply(lambda x: str(x) if np.isnan(x) else str(int(x)))
+    df_mitgliederliste['Telefonnummer'] = df_mitgliederliste['Telefonnummer'].apply(
+        lambda x: str(x).replace(" ", "").replace("/", "") if type(x) == str else None)
+    df_mitgliederliste['Handynummer'] = df_mitgliederliste['Handynummer'].apply(
+        lambda x: str(x).replace(" ", "").replace("/", "") if type(x) == str else None)
+    return df_todo_raw, df_todo, df_mitgliederliste
+
+
+def _typed_ingest(csv_buchungen, csv_mitglieder):
+    # wie in main(): typisiert einlesen, Raw-Format für die Gesamtübersicht durch Weglassen der abgeleiteten Spalten
+    df_todo = ingest_buchungen(csv_buchungen)
+    df_todo_raw = df_todo.drop(columns=DERIVED_BUCHUNGEN_COLUMNS)
+    df_mitgliederliste = normalize_player_columns(ingest_mitgliederliste(csv_mitglieder))
+    return df_todo_raw, df_todo, df_mitgliederliste
+
 
-    df_alltime = pd.read_csv(csv_buchungen_alltime, encoding='latin1',
-                             sep=';')  # CSV aller in der Vergangenehit abgerechneten Buchungen
-    df_alltime['_Kaufdatum'] = pd.to_datetime(df_alltime['Kaufdatum'], format='%d.%m.%Y %H:%M').dt.date
-    df_not_paid = df_todo.loc[df_todo["Gezahlt"] == 'Nicht gezahlt']
+def compare_ingestion(csv_buchungen, csv_mitglieder, repeat=3) -> pd.DataFrame:
+    """
+    Vergleicht Laufzeit und Speicher des bisherigen Einlesens mit ingest_buchungen/ingest_mitgliederliste
+    :param csv_buchungen: Pfad des Buchungs-CSVs
+    :param csv_mitglieder: Pfad des Mitglieder-CSVs
+    :param repeat: Anzahl Durchläufe, gewertet wird der schnellste
+    :return: DataFrame mit Sekunden, Peak-Speicher beim Einlesen und Größe der Ergebnis-DataFrames in MB
+    """
+    results = []
+    for name, ingest in [('legacy', _legacy_ingest), ('typed', _typed_ingest)]:
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ingest(csv_buchungen, csv_mitglieder)
+            seconds.append(time.perf_counter() - start)
+        tracemalloc.start()
+        frames = ingest(csv_buchungen, csv_mitglieder)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append({"path": name,
+                         "seconds": min(seconds),
+                         "peak_mb": peak / 2 ** 20,
+                         "frames_mb": sum(df.memory_usage(deep=True).sum() for df in frames) / 2 ** 20})
+    df_results = pd.DataFrame(results).set_index("path")
+    print(df_results.round(3).to_string())
+    return df_results
+
+
+class PurchaseTable:
+    """
+    Offene Buchungen aller Spieler im CSR-Format: flache NumPy-Arrays je Buchung, sortiert nach Spieler und Kaufdatum,
+    dazu Offsets je Kaufdatum (day_offsets, in die Buchungen) und je Spieler (player_offsets, in die Tage). Summen je
+    Tag und je Rechnung kommen aus np.add.reduceat, die Getränke je Tag werden einmal als Text vorberechnet.
+    """
 
-    # das raw CB csv wie es eingelesen wird, wird hier Doppelgecheckt nach bereits abgerechneten Buchungen, diese werden entfernt.
-    # Später wird das "alltime"-CSV bereits abgerechneter Buchung direkt nach jeder Rechnungserstellung um die neu abgerehcneten Einträge im Raw Format ergänzt und abgespeichert
-    df = doublecheck_billing(df_not_paid=df_not_paid, df_alltime=df_alltime)
-    # TODO Am besten hierfür wohl nur auf Vorname, Name, Kaufdatum checken, da sonst zu kompliziert/ granular
+    def __init__(self, vorname, nachname, player_offsets, days, day_offsets, anzahl, preis, day_drinks):
+        """
+        :param vorname: Vorname je Spieler
+        :param nachname: Nachname je Spieler
+        :param player_offsets: erster Tag je Spieler
+        :param days: Kaufdatum je Tag (datetime64[D])
+        :param day_offsets: erste Buchung je Tag
+        :param anzahl: Anzahl je Buchung
+        :param preis: Preis je Buchung
+        :param day_drinks: Getränke je Tag, jedes nur einmal, z.B. 'Bier, Spezi'
+        """
+        self.vorname = vorname
+        self.nachname = nachname
+        self.player_offsets = player_offsets
+        self.days = days
+        self.day_offsets = day_offsets
+        self.anzahl = anzahl
+        self.preis = preis
+        self.day_drinks = day_drinks
+        if len(day_offsets):
+            self.day_anzahl = np.add.reduceat(anzahl, day_offsets)
+            self.day_preis = np.add.reduceat(preis, day_offsets)
+            self.player_total = np.add.reduceat(self.day_preis, player_offsets)
+        else:
+            self.day_anzahl = np.empty(0, dtype=np.int64)
+            self.day_preis = np.empty(0, dtype=np.float64)
+            self.player_total = np.empty(0, dtype=np.float64)
+
+    @classmethod
+    def from_bookings(cls, df):
+        """
+        :param df: offene Buchungen mit Vorname, Nachname, Getränk, Anzahl, _Kaufdatum und _Preis
+        :return: PurchaseTable, Spieler sortiert nach Vorname, Nachname und Tage aufsteigend wie bisher bei
+            group_purchases; Getränke je Tag in der Reihenfolge der Buchungen
+        """
+        df = df.dropna(subset=['Vorname', 'Nachname'])  # wie groupby
+        frame = pd.DataFrame({'Vorname': df['Vorname'].astype(object).to_numpy(),
+                              'Nachname': df['Nachname'].astype(object).to_numpy(),
+                              'day': pd.to_datetime(df['_Kaufdatum']).to_numpy(dtype='datetime64[D]'),
+                              'row': np.arange(len(df))})
+        frame = frame.sort_values(['Vorname', 'Nachname', 'day', 'row'])
+        order = frame['row'].to_numpy()
+        vorname = frame['Vorname'].to_numpy()
+        nachname = frame['Nachname'].to_numpy()
+        days = frame['day'].to_numpy().astype('datetime64[D]')  # Tage, astype(object) ergibt dann datetime.date
+
+        new_player = np.ones(len(frame), dtype=bool)
+        new_player[1:] = (vorname[1:] != vorname[:-1]) | (nachname[1:] != nachname[:-1])
+        new_day = new_player.copy()
+        new_day[1:] |= days[1:] != days[:-1]
+        day_offsets = np.flatnonzero(new_day)
+        player_offsets = np.flatnonzero(new_player[day_offsets])
+        day_id = np.cumsum(new_day) - 1
+
+        # jedes Getränk nur einmal je Tag, Reihenfolge des ersten Auftretens
+        codes, drinks = pd.factorize(df['Getränk'].astype(object).fillna('').to_numpy()[order])
+        _, first = np.unique(day_id * max(len(drinks), 1) + codes, return_index=True)
+        first = np.sort(first)
+        day_drinks = np.full(len(day_offsets), '', dtype=object)
+        if len(first):
+            # first ist aufsteigend, die Einträge eines Tages liegen also zusammen
+            first_day = day_id[first]
+            bounds = np.flatnonzero(first_day[1:] != first_day[:-1]) + 1
+            names = np.asarray(drinks, dtype=object)[codes[first]].tolist()
+            starts = [0] + bounds.tolist()
+            ends = bounds.tolist() + [len(names)]
+            day_drinks[first_day[starts]] = [', '.join(names[a:b]) for a, b in zip(starts, ends)]
+
+        return cls(vorname=vorname[day_offsets[player_offsets]] if len(day_offsets) else vorname,
+                   nachname=nachname[day_offsets[player_offsets]] if len(day_offsets) else nachname,
+                   player_offsets=player_offsets,
+                   days=days[day_offsets],
+                   day_offsets=day_offsets,
+                   anzahl=df['Anzahl'].fillna(0).to_numpy(dtype=np.int64)[order],
+                   preis=df['_Preis'].to_numpy(dtype=np.float64)[order],
+                   day_drinks=day_drinks)
+
+    def __len__(self):
+        return len(self.player_offsets)
+
+    def day_range(self, player):
+        start = self.player_offsets[player]
+        end = self.player_offsets[player + 1] if player + 1 < len(self.player_offsets) else len(self.day_offsets)
+        return start, end
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        :return: DataFrame mit einer Zeile je Spieler: Vorname, Nachname, _purchases (PlayerPurchases)
+        """
+        return pd.DataFrame({'Vorname': self.vorname,
+                             'Nachname': self.nachname,
+                             '_purchases': pd.Series([PlayerPurchases(self, i) for i in range(len(self))],
+                                                     dtype=object)})
+
+
+class PlayerPurchases:
+    """
+    Sicht auf die Tage eines Spielers in einer PurchaseTable, ohne eigene Kopie der Daten
+    """
+    __slots__ = ('table', 'player')
 
-    # Umwandeln der Datums- und Zeitspalten
-    # df['_Kaufdatum'] = pd.to_datetime(df['Kaufdatum'], format='%d.%m.%Y %H:%M') # Gaeste
-    # df['_Von'] = pd.to_datetime(df['Von'], format='%H:%M Uhr').dt.time # Gaeste
-    # df['_Bis'] = pd.to_datetime(df['Bis'], format='%H:%M Uhr').dt.time # Gaeste
+    def __init__(self, table, player):
+        self.table = table
+        self.player = player
 
-    # Preis-Spalte in Float umwandeln
-    df['_Preis'] = df['Preis'].apply(lambda x: float(x.replace(',', '.')))
-    df['Anzahl'] = df['Anzahl'].apply(lambda x: int(x))
-    # df_cleaned_buchungen = clean_buchungen(df) # Gaeste
+    def __len__(self):
+        start, end = self.table.day_range(self.player)
+        return end - start
 
-    df_mitgliederliste = pd.read_csv(csv_mitglieder, encoding='latin1', sep=';')
-    # df_mitgliederliste['Vorname'] = df_mitgliederliste['Vorname'].str.replace(' ', '') #TODO das macht bei Doppelvornamen Probleme!
-    # df_mitgliederliste['Nachname'] = df_mitgliederliste['Nachname'].str.replace(' ', '') #TODO das macht bei Doppelnachnamen Probleme!
-    # df_mitgliederliste['Anrede'] = df_mitgliederliste.apply(lambda x: 'Herr' if )
+    @property
+    def total(self) -> float:
+        return float(self.table.player_total[self.player])
 
-    df.sort_values("_Kaufdatum", ascending=True,
-                   inplace=True)  # damit erste Buchung in der folgenden Liste vorne steht
+    @property
+    def prices(self) -> np.ndarray:
+        """
+        :return: Summe Preis je Tag
+        """
+        start, end = self.table.day_range(self.player)
+        return self.table.day_preis[start:end]
 
-    df_grouped_all = df.groupby(['Vorname', 'Nachname', '_Kaufdatum']).agg({
-        'Getränk': list,
-        'Anzahl': list,
-        '_Preis': list
-    }).reset_index()
+    def iter_days(self):
+        """
+        :return: Generator von (Kaufdatum als datetime.date, Anzahl, Summe Preis, Getränke) je Tag
+        """
+        start, end = self.table.day_range(self.player)
+        return zip(self.table.days[start:end].astype(object), self.table.day_anzahl[start:end].tolist(),
+                   self.table.day_preis[start:end].tolist(), self.table.day_drinks[start:end])
 
-    df_grouped_all_person = df_grouped_all.groupby(['Vorname', 'Nachname']).agg({
-        '_Kaufdatum': list,
-        'Getränk': list,
-        'Anzahl': list,
-        '_Preis': list
-    }).reset_index()
+    def __repr__(self):
+        return "PlayerPurchases(%(days)s days, total %(total).2f)" % {"days": len(self), "total": self.total}
 
-    # TODO hier weiter, Datenstruktur ist: Kaufdatum: Liste, Getrönk, Anzahl, Preis: Liste aus Listen, Zeilen werden durch VOrname, Nachname bestimmt
 
+def group_purchases(df) -> pd.DataFrame:
+    """
+    Gruppiert die offenen Buchungen je Spieler in eine PurchaseTable
+    :param df: offene Buchungen mit _Kaufdatum und _Preis
+    :return: DataFrame mit einer Zeile je Vorname, Nachname und den Buchungen als PlayerPurchases in _purchases
+    """
+    return PurchaseTable.from_bookings(df).to_frame()
+
+
+def merge_player_data(df_grouped_all_person, df_mitgliederliste, df_all_members, match_index=None) -> pd.DataFrame:
+    """
+    Ergänzt die gruppierten Buchungen um die Daten aus der Mitgliederliste (Courtbooking) und den Kontakt in easyVerein
+    :param df_grouped_all_person: Ergebnis von group_purchases
+    :param df_mitgliederliste: Mitgliederliste aus Courtbooking
+    :param df_all_members: Kontakte aus easyVerein (get_members_in_ev)
+    :param match_index: ContactMatchIndex über df_all_members für die fehlertolerante Zuordnung, sonst exakter Merge
+        auf Vorname, Nachname, plz
+    :return: DataFrame mit einer Zeile je Spieler und Kontakt
+    """
     merged_df = pd.merge(df_grouped_all_person, df_mitgliederliste, on=['Vorname', 'Nachname'], how='left')
-    merged_df['Anrede'] = merged_df['Geschlecht'].apply(lambda x: 'Herr' if x == 'Männlich' else 'Frau')
-    merged_df['plz'] = merged_df['PLZ'].apply(lambda x: str(x) if np.isnan(x) else str(int(x)))
-    merged_df['Telefonnummer'] = merged_df['Telefonnummer'].apply(
-        lambda x: str(x).replace(" ", "").replace("/", "") if type(x) == str else None)
-    merged_df['Handynummer'] = merged_df['Handynummer'].apply(
-        lambda x: str(x).replace(" ", "").replace("/", "") if type(x) == str else None)
-    df_all_members = get_members_in_ev()
-
-    merged_all_players_df = pd.merge(merged_df, df_all_members, on=['Vorname', 'Nachname', 'plz'], how='left')
-
-    for contact in merged_all_players_df.to_dict(orient='records'):
-        # if not ((contact["Nachname"] == "Dohn" and contact["Vorname"] == "Lukas")):  # TODO ZU DEBUGGING ZWECKEN
-        #     continue
-        # if not ((contact["Nachname"] == "Fischer" and contact["Vorname"] == "Charlotte") or (
-        #         contact["Nachname"] == "Lechner" and contact[
-        #     "Vorname"] == "Christian")):  # TODO zum Testen für Dryrun = False
-        #     continue
-        if contact["Gruppe"] == "Mitglied" or contact["Gruppe"] == "Gast":
+    merged_df = normalize_player_columns(merged_df)
+    if match_index is None:
+        return pd.merge(merged_df, df_all_members, on=['Vorname', 'Nachname', 'plz'], how='left')
+    matches = match_index.match(merged_df)
+    print_contact_matches(merged_df, matches)
+    return pd.concat([merged_df, match_index.contacts_for(matches), matches], axis=1)
+
+
+def _accumulate_purchases(players, chunk, df_open):
+    # alle Zeilen je Spieler für den Ledger (wie save_billing_to_alltime im In-Memory-Modus), die offenen daneben zum
+    # Aufsummieren; aufsummiert wird erst beim Ausgeben in einer PurchaseTable
+    for (vorname, nachname), rows in chunk.groupby(['Vorname', 'Nachname'], sort=False):
+        players.setdefault((vorname, nachname), ([], []))[0].append(rows)
+    for (vorname, nachname), rows in df_open.groupby(['Vorname', 'Nachname'], sort=False):
+        players[(vorname, nachname)][1].append(rows)
+
+
+def _purchases_frame(players):
+    rows_by_player = {}
+    open_frames = []
+    for key, (frames, open_rows) in players:
+        if open_rows:  # Spieler ohne offene Buchung werden nicht abgerechnet
+            rows_by_player[key] = pd.concat(frames, ignore_index=True)
+            open_frames.extend(open_rows)
+    if not open_frames:
+        return PurchaseTable.from_bookings(pd.DataFrame(columns=['Vorname', 'Nachname', 'Getränk', 'Anzahl',
+                                                                 '_Kaufdatum', '_Preis'])).to_frame(), {}
+    df_open = pd.concat(open_frames, ignore_index=True)
+    df_batch = PurchaseTable.from_bookings(df_open).to_frame().merge(player_idempotency_keys(df_open),
+                                                                     on=['Vorname', 'Nachname'], how='left')
+    raw_columns = [col for col in df_open.columns if col not in DERIVED_BUCHUNGEN_COLUMNS]
+    return df_batch, {key: rows[raw_columns] for key, rows in rows_by_player.items()}
+
+
+def iter_purchase_batches(csv_buchungen, index, chunksize=100000, sorted_by_player=False):
+    """
+    Liest das Buchungs-CSV blockweise und summiert die offenen, noch nicht abgerechneten Buchungen je Spieler und
+    Kaufdatum auf. Begrenzt ist der Speicher nur bei sorted_by_player: dann wird jeder Spieler ausgegeben, sobald sein
+    Block vorbei ist, und nur die gerade offenen Spieler liegen im Speicher. Unsortiert bleiben alle Zeilen aller
+    Spieler bis zum Ende der Datei im Speicher (wie beim Einlesen am Stück) und alle Spieler kommen in einem Batch.
+    In beiden Fällen gehen je Spieler alle seine Zeilen in den Ledger, wie im In-Memory-Modus.
+    :param csv_buchungen: Pfad des Buchungs-CSVs
+    :param index: FingerprintIndex der bereits abgerechneten Buchungen
+    :param chunksize: Zeilen je Block
+    :param sorted_by_player: CSV ist nach Vorname, Nachname sortiert; ValueError, wenn ein Spieler nach seinem Block
+        noch einmal vorkommt
+    :return: Generator von (DataFrame im Format von group_purchases mit '_key', {(Vorname, Nachname): Raw-Zeilen})
+    """
+    players = {}
+    closed = set()
+    for chunk in pd.read_csv(csv_buchungen, encoding='latin1', sep=';', decimal=',', dtype=BUCHUNGEN_DTYPES,
+                             chunksize=chunksize):
+        last_player = (chunk['Vorname'].iloc[-1], chunk['Nachname'].iloc[-1]) if len(chunk) else None
+        chunk = _derive_buchungen_columns(chunk)
+        df_open = doublecheck_billing(df_not_paid=chunk.loc[chunk["Gezahlt"] == 'Nicht gezahlt'], index=index)
+        _accumulate_purchases(players, chunk, df_open)
+        if sorted_by_player:
+            reopened = closed.intersection(players)
+            if reopened:
+                raise ValueError("bookings csv is not sorted by player, %(player)s appears again after its block, "
+                                 "run without sorted_by_player" % {"player": ' '.join(sorted(reopened)[0])})
+            finished = [key for key in players if key != last_player]
+            closed.update(finished)
+            if finished:
+                yield _purchases_frame((key, players.pop(key)) for key in finished)
+    if players:
+        yield _purchases_frame(players.items())
+
+
+def iter_billable_contacts(csv_buchungen, index, df_mitgliederliste, df_all_members, chunksize=100000,
+                           sorted_by_player=False, match_index=None):
+    """
+    Streaming-Variante von group_purchases + merge_player_data: liefert abrechenbare Spieler einzeln, jeweils mit
+    ihren Raw-Zeilen unter '_rows'. Der Ledger bekommt dieselben Zeilen wie im In-Memory-Modus.
+    :return: Generator von contact-dicts
+    """
+    for df_batch, rows_by_player in iter_purchase_batches(csv_buchungen, index=index, chunksize=chunksize,
+                                                          sorted_by_player=sorted_by_player):
+        for contact in merge_player_data(df_batch, df_mitgliederliste, df_all_members,
+                                         match_index=match_index).to_dict(orient='records'):
+            contact['_rows'] = rows_by_player[(contact["Vorname"], contact["Nachname"])]
+            yield contact
+
+
+def idempotency_key(df_rows) -> str:
+    """
+    Schlüssel für die Abrechnung genau dieser Buchungen: Hash über die sortierten Fingerprints, unabhängig von der
+    Reihenfolge der Zeilen im CSV
+    :param df_rows: Buchungen eines Spielers
+    :return: Hex-String
+    """
+    return hashlib.blake2b(np.sort(booking_fingerprints(df_rows)['hash']).tobytes(), digest_size=16).hexdigest()
+
+
+def player_idempotency_keys(df) -> pd.DataFrame:
+    """
+    idempotency_key für alle Spieler auf einmal, die Fingerprints werden nur einmal für das ganze Frame berechnet
+    :param df: offene Buchungen (nach doublecheck_billing)
+    :return: DataFrame mit Vorname, Nachname, _key
+    """
+    frame = pd.DataFrame({'Vorname': df['Vorname'].to_numpy(), 'Nachname': df['Nachname'].to_numpy(),
+                          'fingerprint': booking_fingerprints(df)['hash']})
+    frame = frame.sort_values(['Vorname', 'Nachname', 'fingerprint'])
+    keys = frame.groupby(['Vorname', 'Nachname'], sort=False)['fingerprint'].agg(
+        lambda fingerprints: hashlib.blake2b(fingerprints.to_numpy(dtype=np.uint64).tobytes(),
+                                             digest_size=16).hexdigest())
+    return keys.rename('_key').reset_index()
+
+
+RUN_JOURNAL_FILENAME = 'billing_journal.sqlite'
+JOURNAL_STATES = ('built', 'submitted', 'ledgered')
+
+
+class RunJournal:
+    """
+    Zustand jedes Spielers im laufenden Abrechnungslauf, je idempotency_key: 'built' (Rechnungsnummer vergeben, wird
+    gesendet), 'submitted' (Rechnung existiert in easyVerein), 'ledgered' (Buchungen stehen in der Gesamtübersicht).
+    Zur Rechnung werden Nummer, Betrag und Kontakt (relatedAddress als id) festgehalten, damit ein Wiederanlauf sie
+    eindeutig wiederfindet. Jeder Übergang wird sofort committed. Nach einem vollständigen Lauf werden die erledigten und die nicht mehr
+    abgefragten Einträge entfernt, nach einem Abbruch setzt der nächste Lauf dort wieder an.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: SQLite-Datei
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS journal (key TEXT PRIMARY KEY, Vorname TEXT, Nachname TEXT, '
+                           'state TEXT NOT NULL, invNumber TEXT, totalPrice REAL, relatedAddress INTEGER, '
+                           'updated_at TEXT NOT NULL)')
+        if 'relatedAddress' not in [row[1] for row in self._conn.execute('PRAGMA table_info(journal)')]:
+            # Journal eines Laufs vor dieser Version
+            self._conn.execute('ALTER TABLE journal ADD COLUMN relatedAddress INTEGER')
+        self._conn.commit()
+        with self._lock:
+            rows = self._conn.execute('SELECT key, Vorname, Nachname, state, invNumber, totalPrice, relatedAddress '
+                                      'FROM journal').fetchall()
+        self._entries = {row[0]: {"Vorname": row[1], "Nachname": row[2], "state": row[3], "invNumber": row[4],
+                                  "totalPrice": row[5], "relatedAddress": row[6]} for row in rows}
+        self._seen = set()  # in diesem Lauf abgefragte Schlüssel, siehe prune
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, key):
+        """
+        :return: Eintrag als dict oder None, wenn der Spieler in keinem früheren Lauf angefangen wurde
+        """
+        with self._lock:
+            self._seen.add(key)
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def mark(self, key, state, contact=None, invoice=None):
+        """
+        Speichert einen Zustandsübergang
+        :param key: idempotency_key
+        :param state: einer aus JOURNAL_STATES
+        :param contact: contact-dict (nur beim ersten Eintrag nötig)
+        :param invoice: InvoiceCreate, dessen invNumber, totalPrice und relatedAddress festgehalten werden
+        """
+        if state not in JOURNAL_STATES:
+            raise ValueError("unknown journal state %(state)s" % {"state": state})
+        with self._lock:
+            entry = self._entries.setdefault(key, {"Vorname": None, "Nachname": None, "state": state,
+                                                   "invNumber": None, "totalPrice": None, "relatedAddress": None})
+            entry["state"] = state
+            if contact is not None:
+                entry.update(Vorname=contact["Vorname"], Nachname=contact["Nachname"])
+            if invoice is not None:
+                entry.update(invNumber=invoice.invNumber, totalPrice=invoice.totalPrice,
+                             relatedAddress=_related_id(invoice.relatedAddress))
+            self._conn.execute('INSERT OR REPLACE INTO journal (key, Vorname, Nachname, state, invNumber, totalPrice, '
+                               'relatedAddress, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (key, entry["Vorname"], entry["Nachname"], state, entry["invNumber"],
+                                entry["totalPrice"], entry["relatedAddress"],
+                                dt.datetime.now(dt.timezone.utc).isoformat()))
+            self._conn.commit()
+
+    def max_invoice_nr(self, current_year):
+        """
+        :return: höchste Nummer des Jahres der Einträge im Zustand 'built' (evtl. nie bei easyVerein angekommen) oder
+            None
+        """
+        prefix = "%(year)s-" % {"year": current_year}
+        with self._lock:
+            numbers = [int(entry["invNumber"][len(prefix):]) for entry in self._entries.values()
+                       if entry["state"] == 'built'
+                       and isinstance(entry["invNumber"], str) and entry["invNumber"].startswith(prefix)
+                       and entry["invNumber"][len(prefix):].isdigit()]
+        return max(numbers) if numbers else None
+
+    def prune(self):
+        """
+        Nach einem vollständigen Lauf, wenn der Ledger geflusht ist: entfernt alle Spieler im Zustand 'ledgered' und
+        alle Einträge, die der Lauf nicht abgefragt hat. Deren Buchungen sind nicht mehr offen bzw. haben sich
+        geändert (anderer idempotency_key); sonst gälte jeder weitere Lauf als Wiederaufnahme.
+        :return: abgelaufene Einträge, die nicht 'ledgered' waren, als Liste von dicts
+        """
+        with self._lock:
+            expired = [dict(entry, key=key) for key, entry in self._entries.items()
+                       if key not in self._seen and entry["state"] != 'ledgered']
+            self._conn.execute("DELETE FROM journal WHERE state = 'ledgered'")
+            self._conn.executemany('DELETE FROM journal WHERE key = ?', [(entry["key"],) for entry in expired])
+            self._conn.commit()
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if entry["state"] != 'ledgered' and key in self._seen}
+        return expired
+
+
+def print_expired_journal_entries(expired):
+    """
+    Ausgabe der Einträge, die RunJournal.prune verworfen hat, weil ihre Buchungen nicht mehr im Export vorkamen
+    :param expired: Rückgabe von RunJournal.prune
+    """
+    for entry in expired:
+        if entry["state"] == 'submitted':
+            print("EXPIRED JOURNAL ENTRY: INVOICE %(invNumber)s FOR PLAYER %(first_name)s %(family_name)s EXISTS, BUT "
+                  "ITS BOOKINGS ARE NOT IN THE ALLTIME TABLE AND NOT IN THIS EXPORT - PLEASE CHECK!" % {
+                      "invNumber": entry["invNumber"], "first_name": entry["Vorname"],
+                      "family_name": entry["Nachname"]})
+    if expired:
+        print("JOURNAL: %(expired)s entries of earlier runs expired" % {"expired": len(expired)})
+
+
+def find_invoice(invNumber, tenant=None):
+    """
+    Gezielte Abfrage einer einzelnen Rechnung über ihre Nummer
+    :param invNumber: z.B. 2024-632
+    :param tenant: TenantConfig
+    :return: Invoice oder None
+    """
+    tenant = TenantConfig.resolve(tenant)
+    invoices = get_all_pages(tenant.ev_client.invoice, search=InvoiceFilter(invNumber__in=[invNumber]), tenant=tenant)
+    # Nummer trotzdem prüfen: ohne den Filter (ältere Server) kommen alle Rechnungen, seitenweise
+    return next((invoice for invoice in invoices if invoice.invNumber == invNumber), None)
+
+
+def reconcile_in_flight(entry, tenant=None) -> bool:
+    """
+    Klärt für einen Spieler im Zustand 'built', ob seine Rechnung vor dem Abbruch noch bei easyVerein angekommen ist
+    :param entry: Eintrag aus RunJournal.get
+    :return: True, wenn die Rechnung mit Nummer, Betrag und Kontakt existiert
+    """
+    if not entry["invNumber"]:
+        return False
+    invoice = find_invoice(entry["invNumber"], tenant=tenant)
+    if invoice is None:
+        return False
+    if entry.get("relatedAddress") is not None and _related_id(invoice.relatedAddress) != entry["relatedAddress"]:
+        return False  # dieselbe Nummer, aber die Rechnung eines anderen Kontakts
+    return entry["totalPrice"] is None or abs(float(invoice.totalPrice) - float(entry["totalPrice"])) < 0.005
+
+
+def bill_contact(contact, completion_date, dryrun, allocator, ledger, index, df_todo_raw=None, journal=None,
+                 payload=None, tenant=None) -> dict:
+    """
+    Erstellt die Rechnung für einen Spieler und ergänzt direkt danach die Gesamtübersicht, beides im selben Aufruf,
+    damit keine Rechnung ohne Ledger-Eintrag bleibt
+    :param contact: contact-dict aus merge_player_data bzw. iter_billable_contacts
+    :param df_todo_raw: Raw-Buchungen, aus denen die Zeilen des Spielers in den Ledger gehen, wenn contact keine
+        '_rows' hat
+    :param journal: RunJournal; Spieler, deren Rechnung laut Journal schon existiert, werden nur noch in den Ledger
+        übernommen
+    :param payload: Ergebnis von InvoiceBatchBuilder.build_batch für den Spieler, ohne wird die Rechnung hier gebaut
+    :param tenant: TenantConfig des Vereins
+    :return: Ergebnis-dict mit status 'ledgered', 'resumed', 'ledger_failed' (Rechnung erstellt, Ledger-Eintrag
+        fehlgeschlagen), 'dryrun', 'skipped' oder 'error'
+    """
+    result = {"Vorname": contact["Vorname"],
+              "Nachname": contact["Nachname"],
+              "Gruppe": contact["Gruppe"],
+              "status": "skipped",
+              "invNumber": None,
+              "error_type": None,
+              "error": None}
+    if not (contact["Gruppe"] == "Mitglied" or contact["Gruppe"] == "Gast"):
+        return result
+    key = contact.get('_key') if journal is not None and not dryrun else None
+    entry = journal.get(key) if key is not None else None
+    try:
+        if entry is not None and entry["state"] == 'built' and reconcile_in_flight(entry, tenant=tenant):
+            # Rechnung ist vor dem Abbruch noch angekommen
+            journal.mark(key, 'submitted')
+            entry["state"] = 'submitted'
+        if entry is not None and entry["state"] != 'built':
+            result["invNumber"] = entry["invNumber"]
+        else:
+            if isinstance(payload, Exception):
+                raise payload  # Prüfung des Batches ist fehlgeschlagen, es wurde nichts gesendet
+            on_built = (lambda invoice: journal.mark(key, 'built', contact=contact, invoice=invoice)) if key else None
+            output = create_invoice(contact=contact,
+                                    dryrun=dryrun,
+                                    allocator=allocator,
+                                    completion_date=completion_date,
+                                    on_built=on_built,
+                                    # nicht angekommene Rechnung bekommt ihre Nummer wieder, damit keine Lücke entsteht
+                                    invNumber=entry["invNumber"] if entry is not None else None,
+                                    payload=payload,
+                                    tenant=tenant)  # Mitglied oder Gastpieler ist in easyVerein => Erstelung der Rechnung
+            if dryrun:
+                result["status"] = "dryrun"
+                return result
+            result["status"] = "created"
+            result["invNumber"] = getattr(output, "invNumber", None)
+            if key is not None:
+                journal.mark(key, 'submitted')
+        try:
+            save_billing_to_alltime(firstName=contact["Vorname"], lastName=contact["Nachname"],
+                                    # CB raw csv wird ergänzt
+                                    df_cleaned_buchungen=contact.get('_rows', df_todo_raw),
+                                    ledger=ledger,
+                                    index=index)
+            if key is not None:
+                journal.mark(key, 'ledgered')
+        except Exception as e:
+            # Rechnung existiert schon, darf also nicht als Fehler (= nochmal abrechnen) enden; mit Journal holt der
+            # nächste Lauf den Ledger-Eintrag nach
+            result.update(status="ledger_failed", error_type=type(e).__name__, error=str(e))
+            return result
+        result["status"] = "resumed" if entry is not None and entry["state"] != 'built' else "ledgered"
+    except KeyError as e:
+        result.update(status="error", error_type="KeyError", error="%(error)s - Missing information in easyVerein!" % {
+            "error": str(e)})
+    except ValueError as e:
+        result.update(status="error", error_type="ValueError", error=str(e))
+    except EasyvereinAPIException as e:
+        result.update(status="error", error_type="EasyvereinAPIException", error=str(e))
+    return result
+
+
+def iter_invoice_batches(contacts, completion_date, dryrun=False, journal=None, batch_size=INVOICE_BATCH_SIZE,
+                         tenant=None):
+    """
+    Liest die Spieler in Batches und baut mit dem InvoiceBatchBuilder alle Rechnungen eines Batches, bevor der erste
+    Spieler daraus weitergegeben wird. Spieler ohne Rechnung (andere Gruppe, laut Journal bereits gesendet) bekommen
+    kein payload.
+    :param contacts: Iterable von contact-dicts, auch ein Generator (Streaming)
+    :param journal: RunJournal, Spieler im Zustand 'built' behalten ihre Nummer
+    :param batch_size: so viele Spieler werden im Voraus gelesen und gebaut
+    :return: Generator von (contact, payload oder None)
+    """
+    builder = InvoiceBatchBuilder(completion_date=completion_date, tenant=tenant)
+    contacts = iter(contacts)
+    while True:
+        batch = list(itertools.islice(contacts, batch_size))
+        if not batch:
+            return
+        to_build = []
+        invNumbers = []
+        for contact in batch:
+            if not (contact["Gruppe"] == "Mitglied" or contact["Gruppe"] == "Gast"):
+                continue
+            key = contact.get('_key') if journal is not None and not dryrun else None
+            entry = journal.get(key) if key is not None else None
+            if entry is not None and entry["state"] != 'built':
+                continue
+            to_build.append(contact)
+            invNumbers.append(entry["invNumber"] if entry is not None else None)
+        with profile_hotpath(tenant=tenant):
+            payloads = builder.build_batch(to_build, invNumbers=invNumbers)
+        payloads = {id(contact): payload for contact, payload in zip(to_build, payloads)}
+        for contact in batch:
+            yield contact, payloads.get(id(contact))
+
+
+def submit_invoices(contacts, completion_date, dryrun, allocator, ledger, index, df_todo_raw=None, max_workers=1,
+                    journal=None, batch_size=None, tenant=None):
+    """
+    Rechnungserstellung mit einem begrenzten Thread-Pool. Alle Worker teilen sich rate_limiter und allocator; es sind
+    nie mehr als 2 * max_workers Spieler gleichzeitig in Arbeit, damit auch ein Generator (Streaming) nur
+    schrittweise gelesen wird. Die Rechnungen werden je batch_size Spieler vorab gebaut und geprüft (siehe
+    iter_invoice_batches).
+    :param contacts: Iterable von contact-dicts
+    :param max_workers: Anzahl paralleler Submitter, 1 = nacheinander wie bisher
+    :param batch_size: Spieler je Batch, ohne Angabe 2 * max_workers (nicht mehr als ohnehin in Arbeit sind)
+    :param tenant: TenantConfig des Vereins
+    :return: DataFrame mit einem Ergebnis je Spieler (siehe bill_contact)
+    """
+    if batch_size is None:
+        batch_size = 2 * max(1, max_workers)
+    results = []
+    kwargs = dict(completion_date=completion_date, dryrun=dryrun, allocator=allocator, ledger=ledger, index=index,
+                  df_todo_raw=df_todo_raw, journal=journal, tenant=tenant)
+    batches = iter_invoice_batches(contacts, completion_date=completion_date, dryrun=dryrun, journal=journal,
+                                   batch_size=batch_size, tenant=tenant)
+    if max_workers <= 1:
+        results = [bill_contact(contact=contact, payload=payload, **kwargs) for contact, payload in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = set()
+            for contact, payload in batches:
+                if len(in_flight) >= 2 * max_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                in_flight.add(executor.submit(bill_contact, contact=contact, payload=payload, **kwargs))
+            results.extend(future.result() for future in as_completed(in_flight))
+    return pd.DataFrame(results, columns=["Vorname", "Nachname", "Gruppe", "status", "invNumber", "error_type",
+                                          "error"])
+
+
+def split_unmatched(contacts, unmatched):
+    """
+    Reicht Spieler mit easyVerein-Kontakt direkt weiter und sammelt die übrigen für onboard_guests. Funktioniert auch
+    mit einem Generator (Streaming), die gesammelten Spieler stehen erst nach dem Durchlauf in unmatched.
+    :param contacts: Iterable von contact-dicts
+    :param unmatched: Liste, an die Spieler ohne Kontakt angehängt werden
+    :return: Generator von contact-dicts mit Kontakt (oder mehrdeutiger Zuordnung, die nicht angelegt werden darf)
+    """
+    for contact in contacts:
+        if pd.isna(contact["Gruppe"]) and contact.get('_match_status') != 'ambiguous':
+            unmatched.append(contact)
+        else:
+            yield contact
+
+
+def _create_guest(contact, dryrun, tenant=None):
+    try:
+        return create_guestplayer(contact=contact, dryrun=dryrun, tenant=tenant), None
+    except KeyError as e:
+        return None, ("KeyError", "%(error)s - Missing information in Courtbooking!" % {"error": str(e)})
+    except (ValueError, EasyvereinAPIException) as e:
+        return None, (type(e).__name__, str(e))
+
+
+def onboard_guests(unmatched, df_all_members, snapshot=None, match_index=None, dryrun=False, max_workers=1,
+                   tenant=None):
+    """
+    Legt alle Spieler eines Laufs ohne easyVerein-Kontakt als Gastspieler an. Vorher wird gegen die vorhandenen
+    Kontakte (ContactMatchIndex) und innerhalb des Stapels (normalisierter Name + PLZ) dedupliziert, angelegt wird
+    parallel über den rate_limiter. Die neuen Kontakte kommen in den Snapshot und direkt in die Rechnungserstellung.
+    :param unmatched: contact-dicts aus split_unmatched
+    :param df_all_members: Kontakte aus get_members_in_ev
+    :param snapshot: ContactSnapshot, in den die neuen Kontakte übernommen werden
+    :param match_index: vorhandener ContactMatchIndex über df_all_members, sonst wird einer aufgebaut
+    :param dryrun: keine Kontakte anlegen, nur zählen
+    :param max_workers: Anzahl paralleler Anlagen
+    :param tenant: TenantConfig des Vereins
+    :return: (Liste abrechenbarer contact-dicts, DataFrame mit einem Ergebnis je Spieler)
+    """
+    columns = ["Vorname", "Nachname", "plz", "status", "contact_id", "error_type", "error"]
+    if not unmatched:
+        return [], pd.DataFrame(columns=columns)
+    df_unmatched = pd.DataFrame(unmatched)
+    if match_index is None:
+        match_index = ContactMatchIndex(df_all_members)
+    matches = match_index.match(df_unmatched)
+    existing = match_index.contacts_for(matches)
+    dedup_key = (normalize_names(df_unmatched['Vorname']) + '|' + normalize_names(df_unmatched['Nachname']) + '|'
+                 + normalize_plz(df_unmatched['plz']).fillna(''))
+    first_of_key = ~dedup_key.duplicated()
+
+    results = [{"Vorname": contact["Vorname"], "Nachname": contact["Nachname"], "plz": contact["plz"],
+                "status": None, "contact_id": None, "error_type": None, "error": None} for contact in unmatched]
+    billable = []
+    to_create = []
+    for i, (contact, status) in enumerate(zip(unmatched, matches['_match_status'])):
+        if status == 'confident':
+            # Kontakt existiert schon (andere Schreibweise oder PLZ), kein Gast anlegen
+            contact.update(existing.iloc[i].to_dict())
+            results[i].update(status="existing", contact_id=getattr(contact["contact_obj"], "id", None))
+            billable.append(contact)
+        elif status == 'ambiguous':
+            results[i].update(status="ambiguous", error="; ".join(matches['_match_candidates'].iloc[i]))
+        elif first_of_key.iloc[i]:
+            to_create.append(i)
+
+    created = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        outcomes = executor.map(lambda i: _create_guest(unmatched[i], dryrun=dryrun, tenant=tenant),
+                               to_create)
+        for i, (guest, error) in zip(to_create, outcomes):
+            if error is not None:
+                results[i].update(status="error", error_type=error[0], error=error[1])
+            elif dryrun:
+                results[i].update(status="dryrun")
+            else:
+                created[dedup_key.iloc[i]] = guest["contact_obj"]
+                results[i].update(status="created", contact_id=guest["contact_obj"].id)
+
+    for i, contact in enumerate(unmatched):
+        contact_obj = created.get(dedup_key.iloc[i])
+        if results[i]["status"] is None:  # gleicher Spieler in anderer Schreibweise im selben Stapel
+            results[i].update(status="duplicate" if contact_obj is not None else "skipped",
+                              contact_id=getattr(contact_obj, "id", None))
+        if contact_obj is not None and results[i]["status"] in ("created", "duplicate"):
+            contact.update(contact_obj=contact_obj, Gruppe="Gast")
+            billable.append(contact)
+    if snapshot is not None and created:
+        snapshot.upsert(list(created.values()))
+    return billable, pd.DataFrame(results, columns=columns)
+
+
+def print_onboarding_summary(df_onboarding):
+    """
+    Ausgabe der Ergebnisse von onboard_guests
+    :param df_onboarding: DataFrame aus onboard_guests
+    """
+    for result in df_onboarding.loc[df_onboarding["status"].isin(["error", "ambiguous"])].to_dict(orient='records'):
+        print("ERROR WHILE CREATING GUESTPLAYER %(first_name)s %(family_name)s: %(status)s %(error)s" % {
+            "first_name": result["Vorname"],
+            "family_name": result["Nachname"],
+            "status": result["error_type"] or result["status"],
+            "error": result["error"]})
+    counts = df_onboarding["status"].value_counts()
+    print("GUESTPLAYERS: %(created)s created in easyVerein, %(existing)s already existing, %(duplicate)s duplicates, "
+          "%(dryrun)s dryrun, %(ambiguous)s ambiguous, %(error)s errors" % {
+              status: int(counts.get(status, 0))
+              for status in ["created", "existing", "duplicate", "dryrun", "ambiguous", "error"]})
+
+
+def invoice_preview_rows(contact, invoice, items) -> list:
+    """
+    Zeilen der Vorschau einer Rechnung, eine je Rechnungsposten
+    :return: Liste von dicts
+    """
+    head = {"invNumber": invoice.invNumber,
+            "Vorname": contact["Vorname"],
+            "Nachname": contact["Nachname"],
+            "Gruppe": contact["Gruppe"],
+            "contact_id": getattr(contact["contact_obj"], "id", None),
+            "receiver": invoice.receiver,
+            "paymentInformation": invoice.paymentInformation,
+            "totalPrice": invoice.totalPrice}
+    return [dict(head, item=i + 1, title=item.title, quantity=item.quantity, unitPrice=item.unitPrice,
+                 description=item.description, billingAccount=item.billingAccount) for i, item in enumerate(items)]
+
+
+def preview_invoices(contacts, completion_date, allocator, tenant=None):
+    """
+    Dryrun in einem Durchlauf: baut die Rechnungen und Posten aller abrechenbaren Spieler batchweise mit dem
+    InvoiceBatchBuilder, ohne easyVerein aufzurufen
+    :param contacts: Iterable von contact-dicts
+    :param allocator: InvoiceNumberAllocator (im Offline-Modus aus dem Snapshot gespeist)
+    :return: (DataFrame Ergebnisse wie submit_invoices, DataFrame Vorschau mit einer Zeile je Rechnungsposten)
+    """
+    results = []
+    rows = []
+    for contact, payload in iter_invoice_batches(contacts, completion_date=completion_date, dryrun=True,
+                                                 tenant=tenant):
+        result = {"Vorname": contact["Vorname"], "Nachname": contact["Nachname"], "Gruppe": contact["Gruppe"],
+                  "status": "skipped", "invNumber": None, "error_type": None, "error": None}
+        results.append(result)
+        if payload is None:
+            continue
+        if isinstance(payload, KeyError):
+            result.update(status="error", error_type="KeyError",
+                          error="%(error)s - Missing information in easyVerein!" % {"error": str(payload)})
+            continue
+        if isinstance(payload, ValueError):
+            result.update(status="error", error_type="ValueError", error=str(payload))
+            continue
+        invoice, items = payload
+        invoice.invNumber = allocator.next()  # wie beim Senden erst nach erfolgreichem Bau, in Reihenfolge
+        result.update(status="dryrun", invNumber=invoice.invNumber)
+        rows.extend(invoice_preview_rows(contact, invoice, items))
+    df_results = pd.DataFrame(results, columns=["Vorname", "Nachname", "Gruppe", "status", "invNumber", "error_type",
+                                                "error"])
+    df_preview = pd.DataFrame(rows, columns=["invNumber", "Vorname", "Nachname", "Gruppe", "contact_id", "receiver",
+                                             "paymentInformation", "totalPrice", "item", "title", "quantity",
+                                             "unitPrice", "description", "billingAccount"])
+    return df_results, df_preview
+
+
+def write_invoice_preview(df_preview, path) -> dict:
+    """
+    Schreibt die Vorschau als CSV bzw. als Parquet, wenn path auf .parquet endet (braucht pyarrow)
+    :param df_preview: DataFrame aus preview_invoices
+    :param path: Zieldatei
+    :return: Summen der Vorschau
+    """
+    if path.endswith('.parquet'):
+        df_preview.to_parquet(path, index=False)
+    else:
+        df_preview.to_csv(path, sep=';', index=False, encoding='utf-8')
+    invoices = df_preview.drop_duplicates("invNumber")
+    totals = {"invoices": len(invoices),
+              "items": len(df_preview),
+              "total": round(float(invoices["totalPrice"].sum()), 2),
+              "total_items": round(float((df_preview["unitPrice"] * df_preview["quantity"]).sum()), 2)}
+    print("INVOICE PREVIEW: %(invoices)s invoices with %(items)s items, total %(total).2f EUR written to %(path)s"
+          % dict(totals, path=path))
+    if abs(totals["total"] - totals["total_items"]) >= 0.005:
+        print("ACHTUNG: SUMME DER POSTEN %(total_items).2f EUR WEICHT VON DEN RECHNUNGSBETRÄGEN AB!" % totals)
+    return totals
+
+
+def refresh_snapshot(csv_file_path, current_year=None, tenant=None):
+    """
+    Bereitet den Offline-Dryrun vor: lädt alle Kontakte in den Snapshot und speichert die höchste Rechnungsnummer
+    :param csv_file_path: Verzeichnis des Snapshots
+    :param current_year: Jahr der Rechnungsnummern, default aktuelles Jahr
+    :param tenant: TenantConfig
+    """
+    current_year = current_year or dt.datetime.now().year
+    snapshot = ContactSnapshot(csv_file_path + CONTACT_SNAPSHOT_FILENAME)
+    try:
+        sync_contacts(snapshot, force_full_refresh=True, tenant=tenant)
+        current_invoice_nr = get_current_invoice_nr(current_year=current_year, tenant=tenant)
+        snapshot.set_last_invoice_nr(current_year, current_invoice_nr)
+        print("STORED LAST INVOICE NUMBER %(year)s-%(nr)s IN SNAPSHOT" % {"year": current_year,
+                                                                         "nr": current_invoice_nr})
+    finally:
+        snapshot.close()
+
+
+def print_billing_summary(df_results):
+    """
+    Ausgabe der gesammelten Ergebnisse von submit_invoices
+    :param df_results: DataFrame aus submit_invoices
+    """
+    for result in df_results.loc[df_results["status"] == "error"].to_dict(orient='records'):
+        print("ERROR WHILE CREATING INVOICE FOR PLAYER %(first_name)s %(family_name)s: %(error_type)s %(error)s" % {
+            "first_name": result["Vorname"],
+            "family_name": result["Nachname"],
+            "error_type": result["error_type"],
+            "error": result["error"]})
+    for result in df_results.loc[df_results["status"] == "ledger_failed"].to_dict(orient='records'):
+        print("INVOICE %(invNumber)s CREATED FOR PLAYER %(first_name)s %(family_name)s, BUT SAVING TO ALLTIME TABLE "
+              "FAILED: %(error_type)s %(error)s" % {
+                  "invNumber": result["invNumber"],
+                  "first_name": result["Vorname"],
+                  "family_name": result["Nachname"],
+                  "error_type": result["error_type"],
+                  "error": result["error"]})
+    counts = df_results["status"].value_counts()
+    print("INVOICES: %(ledgered)s created and saved to alltime table, %(resumed)s resumed from an aborted run, "
+          "%(ledger_failed)s created but not saved to alltime table, %(dryrun)s dryrun, %(skipped)s skipped (not in "
+          "easyVerein), %(error)s errors" % {
+              status: int(counts.get(status, 0))
+              for status in ["ledgered", "resumed", "ledger_failed", "dryrun", "skipped", "error"]})
+
+
+def main(csv_file_path, filename_buchungen, filename_mitglieder, buchungen_alltime, completion_date, dryrun=False,
+         requests_per_minute=60, ledger_backend='csv', contacts_ttl_hours=12, refresh_contacts=False, streaming=False,
+         chunksize=100000, sorted_by_player=False, max_workers=1, report_path=None, profile=False, trace_memory=False,
+         resume=True, fuzzy_match=False, create_guests=False, offline=False, preview_path=None, reconcile=False,
+         tenant=None):
+    """
+    main-function of script
+    :param csv_file_path: Path to the downloaded csvs from Courtbooking
+    :param filename_buchungen: filename of the bookings-csv from Courtbooking
+    :param filename_mitglieder: filename of the members-list-csv from Courtbooking
+    :param dryrun: defines whether writing operations to easyVerein are executed
+    :param requests_per_minute: ceiling for requests against easyVerein, the rate limiter adapts below it on 429
+    :param ledger_backend: storage of the alltime bookings: 'csv' (append to the csv), 'jsonl' or 'sqlite' (csv is
+        exported at the end of the run)
+    :param contacts_ttl_hours: contacts are read from the local snapshot if it is younger, 0 disables the snapshot
+    :param refresh_contacts: force a full download of all contacts into the snapshot
+    :param streaming: read the bookings-csv in chunks instead of loading it completely (for very large exports),
+        memory stays bounded only together with sorted_by_player
+    :param chunksize: rows per chunk in streaming mode
+    :param sorted_by_player: bookings-csv is sorted by player, players are billed as soon as their block is read
+    :param max_workers: number of concurrent invoice submitters sharing the rate limit
+    :param report_path: path of the JSON run report, default run_report_<timestamp>.json in csv_file_path
+    :param profile: profile the invoice building with cProfile, stats are dumped next to the run report
+    :param trace_memory: measure the peak memory of every stage with tracemalloc (slows the run down considerably)
+    :param resume: keep a run journal in csv_file_path, a restarted run skips players that were already billed and
+        checks players whose invoice was in flight with one lookup
+    :param fuzzy_match: match players to easyVerein contacts with the ContactMatchIndex (tolerates double names,
+        spaces, hyphens and umlaut variants) instead of the exact merge on Vorname, Nachname, plz
+    :param create_guests: create players without easyVerein contact as guest players (deduplicated against the
+        existing contacts) and bill them in the same run
+    :param offline: dryrun without any API call, contacts and the last invoice number come from the snapshot
+        (see refresh-snapshot)
+    :param preview_path: csv (or .parquet) file the invoices of a dryrun are written to, default
+        invoice_preview_<timestamp>.csv in csv_file_path
+    :param reconcile: download this year's invoices and their items once and skip bookings that easyVerein already
+        billed even if they are missing in the alltime csv (see rebuild-ledger); conflicting days are skipped too
+    :param tenant: TenantConfig of the club (client, rate limiter, groups, accounts), default the club configured at
+        the top of this script
+    :return: DataFrame with one result per player
+    """
+    if reconcile and (offline or streaming):
+        raise ValueError("reconcile needs easyVerein and all bookings at once, it does not work with offline or "
+                         "streaming")
+    dryrun = dryrun or offline
+    tenant = TenantConfig.resolve(tenant)
+    limiter = tenant.rate_limiter
+    limiter.set_ceiling(requests_per_minute)
+    limiter.reset_stats()  # Zähler je Lauf, auch wenn mehrere Läufe im selben Prozess laufen
+    report = RunReport(trace_memory=trace_memory, profile=profile)
+    if report_path is None:
+        report_path = csv_file_path + report.started_at.strftime(RUN_REPORT_FILENAME)
+    if profile:
+        report.profile_path = os.path.splitext(report_path)[0] + '.prof'
+    details = {"run": {"dryrun": dryrun, "offline": offline, "streaming": streaming, "ledger_backend": ledger_backend,
+                       "max_workers": max_workers, "requests_per_minute": requests_per_minute,
+                       "completion_date": completion_date}}
+    limiter.report = report
+    try:
+        return _billing_run(report, details, csv_file_path=csv_file_path, filename_buchungen=filename_buchungen,
+                            filename_mitglieder=filename_mitglieder, buchungen_alltime=buchungen_alltime,
+                            completion_date=completion_date, dryrun=dryrun, ledger_backend=ledger_backend,
+                            contacts_ttl_hours=contacts_ttl_hours, refresh_contacts=refresh_contacts,
+                            streaming=streaming, chunksize=chunksize, sorted_by_player=sorted_by_player,
+                            max_workers=max_workers, resume=resume, fuzzy_match=fuzzy_match,
+                            create_guests=create_guests, offline=offline, preview_path=preview_path,
+                            reconcile=reconcile, tenant=tenant)
+    except BaseException as e:
+        details["error"] = "%(error_type)s: %(error)s" % {"error_type": type(e).__name__, "error": str(e)}
+        raise
+    finally:
+        # auch nach einem Abbruch, gerade dann wird der Report gebraucht
+        limiter.report = None
+        report.write(report_path, rate_limiter={"requests": limiter.requests,
+                                                "rate_limited": limiter.rate_limited,
+                                                "throttled_seconds": limiter.throttled_seconds,
+                                                "final_requests_per_minute": limiter.requests_per_minute},
+                     **details)
+
+
+def _billing_run(report, details, csv_file_path, filename_buchungen, filename_mitglieder, buchungen_alltime,
+                 completion_date, dryrun, ledger_backend, contacts_ttl_hours, refresh_contacts, streaming, chunksize,
+                 sorted_by_player, max_workers, resume, fuzzy_match, create_guests, offline, preview_path, reconcile,
+                 tenant):
+    """
+    Der eigentliche Lauf von main, Parameter siehe dort
+    :param report: RunReport des Laufs
+    :param details: dict für RunReport.write, wird um Ergebnisse, Rechnungsnummern, Abgleich und Vorschau ergänzt
+    :return: DataFrame with one result per player
+    """
+    csv_buchungen = csv_file_path + filename_buchungen
+    csv_buchungen_alltime = csv_file_path + buchungen_alltime
+    csv_mitglieder = csv_file_path + filename_mitglieder
+
+    with report.stage('ledger open'):
+        ledger = open_ledger(csv_buchungen_alltime, backend=ledger_backend, read_only=dryrun)
+        index = FingerprintIndex.for_ledger(ledger)  # Fingerprints aller in der Vergangenheit abgerechneten Buchungen
+
+    with report.stage('ingest'):
+        df_mitgliederliste = ingest_mitgliederliste(csv_mitglieder)
+    # df_mitgliederliste['Vorname'] = df_mitgliederliste['Vorname'].str.replace(' ', '') #TODO das macht bei Doppelvornamen Probleme!
+    # df_mitgliederliste['Nachname'] = df_mitgliederliste['Nachname'].str.replace(' ', '') #TODO das macht bei Doppelnachnamen Probleme!
+    with report.stage('contacts'):
+        snapshot = ContactSnapshot(csv_file_path + CONTACT_SNAPSHOT_FILENAME,
+                                   ttl=dt.timedelta(hours=contacts_ttl_hours)) if contacts_ttl_hours or offline else None
+        df_all_members = get_members_in_ev(snapshot=snapshot, force_full_refresh=refresh_contacts, offline=offline,
+                                           tenant=tenant)
+        match_index = ContactMatchIndex(df_all_members) if fuzzy_match else None
+    server_index = None
+    reconcile_counts = {}
+    if reconcile:
+        with report.stage('reconcile'):
+            server_index = ServerBillingIndex.download(df_all_members, current_year=dt.datetime.now().year,
+                                                       tenant=tenant)
+
+    if streaming:
+        df_todo_raw = None
+        contacts = iter_billable_contacts(csv_buchungen, index=index, df_mitgliederliste=df_mitgliederliste,
+                                          df_all_members=df_all_members, chunksize=chunksize,
+                                          sorted_by_player=sorted_by_player, match_index=match_index)
+    else:
+        # Einlesen der CSV-Datei mit dem angegebenen Encoding
+        with report.stage('ingest'):
+            df_todo = ingest_buchungen(csv_buchungen)
+            df_todo_raw = df_todo.drop(columns=DERIVED_BUCHUNGEN_COLUMNS)  # Raw-Format für die Gesamtübersicht
+            df_not_paid = df_todo.loc[df_todo["Gezahlt"] == 'Nicht gezahlt']
+
+        # das raw CB csv wie es eingelesen wird, wird hier Doppelgecheckt nach bereits abgerechneten Buchungen, diese werden entfernt.
+        # Später wird das "alltime"-CSV bereits abgerechneter Buchung direkt nach jeder Rechnungserstellung um die neu abgerehcneten Einträge im Raw Format ergänzt und abgespeichert
+        with report.stage('doublecheck'):
+            df = doublecheck_billing(df_not_paid=df_not_paid, index=index)
+        if server_index is not None:
+            # Gegenprüfung mit easyVerein, falls die Gesamtübersicht verloren ging oder bearbeitet wurde
+            with report.stage('reconcile'):
+                status = server_index.check(df_not_paid, ledgered=index.contains(booking_fingerprints(df_not_paid)))
+                df["_reconcile"] = status.loc[df.index]
+                reconcile_counts = {k: int(v) for k, v in df["_reconcile"].value_counts().items()}
+                print_reconciliation(server_index, df)
+                df = df.loc[df["_reconcile"] == 'open'].drop(columns="_reconcile")
+        # TODO Am besten hierfür wohl nur auf Vorname, Name, Kaufdatum checken, da sonst zu kompliziert/ granular
+
+        # Umwandeln der Datums- und Zeitspalten
+        # df['_Kaufdatum'] = pd.to_datetime(df['Kaufdatum'], format='%d.%m.%Y %H:%M') # Gaeste
+        # df['_Von'] = pd.to_datetime(df['Von'], format='%H:%M Uhr').dt.time # Gaeste
+        # df['_Bis'] = pd.to_datetime(df['Bis'], format='%H:%M Uhr').dt.time # Gaeste
+
+        df['Anzahl'] = df['Anzahl'].astype('int64')
+        # df_cleaned_buchungen = clean_buchungen(df) # Gaeste
+
+        # Datenstruktur ist: je Spieler (Vorname, Nachname) eine Sicht auf die Tage in der PurchaseTable
+        with report.stage('grouping'):
+            df_grouped_all_person = group_purchases(df)
+            df_grouped_all_person = df_grouped_all_person.merge(player_idempotency_keys(df), on=['Vorname', 'Nachname'],
+                                                                how='left')
+        with report.stage('member merge'):
+            merged_all_players_df = merge_player_data(df_grouped_all_person, df_mitgliederliste, df_all_members,
+                                                      match_index=match_index)
+            contacts = merged_all_players_df.to_dict(orient='records')
+
+    allocator = InvoiceNumberAllocator(current_year=dt.datetime.now().year,
+                                       fetch_current_invoice_nr=lambda current_year: get_current_invoice_nr(
+                                           current_year=current_year, tenant=tenant))
+    if server_index is not None:
+        allocator.seed(server_index.max_invoice_nr)  # dieselbe Abfrage, kein zweiter Download
+    if offline:
+        # letzte Rechnungsnummer aus dem Snapshot statt aller Rechnungen des Jahres
+        last_invoice_nr = snapshot.last_invoice_nr(current_year=allocator.current_year)
+        if last_invoice_nr is None:
+            raise ValueError("offline mode needs the last invoice number of %(year)s in the snapshot, run "
+                             "refresh-snapshot first" % {"year": allocator.current_year})
+        allocator = InvoiceNumberAllocator(current_year=allocator.current_year,
+                                           fetch_current_invoice_nr=lambda current_year: last_invoice_nr)
+    journal = RunJournal(csv_file_path + RUN_JOURNAL_FILENAME) if resume and not dryrun else None
+    if journal is not None and len(journal):
+        # abgebrochener Lauf: dort weitermachen. Die höchste Nummer kommt trotzdem von easyVerein, das Journal kann
+        # älter sein; nur Nummern, die evtl. nie angekommen sind, bleiben für ihre Spieler reserviert
+        last_invoice_nr = journal.max_invoice_nr(current_year=allocator.current_year)
+        if last_invoice_nr is not None:
+            allocator.floor(last_invoice_nr)
+        print("RESUMING ABORTED RUN: %(players)s players in journal %(path)s" % {"players": len(journal),
+                                                                                "path": journal.path})
+
+    # contacts = (c for c in contacts if c["Nachname"] == "Dohn" and c["Vorname"] == "Lukas")  # TODO ZU DEBUGGING ZWECKEN
+    previews = []
+
+    def bill(contacts_to_bill):
+        if dryrun:  # nur Rechnungen bauen und als Vorschau sammeln
+            df_bill_results, df_preview = preview_invoices(contacts_to_bill, completion_date=completion_date,
+                                                           allocator=allocator, tenant=tenant)
+            previews.append(df_preview)
+            return df_bill_results
+        return submit_invoices(contacts_to_bill, completion_date=completion_date, dryrun=dryrun, allocator=allocator,
+                               ledger=ledger, index=index, df_todo_raw=df_todo_raw, max_workers=max_workers,
+                               journal=journal, tenant=tenant)
+
+    unmatched = []
+    if create_guests:
+        contacts = split_unmatched(contacts, unmatched)
+    # im Streaming-Modus laufen Einlesen, Doublecheck und Gruppierung hier mit, da die Kontakte lazy erzeugt werden
+    stage = 'preview' if dryrun else 'submit'
+    completed = False
+    try:
+        with report.stage('stream + ' + stage if streaming else stage):
+            df_results = bill(contacts)
+
+        if create_guests:
+            # Spieler ohne Kontakt erst nach allen anderen: als Gastspieler anlegen und im selben Lauf abrechnen
+            with report.stage('guest onboarding'):
+                guests, df_onboarding = onboard_guests(unmatched, df_all_members=df_all_members, snapshot=snapshot,
+                                                       match_index=match_index, dryrun=dryrun, max_workers=max_workers,
+                                                       tenant=tenant)
+                onboarded = {id(contact) for contact in guests}
+                not_onboarded = [contact for contact in unmatched if id(contact) not in onboarded]  # => skipped
+                df_guest_results = bill(guests + not_onboarded)
+            df_results = pd.concat([df_results, df_guest_results], ignore_index=True)
+            print_onboarding_summary(df_onboarding)
+        completed = True
+    finally:
+        # auch nach einem Abbruch: die Buchungen der schon erstellten Rechnungen sicher in den Ledger
+        with report.stage('ledger flush'):
+            ledger.flush()
+            if not dryrun:  # ein Dryrun fasst weder die Gesamtübersicht noch ihren Index an
+                index.save(signature=ledger.signature())
+                if ledger_backend != 'csv':
+                    ledger.export_csv(csv_buchungen_alltime)
+            ledger.close()
+            if journal is not None:
+                if completed:
+                    # erst jetzt, da die Buchungen sicher im Ledger stehen
+                    print_expired_journal_entries(journal.prune())
+                journal.close()
+    if snapshot is not None:
+        # ein Dryrun hat Nummern nur für die Vorschau vergeben, gespeichert wird dann der Stand von easyVerein
+        last_invoice_nr = allocator.synced_invoice_nr if dryrun else allocator.known_invoice_nr
+        if not offline and last_invoice_nr is not None:
+            snapshot.set_last_invoice_nr(allocator.current_year, last_invoice_nr)
+        snapshot.close()
+    preview_totals = None
+    if dryrun:
+        if preview_path is None:
+            preview_path = csv_file_path + report.started_at.strftime(INVOICE_PREVIEW_FILENAME)
+        preview_totals = write_invoice_preview(pd.concat(previews, ignore_index=True), preview_path)
+    print_billing_summary(df_results)
+    print_stage_timings(report)
+    print("INVOICE NUMBERS: fetched %(syncs)s times from %(source)s" % {
+        "syncs": allocator.syncs, "source": "the snapshot" if offline else "easyVerein"})
+    print("RATE LIMITER: %(requests)s requests, %(limited)s times rate limited, %(throttled).1f s throttled, "
+          "final rate %(rpm).1f requests/min" % {"requests": tenant.rate_limiter.requests,
+                                                 "limited": tenant.rate_limiter.rate_limited,
+                                                 "throttled": tenant.rate_limiter.throttled_seconds,
+                                                 "rpm": tenant.rate_limiter.requests_per_minute})
+    status_counts = df_results["status"].value_counts() if not df_results.empty else pd.Series(dtype='int64')
+    details.update(results={"players": len(df_results), "status": {k: int(v) for k, v in status_counts.items()}},
+                   invoice_numbers={"syncs": allocator.syncs},
+                   reconcile=dict(server_index.stats, bookings=reconcile_counts) if server_index is not None else None,
+                   preview=dict(preview_totals, path=preview_path) if preview_totals is not None else None)
+    return df_results
+
+
+TENANT_SETTINGS = ('name', 'api_key', 'base_url', 'api_version', 'reference_url', 'groups', 'billing_accounts',
+                   'selection_acc', 'guest_item_description')
+TENANT_REQUIRED = ('name', 'api_key', 'csv_file_path', 'filename_buchungen', 'filename_mitglieder',
+                   'buchungen_alltime', 'completion_date')
+TENANT_LOG_FILENAME = 'run_%(tenant)s_%%Y%%m%%d_%%H%%M%%S.log'
+TENANT_REPORT_FILENAME = 'run_report_%(tenant)s_%%Y%%m%%d_%%H%%M%%S.json'
+
+
+def load_tenant_config(config_path) -> list:
+    """
+    Liest die Vereine (Mandanten) für run_tenants aus einer JSON-Datei:
+    {"defaults": {...}, "tenants": [{"name": "tcgrafrath", "api_key": "...", "base_url": "...", "api_version": "v2.0",
+      "groups": {"Gast": 187854580, "Mitglied": 193181080, "not": 193181175},
+      "billing_accounts": {"Gast": 44093, "Getränk": 44134}, "selection_acc": 187408412,
+      "csv_file_path": "...", "filename_buchungen": "...", "filename_mitglieder": "...", "buchungen_alltime": "...",
+      "completion_date": "2024-12-06", "requests_per_minute": 60, ...}]}
+    Alle Schlüssel außer TENANT_SETTINGS gehen als Parameter an main, defaults gelten für alle Vereine. reference_url
+    (default EV_REFERENCE_URL) und api_version bestimmen die URLs, über die easyVerein auf Objekte verweist.
+    :param config_path: Pfad der JSON-Datei
+    :return: Liste von tenant-dicts, completion_date als datetime.date
+    """
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    main_params = set(inspect.signature(main).parameters) - {"tenant"}
+    tenants = []
+    for i, tenant in enumerate(config.get("tenants", [])):
+        tenant = dict(config.get("defaults", {}), **tenant)
+        missing = [key for key in TENANT_REQUIRED if key not in tenant]
+        unknown = [key for key in tenant if key not in TENANT_SETTINGS and key not in main_params]
+        if missing or unknown:
+            raise ValueError("tenant %(tenant)s in %(path)s: missing %(missing)s, unknown %(unknown)s" % {
+                "tenant": tenant.get("name", i), "path": config_path, "missing": missing, "unknown": unknown})
+        if isinstance(tenant["completion_date"], str):
+            tenant["completion_date"] = dt.date.fromisoformat(tenant["completion_date"])
+        tenants.append(tenant)
+    names = [tenant["name"] for tenant in tenants]
+    if not names or len(set(names)) != len(names):
+        raise ValueError("%(path)s needs at least one tenant and unique tenant names, got %(names)s" % {
+            "path": config_path, "names": names})
+    return tenants
+
+
+def configure_tenant(tenant) -> dict:
+    """
+    Parameter für main eines Vereins, inklusive seiner TenantConfig (eigener ev_client und rate_limiter)
+    :param tenant: tenant-dict aus load_tenant_config
+    :return: Parameter für main
+    """
+    main_kwargs = {key: value for key, value in tenant.items() if key not in TENANT_SETTINGS}
+    main_kwargs["tenant"] = TenantConfig.from_dict(tenant)
+    return main_kwargs
+
+
+def run_tenant(tenant) -> dict:
+    """
+    Worker von run_tenants: rechnet einen Verein in einem eigenen Prozess ab. Die Ausgaben gehen in eine Logdatei
+    im csv_file_path des Vereins, Fehler werden zurückgegeben statt die anderen Vereine abzubrechen.
+    :param tenant: tenant-dict aus load_tenant_config
+    :return: dict mit tenant, report_path, log_path, report (Inhalt des Run-Reports) bzw. error_type und error
+    """
+    main_kwargs = configure_tenant(tenant)
+    started_at = dt.datetime.now()
+    main_kwargs.setdefault("report_path", tenant["csv_file_path"] + started_at.strftime(
+        TENANT_REPORT_FILENAME % {"tenant": tenant["name"]}))
+    log_path = tenant["csv_file_path"] + started_at.strftime(TENANT_LOG_FILENAME % {"tenant": tenant["name"]})
+    result = {"tenant": tenant["name"], "report_path": main_kwargs["report_path"], "log_path": log_path,
+              "report": None, "error_type": None, "error": None}
+    with open(result["log_path"], 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            main(**main_kwargs)
+            with open(result["report_path"], encoding='utf-8') as f:
+                result["report"] = json.load(f)
+        except (EasyvereinAPIException, OSError, sqlite3.Error, ValueError, KeyError) as e:
+            # API, Dateien oder Daten eines Vereins sollen die anderen nicht abbrechen; Programmfehler schon
+            result.update(error_type=type(e).__name__, error=str(e))
+            traceback.print_exc(file=log)
+    return result
+
+
+def merge_tenant_reports(results) -> dict:
+    """
+    Führt die Run-Reports der Vereine zusammen
+    :param results: Liste der Ergebnisse von run_tenant
+    :return: dict mit totals über alle Vereine und je Verein dem vollständigen Report
+    """
+    totals = {"tenants": len(results), "failed": [], "players": 0, "status": {},
+              "api_totals": {}, "seconds": 0.0}
+    for result in results:
+        report = result["report"]
+        if report is None:
+            totals["failed"].append(result["tenant"])
+            continue
+        totals["players"] += report["results"]["players"]
+        for status, count in report["results"]["status"].items():
+            totals["status"][status] = totals["status"].get(status, 0) + count
+        for key, value in report["api_totals"].items():
+            totals["api_totals"][key] = totals["api_totals"].get(key, 0) + value
+        totals["seconds"] += report["total_seconds"]
+    return {"totals": totals, "tenants": {result["tenant"]: result for result in results}}
+
+
+def run_tenants(config_path, max_processes=None, report_path=None) -> dict:
+    """
+    Rechnet mehrere Vereine parallel ab, jeden in einem eigenen Prozess mit eigenem ev_client und Rate-Budget
+    (max_tasks_per_child=1, damit kein Zustand eines Vereins im nächsten landet)
+    :param config_path: JSON-Datei, siehe load_tenant_config
+    :param max_processes: parallele Vereine, default alle auf einmal (die Läufe warten v.a. auf ihr Rate-Budget)
+    :param report_path: zusammengeführter Report, default tenants_report_<timestamp>.json neben der Konfiguration
+    :return: zusammengeführter Report (merge_tenant_reports)
+    """
+    tenants = load_tenant_config(config_path)
+    started_at = dt.datetime.now()
+    if report_path is None:
+        report_path = os.path.join(os.path.dirname(os.path.abspath(config_path)),
+                                   started_at.strftime('tenants_report_%Y%m%d_%H%M%S.json'))
+    results = []
+    with ProcessPoolExecutor(max_workers=min(len(tenants), max_processes or len(tenants)),
+                             mp_context=multiprocessing.get_context('spawn'), max_tasks_per_child=1) as executor:
+        futures = {executor.submit(run_tenant, tenant): tenant["name"] for tenant in tenants}
+        for future in as_completed(futures):
             try:
-                output = create_invoice(contact=contact,
-                                        dryrun=dryrun,
-                                        completion_date=completion_date)  # Mitglied oder Gastpieler ist in easyVerein => Erstelung der Rechnung
-                if not dryrun:
-                    print("created invoice in easyVerein: %(invoice)s" % {"invoice": output})
-                    save_billing_to_alltime(firstName=contact["Vorname"], lastName=contact["Nachname"],
-                                            # CB raw csv wird ergänzt
-                                            df_cleaned_buchungen=df_todo_raw,
-                                            csv_buchungen_alltime=csv_buchungen_alltime)
-                    print("SAVED BILLINGS FOR PLAYER %(first_name)s %(family_name)s TO ALLTIME TABLE!" % {
-                        "first_name": contact["Vorname"],
-                        "family_name": contact["Nachname"]})
-                    time.sleep(10) # sonst too many requests error
-            except KeyError as e:
-                print(
-                    "ERROR WHILE CREATING INVOICE FOR PLAYER %(first_name)s %(family_name)s: %(error)s - Missing information in easyVerein!" % {
-                        "first_name": contact["Vorname"],
-                        "family_name": contact["Nachname"],
-                        "error": str(e)})
-            except ValueError as e:
-                print("VALUE ERROR for %(Vorname)s %(Nachname)s: %(error)s" % {"Vorname": contact["Vorname"],
-                                                                               "Nachname": contact["Nachname"],
-                                                                               "error": e})
-            except EasyvereinAPIException as e:
-                print(
-                    "ERROR WHILE CREATING INVOICE FOR GUESTPLAYER %(first_name)s %(family_name)s: %(error)s - Invoice ID already existing!" % {
-                        "first_name": contact["Vorname"],
-                        "family_name": contact["Nachname"],
-                        "error": str(e)})
-
-        # if pd.isna(contact["Gruppe"]):
-        #     raise NotImplementedError
-        #     try:
-        #         contact = create_guestplayer(contact=contact,
-        #                                      dryrun=dryrun)  # Gastspieler anlegen und Rechnung erstellen
-        #         if not dryrun:
-        #             print("created guestplayer %(first_name)s %(family_name)s in easyVerein!" % {
-        #                 "first_name": contact["Vorname"],
-        #                 "family_name": contact["Nachname"]})
-        #     except Exception as e:
-        #         print("ERROR WHILE CREATING GUESTPLAYER %(first_name)s %(family_name)s: %(error)s" % {
-        #             "first_name": contact["Vorname"],
-        #             "family_name": contact["Nachname"],
-        #             "error": str(e)})
-        #     try:
-        #         if not dryrun:
-        #             output_invoice = create_invoice(contact=contact, dryrun=dryrun)
-        #             print("created invoice in easyVerein: %(invoice)s" % {"invoice": output_invoice})
-        #             save_billing_to_alltime(firstName=contact["Vorname"], lastName=contact["Nachname"],
-        #                                     # CB raw csv wird ergänzt
-        #                                     df_cleaned_buchungen=df_todo_raw,
-        #                                     csv_buchungen_alltime=df_alltime)
-        #             print("SAVED BILLINGS FOR PLAYER %(first_name)s %(family_name)s TO ALLTIME TABLE!" % {
-        #                 "first_name": contact["Vorname"],
-        #                 "family_name": contact["Nachname"]})
-        #     except KeyError as e:
-        #         print(
-        #             "ERROR WHILE CREATING INVOICE FOR GUESTPLAYER %(first_name)s %(family_name)s: %(error)s - Missing information in easyVerein!" % {
-        #                 "first_name": contact["Vorname"],
-        #                 "family_name": contact["Nachname"],
-        #                 "error": str(e)})
-        #     except EasyvereinAPIException as e:
-        #         print(
-        #             "ERROR WHILE CREATING INVOICE FOR GUESTPLAYER %(first_name)s %(family_name)s: %(error)s" % {
-        #                 "first_name": contact["Vorname"],
-        #                 "family_name": contact["Nachname"],
-        #                 "error": str(e)})
+                result = future.result()
+            except Exception as e:  # z.B. abgestürzter Prozess
+                result = {"tenant": futures[future], "report_path": None, "log_path": None, "report": None,
+                          "error_type": type(e).__name__, "error": str(e)}
+            results.append(result)
+            if result["report"] is None:
+                print("TENANT %(tenant)s FAILED: %(error_type)s %(error)s, see %(log_path)s" % result)
+            else:
+                print("TENANT %(tenant)s DONE: %(players)s players %(status)s, log %(log_path)s" % dict(
+                    result, players=result["report"]["results"]["players"],
+                    status=result["report"]["results"]["status"]))
+    merged = merge_tenant_reports(sorted(results, key=lambda result: result["tenant"]))
+    merged.update(started_at=started_at.isoformat(timespec='seconds'), config=os.path.abspath(config_path),
+                  wall_seconds=(dt.datetime.now() - started_at).total_seconds())
+    _atomic_write_json(merged, report_path)
+    print("TENANTS: %(tenants)s run, %(failed)s failed, %(players)s players, %(calls)s API calls" % {
+        "tenants": merged["totals"]["tenants"], "failed": len(merged["totals"]["failed"]),
+        "players": merged["totals"]["players"], "calls": merged["totals"]["api_totals"].get("calls", 0)})
+    print("WROTE TENANTS REPORT TO %(path)s" % {"path": report_path})
+    return merged
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Datenmigration Courtbooking -> easyVerein")
+    subparsers = parser.add_subparsers(dest='command')
+    parser_compact = subparsers.add_parser('compact-ledger', help="remove duplicate rows from the alltime ledger")
+    parser_compact.add_argument('csv_buchungen_alltime', help="path of Gesamtübersicht csv")
+    parser_compact.add_argument('--backend', choices=sorted(LEDGER_BACKENDS), default='csv')
+    parser_compare = subparsers.add_parser('compare-ingestion',
+                                           help="compare time and memory of the csv ingestion against the old path")
+    parser_compare.add_argument('csv_buchungen')
+    parser_compare.add_argument('csv_mitglieder')
+    parser_snapshot = subparsers.add_parser('refresh-snapshot',
+                                            help="download all contacts and the last invoice number for offline "
+                                                 "dryruns")
+    parser_snapshot.add_argument('csv_file_path', help="directory of the snapshot (with trailing slash)")
+    parser_rebuild = subparsers.add_parser('rebuild-ledger',
+                                           help="add bookings that easyVerein already billed this year to the alltime "
+                                                "ledger")
+    parser_rebuild.add_argument('csv_file_path', help="directory of the csvs (with trailing slash)")
+    parser_rebuild.add_argument('filename_buchungen')
+    parser_rebuild.add_argument('buchungen_alltime')
+    parser_rebuild.add_argument('--backend', choices=sorted(LEDGER_BACKENDS), default='csv')
+    parser_rebuild.add_argument('--dryrun', action='store_true')
+    parser_tenants = subparsers.add_parser('run-tenants', help="bill several clubs in parallel from a JSON config")
+    parser_tenants.add_argument('config', help="JSON config of the tenants, see load_tenant_config")
+    parser_tenants.add_argument('--max-processes', type=int, default=None)
+    parser_tenants.add_argument('--report', default=None, help="path of the merged report")
+    args = parser.parse_args()
+
+    if args.command == 'compact-ledger':
+        compact_ledger(csv_buchungen_alltime=args.csv_buchungen_alltime, backend=args.backend)
+        sys.exit(0)
+    if args.command == 'compare-ingestion':
+        compare_ingestion(csv_buchungen=args.csv_buchungen, csv_mitglieder=args.csv_mitglieder)
+        sys.exit(0)
+    if args.command == 'refresh-snapshot':
+        refresh_snapshot(csv_file_path=args.csv_file_path)
+        sys.exit(0)
+    if args.command == 'rebuild-ledger':
+        rebuild_ledger(csv_file_path=args.csv_file_path, filename_buchungen=args.filename_buchungen,
+                       buchungen_alltime=args.buchungen_alltime, backend=args.backend, dryrun=args.dryrun)
+        sys.exit(0)
+    if args.command == 'run-tenants':
+        merged = run_tenants(config_path=args.config, max_processes=args.max_processes, report_path=args.report)
+        sys.exit(1 if merged["totals"]["failed"] else 0)
+
     main(csv_file_path='C:/Users/Megaport/Desktop/TCGrafrath/03_Datenstatus_CBvsEasyVerein/Getränke/',
          filename_buchungen='getraenkeliste.csv',
          filename_mitglieder='20240914_mitgliederliste.csv',
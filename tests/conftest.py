@@ -0,0 +1,213 @@
+"""
+Gemeinsame Fixtures: lädt datamigration_cb_ev-api.py als Modul und ersetzt ev_client durch einen In-Memory-Client,
+der jeden Aufruf mitschreibt und Fehler gezielt einspielen kann. Gespeichert werden die Modelle von python-easyverein,
+Filter werden wie vom Server angewendet.
+"""
+import datetime as dt
+import importlib.util
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('easyverein')
+
+from easyverein.core.exceptions import EasyvereinAPIException  # noqa: E402
+from easyverein.models.contact_details import ContactDetails  # noqa: E402
+from easyverein.models.invoice import Invoice  # noqa: E402
+from easyverein.models.invoice_item import InvoiceItem  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def pytest_collection_modifyitems(items):
+    # erst ab python-easyverein 2.6 haben Kontakte ihre contactDetailsGroups, ohne sie gibt es weder Mitglieder
+    # noch Gäste
+    if 'contactDetailsGroups' not in ContactDetails.model_fields:
+        skip = pytest.mark.skip(reason="python-easyverein < 2.6: ContactDetails has no contactDetailsGroups")
+        for item in items:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def mig():
+    return load_script('datamigration_cb_ev_api', 'datamigration_cb_ev-api.py')
+
+
+def api_error(status_code, message, retry_after=None):
+    """
+    EasyvereinAPIException wie von python-easyverein, mit status_code (und Retry-After bei 429)
+    """
+    exc = EasyvereinAPIException(message)
+    exc.status_code = status_code
+    if retry_after is not None:
+        exc.retry_after = retry_after
+    return exc
+
+
+FILTER_LOOKUPS = ('', 'in', 'not', 'gt', 'gte', 'lt', 'lte', 'isnull')
+
+
+def _filter_value(value):
+    """
+    Feldwert für den Vergleich mit einem Filter: Verweise (Modell, int, URL) werden zur id, alles andere zu str
+    """
+    if value is None:
+        return None
+    value = str(getattr(value, 'id', value))
+    return value.rstrip('/').rsplit('/', 1)[-1] if value.startswith('http') else value
+
+
+def filter_matches(obj, key, value) -> bool:
+    """
+    Wendet einen serialisierten Filter (wie ihn python-easyverein als Query schickt) auf ein gespeichertes Modell an
+    :raises NotImplementedError: Feld oder Lookup kennt das Modell nicht, statt den Filter still zu übergehen
+    """
+    field, _, lookup = key.partition('__')
+    if field not in type(obj).model_fields or lookup not in FILTER_LOOKUPS:
+        raise NotImplementedError("filter %(key)s on %(model)s" % {"key": key, "model": type(obj).__name__})
+    raw = getattr(obj, field)
+    if lookup == 'isnull':
+        return (raw is None) == value
+    values = {_filter_value(item) for item in raw} if isinstance(raw, list) else {_filter_value(raw)}
+    if lookup == '':
+        return _filter_value(value) in values
+    if lookup == 'in':
+        wanted = value.split(',') if isinstance(value, str) else value
+        return bool(values & {_filter_value(item) for item in wanted})
+    if lookup == 'not':
+        return _filter_value(value) not in values
+    current, value = _filter_value(raw), _filter_value(value)
+    if current is None:
+        return False
+    if current.isdigit() and value.isdigit():
+        current, value = int(current), int(value)
+    return {'gt': current > value, 'gte': current >= value, 'lt': current < value, 'lte': current <= value}[lookup]
+
+
+class FakeResource:
+    """
+    Ein Endpunkt von EasyvereinAPI im Speicher. Jeder Aufruf ist ein Request und landet in calls; in failures
+    eingetragene Exceptions werden beim nächsten passenden Aufruf geworfen, statt ihn auszuführen.
+    """
+
+    def __init__(self, client, name, model):
+        """
+        :param model: Modell, das der Endpunkt liefert, z.B. Invoice
+        """
+        self.client = client
+        self.endpoint_name = name
+        self.model = model
+        self.store = {}
+        self.failures = []  # (method, exception)
+
+    def _request(self, method):
+        self.client.calls.append((self.endpoint_name, method))
+        for i, (failing_method, exc) in enumerate(self.failures):
+            if failing_method == method:
+                del self.failures[i]
+                raise exc
+
+    def get(self, search=None, limit=10, page=1, query=None):
+        self._request('get')
+        filters = search.model_dump(exclude_unset=True, exclude_none=True) if search is not None else {}
+        objects = [obj for obj in self.store.values()
+                   if all(filter_matches(obj, key, value) for key, value in filters.items())]
+        return objects[(page - 1) * limit:page * limit], len(objects)
+
+    def create(self, obj):
+        self._request('create')
+        self.client.next_id += 1
+        created = self.model(**dict(obj.model_dump(exclude_unset=True), id=self.client.next_id))
+        self.store[created.id] = created
+        return created
+
+    def update(self, target, data):
+        self._request('update')
+        obj = self.store[target if isinstance(target, int) else target.id]
+        for key, value in data.model_dump(exclude_unset=True).items():
+            setattr(obj, key, value)
+        return obj
+
+    def add(self, **fields):
+        self.client.next_id += 1
+        obj = self.model(**dict(fields, id=self.client.next_id))
+        self.store[obj.id] = obj
+        return obj
+
+
+class FakeEasyverein:
+    def __init__(self):
+        self.calls = []
+        self.next_id = 0
+        self.contact_details = FakeResource(self, 'contact-details', ContactDetails)
+        self.invoice = FakeResource(self, 'invoice', Invoice)
+        self.invoice_item = FakeResource(self, 'invoice-item', InvoiceItem)
+
+    def count(self, endpoint, method):
+        return self.calls.count((endpoint, method))
+
+
+@pytest.fixture
+def ev(mig, monkeypatch):
+    client = FakeEasyverein()
+    monkeypatch.setattr(mig, 'ev_client', client)
+    monkeypatch.setattr(mig, 'rate_limiter', mig.RateLimiter(requests_per_minute=60000, burst=1000))
+    return client
+
+
+BUCHUNGEN_COLUMNS = ['Vorname', 'Nachname', 'Kaufdatum', 'Getränk', 'Anzahl', 'Preis', 'Gezahlt']
+BUCHUNGEN = [
+    ('Max', 'Müller', '01.06.2024 18:00', 'Bier', 2, '2,50', 'Nicht gezahlt'),
+    ('Max', 'Müller', '01.06.2024 18:00', 'Bier', 2, '2,50', 'Nicht gezahlt'),  # gleiche Buchung zweimal
+    ('Max', 'Müller', '02.06.2024 19:30', 'Spezi', 1, '1,80', 'Nicht gezahlt'),
+    ('Anna', 'Schmidt-Berg', '01.06.2024 17:10', 'Wasser', 3, '1,00', 'Nicht gezahlt'),
+    ('Anna', 'Schmidt-Berg', '03.06.2024 20:05', 'Radler', 1, '2,50', 'Gezahlt'),
+    ('Hans Peter', 'Maier', '02.06.2024 12:00', 'Kaffee', 2, '1,50', 'Nicht gezahlt'),
+    ('Eva', 'Gast', '02.06.2024 16:45', 'Bier', 1, '2,50', 'Nicht gezahlt'),
+    ('Max', 'Müller', '01.01.2024 10:00', 'Bier', 1, '2,50', 'Nicht gezahlt'),  # schon abgerechnet
+]
+MITGLIEDER = pd.DataFrame({'Vorname': ['Max', 'Anna', 'Hans Peter', 'Eva'],
+                           'Nachname': ['Müller', 'Schmidt-Berg', 'Maier', 'Gast'],
+                           'Geschlecht': ['Männlich', 'Weiblich', 'Männlich', 'Weiblich'],
+                           'PLZ': ['82269', '82269', '82256', None],
+                           'Telefonnummer': ['08144 / 123', None, None, None],
+                           'Handynummer': [None, None, None, None],
+                           'E-Mail': ['max@example.com', 'anna@example.com', 'hp@example.com', 'eva@example.com']})
+
+
+def write_buchungen(path, rows):
+    pd.DataFrame(rows, columns=BUCHUNGEN_COLUMNS).to_csv(path, sep=';', encoding='latin1', index=False)
+
+
+def read_alltime(path):
+    return pd.read_csv(path, sep=';', encoding='latin1')
+
+
+@pytest.fixture
+def club(mig, ev, tmp_path):
+    """
+    Kleiner Verein in tmp_path: Buchungen, Mitgliederliste, Gesamtübersicht mit einer abgerechneten Buchung und drei
+    Kontakte in easyVerein (Eva Gast hat keinen). Liefert die Argumente für main.
+    """
+    write_buchungen(tmp_path / 'getraenkeliste.csv', BUCHUNGEN)
+    MITGLIEDER.to_csv(tmp_path / 'mitgliederliste.csv', sep=';', encoding='latin1', index=False)
+    write_buchungen(tmp_path / 'alltime.csv', BUCHUNGEN[-1:])
+    group = mig.CONTACT_GROUP_URL % {"version": "v2.0", "id": mig.GROUP_ID_MITGLIED}
+    for vorname, nachname, plz in (('Max', 'Müller', '82269'), ('Anna', 'Schmidt-Berg', '82269'),
+                                   ('Hans Peter', 'Maier', '82256')):
+        ev.contact_details.add(firstName=vorname, familyName=nachname, zip=plz,
+                               salutation='Herr', street='Hauptstraße 1', city='Grafrath', methodOfPayment=2,
+                               contactDetailsGroups=[group])
+    return dict(csv_file_path=str(tmp_path) + os.sep, filename_buchungen='getraenkeliste.csv',
+                filename_mitglieder='mitgliederliste.csv', buchungen_alltime='alltime.csv',
+                completion_date=dt.date(2024, 6, 30), max_workers=1)
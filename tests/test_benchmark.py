@@ -0,0 +1,79 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import load_script
+
+STAGES = ['ingest', 'doublecheck', 'grouping', 'member merge', 'fuzzy match', 'invoice build', 'submit']
+
+
+@pytest.fixture(scope='module')
+def bench():
+    return load_script('benchmark_cb_ev_api', 'benchmark_cb_ev-api.py')
+
+
+class OlderRelease:
+    """
+    Sicht auf das Modul, in der die Namen aus missing fehlen wie in einer älteren Version
+    """
+
+    def __init__(self, module, missing):
+        object.__setattr__(self, 'module', module)
+        object.__setattr__(self, 'missing', missing)
+
+    def __getattr__(self, name):
+        if name in self.missing:
+            raise AttributeError(name)
+        return getattr(self.module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.module, name, value)
+
+
+def test_counts_are_compared_as_counts(bench):
+    baseline = {'results': {'1k': {'ingest': 0.010, 'submit': 2.0, 'api requests': 400, 'api rate limited': 0}}}
+    report = {'results': {'1k': {'ingest': 0.019, 'submit': 2.1, 'api requests': 401, 'api rate limited': 3}}}
+
+    found = bench.compare_with_baseline(report, baseline, threshold=1.25, min_delta=0.05)
+
+    # ingest ist fast doppelt so lang, aber unter min_delta; die Anzahl zählt ohne Sekunden-Schwelle
+    assert found == [('1k', 'api requests', 400, 401), ('1k', 'api rate limited', 0, 3)]
+    # 429 ohne welche in der Baseline bleiben eine Regression
+    assert bench.compare_with_baseline(report, baseline, threshold=1.25, count_threshold=1.5) == [
+        ('1k', 'api rate limited', 0, 3)]
+
+
+@pytest.mark.parametrize('missing, stages', [
+    ((), STAGES),
+    (('ContactMatchIndex', 'InvoiceBatchBuilder'), [stage for stage in STAGES if stage != 'fuzzy match']),
+])
+def test_run_stages_times_older_releases(bench, mig, monkeypatch, tmp_path, missing, stages):
+    monkeypatch.setattr(mig, 'ev_client', None)
+    monkeypatch.setattr(mig, 'rate_limiter', mig.RateLimiter(requests_per_minute=60000, burst=1000))
+    dataset = bench.write_dataset(str(tmp_path), 500)
+
+    with bench.MockEasyvereinServer() as server:
+        server.add('contact-details', dataset['contacts'])
+        timings = bench.run_stages(OlderRelease(mig, missing), server, dataset, str(tmp_path), max_submit=5)
+
+    assert list(timings) == stages
+    assert len(server.store['invoice']) == 5
+
+
+def test_mock_server_applies_filters(bench):
+    invoice_url = 'https://easyverein.com/api/v2.0/invoice/%s'
+    with bench.MockEasyvereinServer() as server:
+        server.add('invoice', [{'id': i, 'invNumber': str(1000 + i)} for i in range(1, 6)])
+        server.add('invoice-item', [{'id': 10 + i, 'relatedInvoice': invoice_url % (i % 5 + 1)} for i in range(20)])
+
+        def get(path):
+            with urllib.request.urlopen(server.url + 'v2.0/' + path) as response:
+                return json.load(response)
+
+        assert [obj['id'] for obj in get('invoice?invNumber__in=1002,1004')['results']] == [2, 4]
+        assert get('invoice-item?relatedInvoice=3&limit=2')['count'] == 4
+        assert [obj['id'] for obj in get('invoice?id__gt=3')['results']] == [4, 5]
+        with pytest.raises(urllib.error.HTTPError, match='400'):
+            get('invoice-item?relatedInvoice__contains=3')
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+
+def members(*names, plz='82269'):
+    return pd.DataFrame({'Vorname': [vorname for vorname, _ in names], 'Nachname': [nachname for _, nachname in names],
+                         'plz': plz, 'Gruppe': 'Mitglied'})
+
+
+def match(mig, contacts, players):
+    return mig.ContactMatchIndex(contacts).match(players)
+
+
+@pytest.mark.parametrize('player, contact', [
+    (('Alexandra', 'Hoffmann-Steiner'), ('Alexander', 'Hoffmann-Steiner')),
+    (('Maximiliane', 'Schneider'), ('Maximilian', 'Schneider')),
+    (('Max', 'Müller'), ('Max', 'Möller')),
+])
+def test_near_misses_are_only_candidates(mig, player, contact):
+    matches = match(mig, members(contact), members(player))
+
+    assert matches['_match_status'].tolist() == ['ambiguous']
+    assert matches['_contact'].tolist() == [-1]
+    assert matches['_match_candidates'].iloc[0] == ['%s %s (82269)' % contact]
+
+
+@pytest.mark.parametrize('player, contact', [
+    (('Hans-Peter', 'Müller'), ('Hans Peter', 'Mueller')),
+    (('marie luise', 'WEISS'), ('Marie-Luise', 'Weiß')),
+    (('Hanspeter', 'Maier'), ('Hans Peter', 'Maier')),
+])
+def test_spelling_variants_of_the_same_name_are_confident(mig, player, contact):
+    matches = match(mig, members(contact, ('Anna', 'Schmidt')), members(player))
+
+    assert matches['_match_status'].tolist() == ['confident']
+    assert matches['_contact'].tolist() == [0]
+
+
+def test_a_contact_is_never_given_to_two_players(mig):
+    matches = match(mig, members(('Hans Peter', 'Maier')), members(('Hans-Peter', 'Maier'), ('Hans Peter', 'Maier')))
+
+    assert matches['_match_status'].tolist() == ['ambiguous', 'ambiguous']
+    assert matches['_contact'].tolist() == [-1, -1]
+
+
+def test_duplicate_contacts_are_ambiguous(mig):
+    matches = match(mig, members(('Max', 'Müller'), ('Max', 'Mueller')), members(('Max', 'Müller')))
+
+    assert matches['_match_status'].tolist() == ['ambiguous']
+    assert len(matches['_match_candidates'].iloc[0]) == 2
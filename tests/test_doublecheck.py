@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import BUCHUNGEN_COLUMNS, read_alltime, write_buchungen
+
+
+def baseline_doublecheck(df_not_paid, df_alltime):
+    """
+    doublecheck_billing vor dem Fingerprint-Index: Merge über alle Spalten
+    """
+    df_not_paid, df_alltime = df_not_paid.copy(), df_alltime.copy()
+    for col in df_not_paid.columns:
+        if df_not_paid[col].dtype != df_alltime[col].dtype:
+            df_not_paid[col] = df_not_paid[col].astype(str)
+            df_alltime[col] = df_alltime[col].astype(str)
+    return df_not_paid.merge(df_alltime, how='outer', indicator=True).query('_merge == "left_only"').drop(
+        columns=['_merge'])
+
+
+def random_bookings(n, seed):
+    rng = np.random.default_rng(seed)
+    return [(rng.choice(['Max', 'Anna', 'Hans Peter', 'Eva']), rng.choice(['Müller', 'Schmidt-Berg', 'Maier']),
+             '%02d.06.2024 %02d:00' % (rng.integers(1, 4), rng.integers(17, 20)),
+             rng.choice(['Bier', 'Spezi', 'Wasser']), int(rng.integers(1, 3)), rng.choice(['1,00', '2,50']),
+             'Nicht gezahlt') for _ in range(n)]
+
+
+@pytest.fixture
+def bookings(tmp_path):
+    """
+    Offene Buchungen und Gesamtübersicht wie aus den CSVs gelesen: viele gleiche Buchungen, ein Teil abgerechnet
+    """
+    rows = random_bookings(400, seed=1)
+    write_buchungen(tmp_path / 'alltime.csv', rows[:150] + random_bookings(100, seed=2))
+    write_buchungen(tmp_path / 'open.csv', rows[100:])
+    return read_alltime(tmp_path / 'open.csv'), read_alltime(tmp_path / 'alltime.csv')
+
+
+def rows_of(df):
+    return sorted(df[BUCHUNGEN_COLUMNS].astype(str).values.tolist())
+
+
+def weak_hash(mig, monkeypatch):
+    """
+    hash von booking_fingerprints nimmt nur noch 4 Werte an: fast jede Buchung kollidiert mit einer abgerechneten
+    """
+    hash_array = pd.util.hash_array
+
+    def colliding(values, **kwargs):
+        return hash_array(values, **kwargs) if kwargs else hash_array(values) % np.uint64(4)
+
+    monkeypatch.setattr(mig.pd.util, 'hash_array', colliding)
+
+
+@pytest.mark.parametrize('collisions', [False, True])
+def test_index_finds_the_same_duplicates_as_the_baseline(mig, bookings, monkeypatch, collisions):
+    df_not_paid, df_alltime = bookings
+    if collisions:
+        weak_hash(mig, monkeypatch)
+
+    df_open = mig.doublecheck_billing(df_not_paid, index=mig.FingerprintIndex.from_frame(df_alltime))
+
+    assert 0 < len(df_open) < len(df_not_paid)
+    assert rows_of(df_open) == rows_of(baseline_doublecheck(df_not_paid, df_alltime))
+
+
+@pytest.mark.parametrize('stale', ['signature', '64-bit'])
+def test_stale_npz_index_is_rebuilt_from_the_ledger(mig, bookings, tmp_path, capsys, stale):
+    df_not_paid, df_alltime = bookings
+    with mig.open_ledger(str(tmp_path / 'alltime.csv')) as ledger:
+        index = mig.FingerprintIndex.for_ledger(ledger)
+        index.add(mig.booking_fingerprints(df_not_paid))  # Stand, der nicht (mehr) zum Ledger passt
+        if stale == 'signature':
+            index.save(signature='0:0')
+        else:  # Index einer Version mit 64-bit Fingerprints
+            np.savez(index.path, fingerprints=mig.booking_fingerprints(df_not_paid)['hash'],
+                     signature=np.array(ledger.signature()))
+        capsys.readouterr()
+
+        rebuilt = mig.FingerprintIndex.for_ledger(ledger)
+
+    assert 'REBUILDING FINGERPRINT INDEX' in capsys.readouterr().out
+    assert rows_of(mig.doublecheck_billing(df_not_paid, index=rebuilt)) == rows_of(
+        baseline_doublecheck(df_not_paid, df_alltime))
+
+
+def test_saved_index_is_reused_while_the_ledger_is_unchanged(mig, bookings, tmp_path, capsys):
+    df_not_paid, df_alltime = bookings
+    with mig.open_ledger(str(tmp_path / 'alltime.csv')) as ledger:
+        mig.FingerprintIndex.for_ledger(ledger).save(signature=ledger.signature())
+        capsys.readouterr()
+
+        index = mig.FingerprintIndex.for_ledger(ledger)
+
+    assert 'REBUILDING' not in capsys.readouterr().out
+    assert rows_of(mig.doublecheck_billing(df_not_paid, index=index)) == rows_of(
+        baseline_doublecheck(df_not_paid, df_alltime))
+
+
+def test_dryrun_does_not_save_the_index(mig, club, tmp_path):
+    mig.main(dryrun=True, contacts_ttl_hours=0, trace_memory=False, **club)
+
+    assert not (tmp_path / 'alltime.fingerprints.npz').exists()
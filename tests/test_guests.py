@@ -0,0 +1,8 @@
+def test_new_guest_lands_in_the_guest_group_the_contacts_are_read_with(mig, ev):
+    contact = {"Vorname": 'Eva', "Nachname": 'Gast', "E-Mail": 'eva@example.com', "Anrede": 'Frau', "plz": '82269'}
+
+    mig.create_guestplayer(contact)
+
+    (guest,) = ev.contact_details.store.values()
+    contact_groups = mig.TenantConfig.resolve().contact_groups
+    assert [contact_groups.get(str(group)) for group in guest.contactDetailsGroups] == ['Gast']
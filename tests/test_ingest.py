@@ -0,0 +1,95 @@
+import datetime as dt
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import BUCHUNGEN, MITGLIEDER, write_buchungen
+
+
+def values(series):
+    return [None if pd.isna(value) else value for value in series]
+
+
+def test_typed_ingest_matches_the_legacy_path(mig, tmp_path):
+    write_buchungen(tmp_path / 'getraenkeliste.csv', BUCHUNGEN)
+    MITGLIEDER.to_csv(tmp_path / 'mitgliederliste.csv', sep=';', encoding='latin1', index=False)
+    paths = str(tmp_path / 'getraenkeliste.csv'), str(tmp_path / 'mitgliederliste.csv')
+
+    legacy_raw, legacy, legacy_mitglieder = mig._legacy_ingest(*paths)
+    typed_raw, typed, typed_mitglieder = mig._typed_ingest(*paths)
+
+    assert typed_raw.astype(str).values.tolist() == legacy_raw.astype(str).values.tolist()
+    for column in ['_Kaufdatum', '_Preis', 'Anzahl']:
+        assert typed[column].tolist() == legacy[column].tolist()
+    for column in ['Anrede', 'plz', 'Telefonnummer', 'Handynummer']:
+        assert values(typed_mitglieder[column]) == values(legacy_mitglieder[column])
+
+
+def baseline_clean_buchungen(df):
+    """
+    clean_buchungen vor der Umstellung auf die .str-Accessoren, Zeile für Zeile
+    """
+    doc_list = []
+    for doc in df.to_dict(orient='records'):
+        doc["Buchungszeit"] = doc["_Datum"].date().strftime(format='%d.%m.%Y') + " " + doc["_Von"].isoformat()
+        doc["Spieler_cleaned"] = doc["Spieler"].replace("  ", " ").replace("; ", ";").replace(" ;", ";")
+        doc["Zahler"] = doc["Spieler_cleaned"].split(";")[0]
+        match = re.match(r"^(\S+)\s+(.+)$", doc["Zahler"])
+        doc["Vorname"] = match.groups()[0].replace('- ', '-')
+        doc["Nachname"] = match.groups()[1].replace('- ', '-')
+        doc["Nichtzahler"] = doc["Spieler_cleaned"].split(";")[1]
+        doc_list.append(doc)
+    return pd.DataFrame(doc_list)
+
+
+def court_bookings(spieler, preise=None):
+    return pd.DataFrame({"_Datum": pd.to_datetime(['2024-06-0%s' % (i % 9 + 1) for i in range(len(spieler))]),
+                         "_Von": [dt.time(8 + i % 12, 30) for i in range(len(spieler))],
+                         "Spieler": pd.Series(spieler, dtype=object),
+                         "Preis": preise if preise is not None else [5.0] * len(spieler)})
+
+
+VALID_SPIELER = {
+    'plain': ['Max Müller; Anna Schmidt', 'Eva Gast;Hans Maier'],
+    'double spaces': ['Max  Müller ; Anna  Schmidt', 'Eva Gast  ;Hans Maier'],
+    'hyphens': ['Marie- Luise Schmidt- Berg; Gast', 'Max Müller-  Lüdenscheidt;Anna', 'Hans-Peter Maier;Eva- Maria'],
+    'several co-players': ['Max Müller; Anna Schmidt; Eva Gast'],
+}
+MALFORMED_SPIELER = ['Max; Anna Schmidt', 'Max Müller', None, '; Anna Schmidt']
+
+
+@pytest.mark.parametrize('spieler', VALID_SPIELER.values(), ids=VALID_SPIELER.keys())
+@pytest.mark.parametrize('preise', [None, 'nan'])
+def test_clean_buchungen_matches_the_per_row_baseline(mig, spieler, preise):
+    df = court_bookings(spieler, preise=[np.nan] * len(spieler) if preise else None)
+
+    cleaned, malformed = mig.clean_buchungen(df, return_malformed=True)
+
+    pd.testing.assert_frame_equal(cleaned, baseline_clean_buchungen(df), check_dtype=False)
+    assert malformed.empty and list(malformed.columns) == list(df.columns)
+
+
+@pytest.mark.parametrize('bad', MALFORMED_SPIELER)
+def test_malformed_spieler_goes_to_the_side_frame(mig, bad, capsys):
+    df = court_bookings(['Max Müller; Anna Schmidt', bad, 'Eva Gast;Hans Maier'], preise=[5.0, np.nan, np.nan])
+    with pytest.raises((AttributeError, IndexError, TypeError)):
+        baseline_clean_buchungen(df.iloc[[1]])
+
+    cleaned, malformed = mig.clean_buchungen(df, return_malformed=True)
+
+    pd.testing.assert_frame_equal(cleaned, baseline_clean_buchungen(df.iloc[[0, 2]]).set_index(pd.Index([0, 2])),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(malformed, df.iloc[[1]])
+    assert 'ACHTUNG 1 BUCHUNGEN' in capsys.readouterr().out
+
+
+def test_clean_buchungen_of_an_empty_export(mig):
+    df = court_bookings([])
+
+    cleaned, malformed = mig.clean_buchungen(df, return_malformed=True)
+
+    assert cleaned.empty and malformed.empty
+    assert list(cleaned.columns) == list(df.columns) + ['Buchungszeit', 'Spieler_cleaned', 'Zahler', 'Vorname',
+                                                        'Nachname', 'Nichtzahler']
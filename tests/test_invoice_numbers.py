@@ -0,0 +1,92 @@
+import pytest
+
+from conftest import api_error
+
+
+def allocator_at(mig, numbers):
+    """
+    Allocator, dessen Abruf der höchsten Nummer nacheinander die Werte aus numbers liefert
+    """
+    numbers = iter(numbers)
+    return mig.InvoiceNumberAllocator(current_year=2024, fetch_current_invoice_nr=lambda current_year: next(numbers))
+
+
+def unnumbered_payload(mig):
+    return (mig.InvoiceCreate(totalPrice=2.5, relatedAddress=1),
+            [mig.InvoiceItem(title='Getränkebuchung am 01.06.2024', quantity=1, unitPrice=2.5)])
+
+
+def test_numbers_are_counted_locally_after_one_sync(mig):
+    allocator = allocator_at(mig, [630])
+    assert [allocator.next() for _ in range(3)] == ['2024-631', '2024-632', '2024-633']
+    assert allocator.reserve(2) == ['2024-634', '2024-635']
+    assert allocator.syncs == 1
+
+
+def test_released_numbers_are_handed_out_first(mig):
+    allocator = allocator_at(mig, [0])
+    first, second, third = allocator.reserve(3)
+    allocator.release(second)
+    allocator.release(first)
+    allocator.release('2023-1')  # anderes Jahr
+    assert [allocator.next() for _ in range(3)] == [first, second, '2024-4']
+
+
+def test_resync_forgets_released_numbers_taken_in_the_meantime(mig):
+    allocator = allocator_at(mig, [0, 2])
+    allocator.reserve(3)
+    allocator.release('2024-2')
+    allocator.release('2024-3')
+    allocator.resync()
+    assert allocator.next() == '2024-3'
+    assert allocator.next() == '2024-4'
+
+
+@pytest.mark.parametrize('message, duplicate', [
+    ('{"invNumber": ["invoice with this inv number already exists."]}', True),
+    ('Rechnungsnummer existiert bereits', True),
+    ('{"invNumber": ["Ensure this field has no more than 20 characters."]}', False),
+    ('{"invNumber": ["This field is required."]}', False),
+    ('invoice item already exists', False),
+])
+def test_only_the_real_duplicate_error_counts(mig, message, duplicate):
+    assert mig.is_duplicate_invoice_nr(api_error(400, message)) is duplicate
+
+
+def test_rejected_invoice_gives_its_number_back(mig, ev):
+    allocator = allocator_at(mig, [0])
+    ev.invoice.failures.append(('create', api_error(400, '{"totalPrice": ["A valid number is required."]}')))
+    journal = []
+
+    with pytest.raises(mig.EasyvereinAPIException):
+        mig.create_invoice(contact=None, completion_date=None, allocator=allocator, payload=unnumbered_payload(mig),
+                           on_built=lambda invoice: journal.append(invoice.invNumber))
+    output = mig.create_invoice(contact=None, completion_date=None, allocator=allocator,
+                                payload=unnumbered_payload(mig))
+
+    assert journal == ['2024-1', None]
+    assert output.invNumber == '2024-1'
+    assert allocator.known_invoice_nr == 1
+
+
+def test_duplicate_number_resyncs_once(mig, ev):
+    allocator = allocator_at(mig, [0, 5])
+    ev.invoice.failures.append(('create', api_error(400, '{"invNumber": ["invoice with this inv number already '
+                                                         'exists."]}')))
+
+    output = mig.create_invoice(contact=None, completion_date=None, allocator=allocator,
+                                payload=unnumbered_payload(mig))
+
+    assert output.invNumber == '2024-6'
+    assert allocator.syncs == 2
+    assert len(ev.invoice.store) == 1
+
+
+def test_floor_still_syncs_with_easyverein(mig):
+    behind = allocator_at(mig, [10])
+    behind.floor(4)  # Journal älter als easyVerein
+    ahead = allocator_at(mig, [10])
+    ahead.floor(12)  # Nummern im Journal, die easyVerein evtl. nie erreicht haben
+
+    assert (behind.next(), ahead.next()) == ('2024-11', '2024-13')
+    assert behind.syncs == ahead.syncs == 1
@@ -0,0 +1,128 @@
+import datetime as dt
+import sqlite3
+
+import pytest
+
+from conftest import read_alltime
+
+
+class Crash(BaseException):
+    """
+    Abbruch des Prozesses, z.B. Strg+C oder ein Kill mitten im Lauf
+    """
+
+
+def invoice_numbers(ev):
+    return sorted(invoice.invNumber for invoice in ev.invoice.store.values())
+
+
+def seed_invoices(ev, count):
+    for i in range(1, count + 1):
+        ev.invoice.add(invNumber='2024-%s' % i, totalPrice=2.5, relatedAddress=i)
+
+
+def test_find_invoice_filters_by_number(mig, ev):
+    seed_invoices(ev, 250)
+
+    assert mig.find_invoice('2024-240').invNumber == '2024-240'
+    assert mig.find_invoice('2024-251') is None
+    assert ev.count('invoice', 'get') == 2
+
+
+def test_find_invoice_pages_through_a_server_that_ignores_the_filter(mig, ev, monkeypatch):
+    seed_invoices(ev, 250)
+    get = ev.invoice.get
+    monkeypatch.setattr(ev.invoice, 'get', lambda search=None, **kwargs: get(**kwargs))
+
+    assert mig.find_invoice('2024-240').invNumber == '2024-240'
+    assert mig.find_invoice('2024-251') is None
+
+
+@pytest.mark.parametrize('journalled, found', [
+    ({"totalPrice": 2.5, "relatedAddress": 140}, True),
+    ({"totalPrice": 2.5, "relatedAddress": 7}, False),  # Nummer gehört zur Rechnung eines anderen Kontakts
+    ({"totalPrice": 9.0, "relatedAddress": 140}, False),
+    ({"totalPrice": 2.5, "relatedAddress": None}, True),  # Journal einer älteren Version
+])
+def test_in_flight_invoice_must_match_number_price_and_contact(mig, ev, journalled, found):
+    seed_invoices(ev, 150)
+
+    assert mig.reconcile_in_flight(dict(journalled, state='built', invNumber='2024-140')) is found
+
+
+def test_journal_of_an_older_version_gets_the_contact_column(mig, tmp_path):
+    path = str(tmp_path / mig.RUN_JOURNAL_FILENAME)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE journal (key TEXT PRIMARY KEY, Vorname TEXT, Nachname TEXT, state TEXT NOT NULL, '
+                 'invNumber TEXT, totalPrice REAL, updated_at TEXT NOT NULL)')
+    conn.execute("INSERT INTO journal VALUES ('k', 'Max', 'Müller', 'built', '2024-1', 2.5, '2024-06-30')")
+    conn.commit()
+    conn.close()
+
+    journal = mig.RunJournal(path)
+    assert journal.get('k')["relatedAddress"] is None
+    journal.mark('k', 'built', invoice=mig.InvoiceCreate(invNumber='2024-1', totalPrice=2.5,
+                                                         relatedAddress='https://easyverein.com/api/v2.0/'
+                                                                        'contact-details/5'))
+    journal.close()
+
+    assert mig.RunJournal(path).get('k')["relatedAddress"] == 5
+
+
+def test_crash_before_the_ledger_write_resumes_without_a_second_invoice(mig, club, ev, tmp_path, monkeypatch):
+    save_billing_to_alltime = mig.save_billing_to_alltime
+
+    def crashing_save(firstName, lastName, **kwargs):
+        if firstName == 'Hans Peter':
+            raise Crash()
+        save_billing_to_alltime(firstName=firstName, lastName=lastName, **kwargs)
+
+    monkeypatch.setattr(mig, 'save_billing_to_alltime', crashing_save)
+    with pytest.raises(Crash):
+        mig.main(contacts_ttl_hours=0, **club)
+    monkeypatch.setattr(mig, 'save_billing_to_alltime', save_billing_to_alltime)
+    created = invoice_numbers(ev)
+
+    df_results = mig.main(contacts_ttl_hours=0, **club)
+
+    # Anna steht seit dem ersten Lauf im Ledger, Hans Peters Rechnung existiert schon
+    assert dict(zip(df_results["Vorname"], df_results["status"])) == {
+        'Hans Peter': 'resumed', 'Max': 'ledgered', 'Eva': 'skipped'}
+    max_invoice = df_results.loc[df_results["Vorname"] == 'Max', "invNumber"].iloc[0]
+    assert invoice_numbers(ev) == sorted(created + [max_invoice])
+    assert (read_alltime(tmp_path / 'alltime.csv')["Vorname"] == 'Hans Peter').sum() == 1
+    assert len(mig.RunJournal(str(tmp_path / mig.RUN_JOURNAL_FILENAME))) == 0
+
+
+def test_invoice_that_arrived_before_the_crash_is_not_sent_again(mig, club, ev, monkeypatch):
+    create = ev.invoice.create
+
+    def create_then_crash(obj):
+        create(obj)
+        raise Crash()  # Rechnung ist angelegt, die Antwort kommt nie an
+
+    monkeypatch.setattr(ev.invoice, 'create', create_then_crash)
+    with pytest.raises(Crash):
+        mig.main(contacts_ttl_hours=0, **club)
+    monkeypatch.setattr(ev.invoice, 'create', create)
+    first = invoice_numbers(ev)
+
+    df_results = mig.main(contacts_ttl_hours=0, **club)
+
+    assert df_results.loc[df_results["Vorname"] == 'Anna', "status"].iloc[0] == 'resumed'
+    assert first == ['%s-1' % dt.datetime.now().year]
+    assert len(ev.invoice.store) == 3
+
+
+def test_stale_journal_entries_expire_and_do_not_seed_the_numbers(mig, club, ev, tmp_path, capsys):
+    year = dt.datetime.now().year
+    journal = mig.RunJournal(str(tmp_path / mig.RUN_JOURNAL_FILENAME))
+    journal.mark('gone', 'submitted', contact={"Vorname": 'Otto', "Nachname": 'Alt'},
+                 invoice=mig.InvoiceCreate(invNumber='%s-50' % year, totalPrice=9.0, relatedAddress=99))
+    journal.close()
+
+    mig.main(contacts_ttl_hours=0, **club)
+
+    assert invoice_numbers(ev) == ['%s-%s' % (year, i) for i in (1, 2, 3)]
+    assert 'INVOICE %s-50 FOR PLAYER Otto Alt EXISTS' % year in capsys.readouterr().out
+    assert len(mig.RunJournal(str(tmp_path / mig.RUN_JOURNAL_FILENAME))) == 0
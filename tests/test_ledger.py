@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+
+from conftest import BUCHUNGEN, BUCHUNGEN_COLUMNS, read_alltime, write_buchungen
+
+
+def rows(selection):
+    return pd.DataFrame([BUCHUNGEN[i] for i in selection], columns=BUCHUNGEN_COLUMNS)
+
+
+def test_ledger_base_class_is_abstract(mig, tmp_path):
+    with pytest.raises(TypeError):
+        mig.Ledger(str(tmp_path / 'ledger'))
+
+
+@pytest.mark.parametrize('backend', ['csv', 'jsonl', 'sqlite'])
+def test_appended_rows_survive_reopening_and_export_like_the_csv(mig, tmp_path, backend):
+    alltime = str(tmp_path / 'alltime.csv')
+    write_buchungen(alltime, BUCHUNGEN[-1:])
+    with mig.open_ledger(alltime, backend=backend, fsync_every=2) as ledger:
+        ledger.append(rows([0, 1, 2]))
+        ledger.append(rows([3]))
+        ledger.append(rows([]))
+
+    with mig.open_ledger(alltime, backend=backend) as ledger:
+        df = ledger.read()
+        ledger.export_csv(alltime)
+
+    expected = rows([7, 0, 1, 2, 3])
+    expected['Anzahl'] = expected['Anzahl'].astype('int64')
+    pd.testing.assert_frame_equal(df, read_alltime(alltime))
+    pd.testing.assert_frame_equal(df.astype({'Preis': str}), expected)
+
+
+@pytest.mark.parametrize('backend', ['csv', 'jsonl', 'sqlite'])
+def test_compact_removes_only_reappended_rows(mig, tmp_path, backend):
+    alltime = str(tmp_path / 'alltime.csv')
+    write_buchungen(alltime, [])
+    with mig.open_ledger(alltime, backend=backend) as ledger:
+        ledger.append(rows([0, 1, 2]))  # Max, mit zwei gleichen Buchungen
+        ledger.append(rows([3]))  # Anna
+        ledger.append(rows([0, 1, 2, 7]))  # Max im nächsten Lauf: alles erneut plus eine neue Buchung
+        ledger.append(rows([3]))
+
+        assert ledger.compact() == 4
+        df = ledger.read()
+
+    assert df.astype({'Preis': str}).values.tolist() == rows([0, 1, 2, 3, 7]).values.tolist()
+
+
+def test_dryrun_does_not_export_the_alltime_csv(mig, club, tmp_path):
+    before = (tmp_path / 'alltime.csv').read_bytes()
+
+    mig.main(dryrun=True, ledger_backend='sqlite', contacts_ttl_hours=0, trace_memory=False, **club)
+
+    assert (tmp_path / 'alltime.csv').read_bytes() == before
+
+
+@pytest.mark.parametrize('backend', ['jsonl', 'sqlite'])
+def test_read_only_ledger_reads_the_csv_without_creating_files(mig, tmp_path, backend):
+    alltime = str(tmp_path / 'alltime.csv')
+    write_buchungen(alltime, BUCHUNGEN[:2])
+
+    with mig.open_ledger(alltime, backend=backend, read_only=True) as ledger:
+        assert len(ledger.read()) == 2
+        with pytest.raises(ValueError, match='read-only'):
+            ledger.append(rows([3]))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['alltime.csv']
+
+
+@pytest.mark.parametrize('backend', ['jsonl', 'sqlite'])
+def test_read_only_ledger_leaves_an_existing_ledger_untouched(mig, tmp_path, backend):
+    alltime = str(tmp_path / 'alltime.csv')
+    write_buchungen(alltime, [])
+    with mig.open_ledger(alltime, backend=backend) as ledger:
+        ledger.append(rows([0, 3]))
+    ledger_file = tmp_path / ('alltime.' + backend)
+    before = ledger_file.read_bytes()
+
+    with mig.open_ledger(alltime, backend=backend, read_only=True) as ledger:
+        assert ledger.read()["Vorname"].tolist() == ['Max', 'Anna']
+        with pytest.raises(ValueError, match='read-only'):
+            ledger.export_csv(alltime)
+
+    assert ledger_file.read_bytes() == before
+
+
+@pytest.mark.parametrize('backend', ['jsonl', 'sqlite'])
+def test_dryrun_creates_no_ledger_file(mig, club, tmp_path, backend):
+    mig.main(dryrun=True, ledger_backend=backend, contacts_ttl_hours=0, trace_memory=False, **club)
+
+    assert not (tmp_path / ('alltime.' + backend)).exists()
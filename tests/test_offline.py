@@ -0,0 +1,23 @@
+import datetime as dt
+
+
+def test_offline_preview_after_an_online_dryrun_starts_at_the_server_number(mig, club, ev):
+    year = dt.datetime.now().year
+    ev.invoice.add(invNumber='%s-630' % year, totalPrice=10.0, date=dt.date(year, 1, 2))
+
+    online = mig.main(dryrun=True, **club)
+    offline = mig.main(offline=True, **club)
+
+    expected = ['%s-%s' % (year, nr) for nr in (631, 632, 633)]
+    assert sorted(online["invNumber"].dropna()) == expected
+    assert sorted(offline["invNumber"].dropna()) == expected
+
+
+def test_real_run_stores_the_last_number_it_sent(mig, club, ev, tmp_path):
+    year = dt.datetime.now().year
+
+    mig.main(**club)
+
+    snapshot = mig.ContactSnapshot(str(tmp_path / mig.CONTACT_SNAPSHOT_FILENAME))
+    assert snapshot.last_invoice_nr(current_year=year) == 3
+    assert len(ev.invoice.store) == 3
@@ -0,0 +1,88 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def baseline_group_purchases(df):
+    """
+    Gruppierung vor der PurchaseTable: zwei groupby-Aggregationen mit Listen je Kaufdatum und je Spieler
+    """
+    df = df.sort_values("_Kaufdatum", ascending=True)
+    df_grouped_all = df.groupby(['Vorname', 'Nachname', '_Kaufdatum']).agg(
+        {'Getränk': list, 'Anzahl': list, '_Preis': list}).reset_index()
+    return df_grouped_all.groupby(['Vorname', 'Nachname']).agg(
+        {'_Kaufdatum': list, 'Getränk': list, 'Anzahl': list, '_Preis': list}).reset_index()
+
+
+def baseline_players(df):
+    """
+    Je Spieler wie calculate_preis und create_invoice_items sie vorher gelesen haben: Summe und je Tag Kaufdatum,
+    Summe Anzahl, Summe Preis und Getränke (jedes nur einmal)
+    """
+    players = []
+    for row in baseline_group_purchases(df).to_dict(orient='records'):
+        days = [(kaufdatum, sum(anzahl), pytest.approx(sum(preis)), sorted(set(getraenke)))
+                for kaufdatum, anzahl, preis, getraenke in
+                zip(row['_Kaufdatum'], row['Anzahl'], row['_Preis'], row['Getränk'])]
+        players.append((row['Vorname'], row['Nachname'], pytest.approx(sum(sum(i) for i in row['_Preis'])), days))
+    return players
+
+
+def table_players(mig, df):
+    players = []
+    for row in mig.group_purchases(df).to_dict(orient='records'):
+        purchases = row['_purchases']
+        days = [(kaufdatum, anzahl, preis, sorted(getraenke.split(', ')))
+                for kaufdatum, anzahl, preis, getraenke in purchases.iter_days()]
+        players.append((row['Vorname'], row['Nachname'], mig.calculate_preis(purchases, art='Getränk'), days))
+    return players
+
+
+def bookings(rows):
+    return pd.DataFrame(rows, columns=['Vorname', 'Nachname', '_Kaufdatum', 'Getränk', 'Anzahl', '_Preis'])
+
+
+def random_bookings(n, seed):
+    rng = np.random.default_rng(seed)
+    return bookings([(str(rng.choice(['Max', 'Anna', 'Eva'])), str(rng.choice(['Müller', 'Maier'])),
+                      dt.date(2024, 6, int(rng.integers(1, 6))), str(rng.choice(['Bier', 'Spezi', 'Wasser'])),
+                      int(rng.integers(1, 4)), float(rng.choice([1.0, 2.5, 1.8]))) for _ in range(n)])
+
+
+CASES = {
+    'unsorted': random_bookings(300, seed=1),
+    'single row': bookings([('Max', 'Müller', dt.date(2024, 6, 3), 'Bier', 2, 5.0)]),
+    'single-row groups': bookings([('Max', 'Müller', dt.date(2024, 6, 3), 'Bier', 2, 5.0),
+                                   ('Anna', 'Maier', dt.date(2024, 6, 1), 'Spezi', 1, 2.5),
+                                   ('Max', 'Müller', dt.date(2024, 6, 1), 'Bier', 1, 2.5),
+                                   ('Anna', 'Maier', dt.date(2024, 6, 1), 'Spezi', 3, 7.5)]),
+    # Buchungen ohne Namen: groupby lässt die Gruppe weg, übrig bleibt ein Spieler bzw. keiner
+    'group without name': bookings([(None, 'Müller', dt.date(2024, 6, 2), 'Bier', 1, 2.5),
+                                    ('Eva', 'Maier', dt.date(2024, 6, 2), 'Wasser', 1, 1.0),
+                                    ('Eva', None, dt.date(2024, 6, 1), 'Bier', 1, 2.5)]),
+    'only groups without name': bookings([(None, 'Müller', dt.date(2024, 6, 2), 'Bier', 1, 2.5)]),
+    'empty': bookings([]),
+}
+
+
+@pytest.mark.parametrize('rows', CASES.values(), ids=CASES.keys())
+def test_purchase_table_matches_the_baseline_groupby(mig, rows):
+    assert table_players(mig, rows) == baseline_players(rows)
+
+
+def test_purchase_table_keeps_the_input_unchanged(mig):
+    rows = random_bookings(50, seed=2)
+    before = rows.copy()
+
+    mig.group_purchases(rows)
+
+    pd.testing.assert_frame_equal(rows, before)
+
+
+def test_empty_purchase_table_has_no_players(mig):
+    table = mig.PurchaseTable.from_bookings(CASES['empty'])
+
+    assert (len(table), len(table.day_offsets), table.player_total.tolist()) == (0, 0, [])
+    assert mig.group_purchases(CASES['empty']).columns.tolist() == ['Vorname', 'Nachname', '_purchases']
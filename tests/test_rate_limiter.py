@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import api_error
+
+
+def payload(mig, invNumber='2024-1', prices=(2.5, 1.8)):
+    invoice = mig.InvoiceCreate(invNumber=invNumber, totalPrice=sum(prices), relatedAddress=1)
+    items = [mig.InvoiceItem(title='Getränkebuchung %s' % i, quantity=1, unitPrice=price)
+             for i, price in enumerate(prices)]
+    return invoice, items
+
+
+def test_get_retry_after(mig):
+    assert mig.get_retry_after(api_error(429, 'Too Many Requests', retry_after='7')) == 7.0
+    assert mig.get_retry_after(api_error(None, '429 Request was throttled. Retry-After: 3')) == 3.0
+    assert mig.get_retry_after(api_error(400, 'invNumber: This field is required.')) is None
+
+
+def test_429_on_an_item_repeats_only_that_item(mig, ev):
+    ev.invoice_item.failures.append(('create', api_error(429, 'Too Many Requests', retry_after=0.01)))
+    invoice, items = payload(mig)
+
+    output = mig.send_invoice(invoice, items)
+
+    assert ev.count('invoice', 'create') == 1
+    assert ev.count('invoice-item', 'create') == 3
+    assert len(ev.invoice.store) == 1 and len(ev.invoice_item.store) == 2
+    assert {item.relatedInvoice for item in ev.invoice_item.store.values()} == {output.id}
+    assert output.isDraft is False  # erst nach allen Posten abgeschlossen
+    assert mig.rate_limiter.rate_limited == 1
+
+
+def test_item_error_keeps_the_draft_and_never_creates_a_second_invoice(mig, ev):
+    ev.invoice_item.failures.append(('create', api_error(400, 'invoice item already exists')))
+    allocator = mig.InvoiceNumberAllocator(current_year=2024, fetch_current_invoice_nr=lambda current_year: 0)
+
+    with pytest.raises(mig.InvoiceItemsError):
+        mig.create_invoice(contact=None, completion_date=None, allocator=allocator, payload=payload(mig))
+
+    assert ev.count('invoice', 'create') == 1
+    assert [invoice.isDraft for invoice in ev.invoice.store.values()] == [True]
+    assert allocator.syncs == 0
+
+
+def test_get_all_pages_is_one_token_per_page(mig, ev):
+    for i in range(250):
+        ev.contact_details.add(firstName='Max%s' % i)
+
+    contacts = mig.get_all_pages(ev.contact_details, limit_per_page=100)
+
+    assert len(contacts) == 250
+    assert ev.count('contact-details', 'get') == 3
+    assert mig.rate_limiter.requests == 3
@@ -0,0 +1,98 @@
+import datetime as dt
+
+import pytest
+
+from conftest import BUCHUNGEN, MITGLIEDER, write_buchungen
+
+from easyverein.models.contact_details import ContactDetails
+from easyverein.models.invoice import Invoice
+from easyverein.models.invoice_item import InvoiceItem
+
+
+def invoice_fields(id, contact, kind='revenue'):
+    return dict(id=id, invNumber='2024-%s' % (100 + id), kind=kind, date=dt.date(2024, 6, 30),
+                relatedAddress='https://easyverein.com/api/v1.7/contact-details/%s' % contact)
+
+
+def item_fields(invoice_id, day, anzahl, betrag):
+    return dict(relatedInvoice=invoice_id, quantity=1, unitPrice=betrag, billingAccount=44134,
+                title='Getränkebuchung am %s, Anzahl Getränke: %s aus Listenposten: Bier' % (day, anzahl))
+
+
+def invoice(id, contact, kind='revenue'):
+    return Invoice(**invoice_fields(id, contact, kind=kind))
+
+
+def item(invoice_id, day, anzahl, betrag):
+    return InvoiceItem(**item_fields(invoice_id, day, anzahl, betrag))
+
+
+@pytest.fixture
+def members():
+    df = MITGLIEDER[['Vorname', 'Nachname']].copy()
+    df['contact_obj'] = [ContactDetails(id=i + 1) for i in range(len(df))]  # Max = 1, Anna = 2
+    return df
+
+
+@pytest.fixture
+def df_open(mig, tmp_path):
+    write_buchungen(tmp_path / 'getraenkeliste.csv', BUCHUNGEN)
+    df_todo = mig.ingest_buchungen(str(tmp_path / 'getraenkeliste.csv'))
+    return df_todo.loc[df_todo["Gezahlt"] == 'Nicht gezahlt']
+
+
+def status_of(df_open, status, vorname):
+    return list(status.loc[df_open["Vorname"] == vorname])
+
+
+def test_cancelled_invoice_is_not_counted_as_billed(mig, members):
+    invoices = [invoice(1, contact=1), invoice(2, contact=1, kind='cancel'), invoice(3, contact=1)]
+    items = [item(1, '01.06.2024', 4, 5.0), item(2, '01.06.2024', 4, -5.0), item(3, '02.06.2024', 1, 1.8)]
+
+    server_index = mig.ServerBillingIndex.from_invoices(invoices, items, members)
+
+    assert server_index.df_billed[["Anzahl", "Betrag"]].values.tolist() == [[1, 1.8]]
+    assert server_index.stats["cancelled"] == 1
+    assert server_index.max_invoice_nr == 103
+
+
+def test_check_marks_billed_open_ledgered_and_conflicting_bookings(mig, members, df_open):
+    invoices = [invoice(1, contact=1), invoice(2, contact=2)]
+    # Max: 01.06. komplett abgerechnet, 02.06. nicht; Anna: 01.06. mit anderer Anzahl abgerechnet
+    items = [item(1, '01.06.2024', 4, 5.0), item(2, '01.06.2024', 2, 1.0)]
+    server_index = mig.ServerBillingIndex.from_invoices(invoices, items, members)
+    ledgered = (df_open["Vorname"] == 'Hans Peter').to_numpy()
+
+    status = server_index.check(df_open, ledgered=ledgered)
+
+    assert status_of(df_open, status, 'Max') == ['billed', 'billed', 'open', 'open']
+    assert status_of(df_open, status, 'Anna') == ['conflict']
+    assert status_of(df_open, status, 'Hans Peter') == ['ledgered']
+    assert status_of(df_open, status, 'Eva') == ['open']
+
+
+def test_check_with_ledger_explains_the_server_total(mig, members, df_open):
+    server_index = mig.ServerBillingIndex.from_invoices([invoice(1, contact=1)], [item(1, '01.06.2024', 2, 2.5)],
+                                                        members)
+    ledgered = ((df_open["Vorname"] == 'Max') & (df_open["Kaufdatum"] == '01.06.2024 18:00')).to_numpy(copy=True)
+    ledgered[ledgered.argmax()] = False  # nur eine der beiden gleichen Buchungen steht in der Gesamtübersicht
+
+    status = server_index.check(df_open, ledgered=ledgered)
+
+    assert status_of(df_open, status, 'Max') == ['open', 'ledgered', 'open', 'open']
+
+
+def test_download_counts_each_item_once_from_a_server_that_ignores_item_filters(mig, ev, members, monkeypatch):
+    for i in range(1, 151):  # mehr Rechnungen als auf eine Seite passen
+        ev.invoice.add(**invoice_fields(i, contact=1))
+    for invoice_id in list(ev.invoice.store):
+        ev.invoice_item.add(**item_fields(invoice_id, '01.06.2024', 1, 2.5))
+    old = ev.invoice.add(invNumber='2023-9', date=dt.date(2023, 12, 1), relatedAddress=1)
+    ev.invoice_item.add(**item_fields(old.id, '01.06.2024', 5, 12.5))  # Rechnung des Vorjahres
+    get = ev.invoice_item.get
+    monkeypatch.setattr(ev.invoice_item, 'get', lambda search=None, **kwargs: get(**kwargs))
+
+    server_index = mig.ServerBillingIndex.download(members, current_year=2024)
+
+    assert server_index.stats["invoices"] == 150 and server_index.stats["items"] == 150
+    assert server_index.df_billed[["Anzahl", "Betrag"]].values.tolist() == [[150, 375.0]]
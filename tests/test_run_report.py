@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+
+def test_report_is_written_when_the_run_aborts(mig, club, ev, tmp_path, monkeypatch):
+    def crashing_send(invoice, items, **kwargs):
+        raise RuntimeError('connection lost')
+
+    monkeypatch.setattr(mig, 'send_invoice', crashing_send)
+    report_path = str(tmp_path / 'report.json')
+
+    with pytest.raises(RuntimeError):
+        mig.main(contacts_ttl_hours=0, report_path=report_path, **club)
+
+    with open(report_path, encoding='utf-8') as fh:
+        report = json.load(fh)
+    assert report["error"] == 'RuntimeError: connection lost'
+    assert 'submit' in report["stages"] and report["stages"]["submit"]["peak_mb"] is None  # ohne tracemalloc
+    assert mig.rate_limiter.report is None
+
+
+def test_rate_limiter_counts_each_run_on_its_own(mig, club, ev, tmp_path):
+    reports = []
+    for run in range(2):
+        report_path = str(tmp_path / ('report_%s.json' % run))
+        mig.main(dryrun=True, contacts_ttl_hours=0, report_path=report_path, **club)
+        with open(report_path, encoding='utf-8') as fh:
+            reports.append(json.load(fh)["rate_limiter"]["requests"])
+
+    assert reports[0] == reports[1] == mig.rate_limiter.requests > 0
@@ -0,0 +1,105 @@
+import datetime as dt
+
+import pytest
+
+from easyverein.models.contact_details import ContactDetails, ContactDetailsFilter
+
+
+class ModifiedContactDetails(ContactDetails):
+    modifiedAt: str | None = None
+
+
+class ModifiedContactDetailsFilter(ContactDetailsFilter):
+    modifiedAt__gte: str | None = None
+
+
+def ago(**kwargs):
+    return (dt.datetime.now(dt.timezone.utc) - dt.timedelta(**kwargs)).isoformat()
+
+
+def names(contacts):
+    return sorted(contact.familyName for contact in contacts)
+
+
+@pytest.fixture
+def snapshot(mig, tmp_path):
+    snapshot = mig.ContactSnapshot(str(tmp_path / mig.CONTACT_SNAPSHOT_FILENAME), ttl=dt.timedelta(hours=1))
+    yield snapshot
+    snapshot.close()
+
+
+@pytest.fixture
+def contacts(ev):
+    return [ev.contact_details.add(firstName='Max', familyName=name) for name in ('Müller', 'Maier', 'Schmidt')]
+
+
+def expire(snapshot, **kwargs):
+    snapshot.set_meta('last_sync', ago(**kwargs))
+
+
+def test_fresh_snapshot_is_read_without_requests(mig, ev, snapshot, contacts):
+    mig.sync_contacts(snapshot)
+    ev.contact_details.add(firstName='Eva', familyName='Gast')
+
+    assert names(mig.sync_contacts(snapshot)) == ['Maier', 'Müller', 'Schmidt']
+    assert ev.count('contact-details', 'get') == 1
+
+
+def test_incremental_sync_fetches_only_changed_contacts(mig, ev, snapshot, monkeypatch, capsys):
+    monkeypatch.setattr(ev.contact_details, 'model', ModifiedContactDetails)
+    monkeypatch.setattr(mig, 'ContactDetailsFilter', ModifiedContactDetailsFilter)
+    max_mueller, _ = [ev.contact_details.add(firstName='Max', familyName=name, modifiedAt=ago(days=30))
+                      for name in ('Müller', 'Maier')]
+    mig.sync_contacts(snapshot)
+    expire(snapshot, hours=2)
+    max_mueller.familyName = 'Müller-Lüdenscheidt'
+    max_mueller.modifiedAt = ago(hours=1)
+    ev.contact_details.add(firstName='Eva', familyName='Gast', modifiedAt=ago(minutes=5))
+    capsys.readouterr()
+
+    contacts = mig.sync_contacts(snapshot)
+
+    assert 'SYNCED 2 CHANGED CONTACTS' in capsys.readouterr().out
+    assert names(contacts) == ['Gast', 'Maier', 'Müller-Lüdenscheidt']
+
+
+def test_without_a_modified_filter_an_expired_snapshot_is_downloaded_completely(mig, ev, snapshot, contacts, capsys):
+    mig.sync_contacts(snapshot)
+    expire(snapshot, hours=2)
+    capsys.readouterr()
+
+    mig.sync_contacts(snapshot)
+
+    assert 'DOWNLOADED ALL 3 CONTACTS' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('force_full_refresh', [True, False])
+def test_full_refresh_drops_deleted_contacts(mig, ev, snapshot, monkeypatch, force_full_refresh):
+    monkeypatch.setattr(ev.contact_details, 'model', ModifiedContactDetails)
+    monkeypatch.setattr(mig, 'ContactDetailsFilter', ModifiedContactDetailsFilter)
+    contacts = [ev.contact_details.add(firstName='Max', familyName=name, modifiedAt=ago(days=30))
+                for name in ('Müller', 'Maier', 'Schmidt')]
+    mig.sync_contacts(snapshot)
+    del ev.contact_details.store[contacts[1].id]
+    expire(snapshot, hours=2)
+    assert names(mig.sync_contacts(snapshot)) == ['Maier', 'Müller', 'Schmidt']  # inkrementell bleibt er stehen
+    if not force_full_refresh:
+        expire(snapshot, hours=2)
+        snapshot.set_meta('last_full_sync', ago(days=8))
+
+    assert names(mig.sync_contacts(snapshot, force_full_refresh=force_full_refresh)) == ['Müller', 'Schmidt']
+
+
+def test_reopened_snapshot_keeps_contacts_and_meta(mig, ev, snapshot, contacts):
+    mig.sync_contacts(snapshot)
+    snapshot.set_last_invoice_nr(2024, 630)
+    last_sync = snapshot.last_sync
+    snapshot.close()
+
+    reopened = mig.ContactSnapshot(snapshot.path, ttl=dt.timedelta(hours=1))
+    try:
+        assert names(mig.sync_contacts(reopened)) == ['Maier', 'Müller', 'Schmidt']
+        assert (reopened.last_sync, reopened.last_invoice_nr(2024)) == (last_sync, 630)
+    finally:
+        reopened.close()
+    assert ev.count('contact-details', 'get') == 1
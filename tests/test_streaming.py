@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import BUCHUNGEN, write_buchungen
+
+SORTED_BUCHUNGEN = sorted(BUCHUNGEN, key=lambda row: (row[0], row[1]))
+
+
+def run(mig, club, tmp_path, **kwargs):
+    write_buchungen(tmp_path / 'alltime.csv', BUCHUNGEN[-1:])
+    for name in os.listdir(tmp_path):
+        if name.startswith('alltime.') and name != 'alltime.csv':
+            os.remove(tmp_path / name)  # Fingerprint-Index des vorigen Laufs
+    df_results = mig.main(contacts_ttl_hours=0, trace_memory=False, resume=False, **dict(club, **kwargs))
+    return df_results, (tmp_path / 'alltime.csv').read_text(encoding='latin1')
+
+
+@pytest.mark.parametrize('bookings, sorted_by_player', [(BUCHUNGEN, False), (SORTED_BUCHUNGEN, True)])
+def test_streaming_writes_the_same_ledger_as_the_in_memory_run(mig, club, ev, tmp_path, bookings, sorted_by_player):
+    write_buchungen(tmp_path / 'getraenkeliste.csv', bookings)
+    df_in_memory, ledger_in_memory = run(mig, club, tmp_path)
+    invoices_in_memory = sorted(invoice.totalPrice for invoice in ev.invoice.store.values())
+    ev.invoice.store.clear()
+
+    df_streaming, ledger_streaming = run(mig, club, tmp_path, streaming=True, chunksize=2,
+                                         sorted_by_player=sorted_by_player)
+
+    assert ledger_streaming == ledger_in_memory
+    assert sorted(invoice.totalPrice for invoice in ev.invoice.store.values()) == invoices_in_memory
+    assert sorted(df_streaming["status"]) == sorted(df_in_memory["status"])
+
+
+def test_sorted_input_is_billed_block_by_block(mig, tmp_path):
+    write_buchungen(tmp_path / 'getraenkeliste.csv', SORTED_BUCHUNGEN)
+    index = mig.FingerprintIndex(np.empty(0, dtype=np.uint64))
+
+    batches = [sorted(rows_by_player) for _, rows_by_player in mig.iter_purchase_batches(
+        str(tmp_path / 'getraenkeliste.csv'), index=index, chunksize=2, sorted_by_player=True)]
+    unsorted = [sorted(rows_by_player) for _, rows_by_player in mig.iter_purchase_batches(
+        str(tmp_path / 'getraenkeliste.csv'), index=index, chunksize=2)]
+
+    # ein Spieler geht raus, sobald ein Block mit einem anderen Spieler endet
+    assert batches == [[('Anna', 'Schmidt-Berg'), ('Eva', 'Gast')], [('Hans Peter', 'Maier')], [('Max', 'Müller')]]
+    assert unsorted == [sum(batches, [])]  # unsortiert: alles in einem Batch am Ende der Datei
+
+
+def test_unsorted_input_with_sorted_by_player_is_refused(mig, tmp_path):
+    write_buchungen(tmp_path / 'getraenkeliste.csv', BUCHUNGEN)
+    index = mig.FingerprintIndex(np.empty(0, dtype=np.uint64))
+
+    with pytest.raises(ValueError, match='Max Müller'):
+        list(mig.iter_purchase_batches(str(tmp_path / 'getraenkeliste.csv'), index=index, chunksize=2,
+                                       sorted_by_player=True))
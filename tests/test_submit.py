@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import read_alltime
+
+
+def test_ledger_failure_after_the_invoice_is_reported_and_the_run_goes_on(mig, club, ev, monkeypatch):
+    save_billing_to_alltime = mig.save_billing_to_alltime
+
+    def failing_save(firstName, lastName, **kwargs):
+        if firstName == 'Anna':
+            raise OSError('disk full')
+        save_billing_to_alltime(firstName=firstName, lastName=lastName, **kwargs)
+
+    monkeypatch.setattr(mig, 'save_billing_to_alltime', failing_save)
+
+    df_results = mig.main(contacts_ttl_hours=0, trace_memory=False, **club)
+
+    anna = df_results.loc[df_results["Vorname"] == 'Anna'].iloc[0]
+    assert (anna["status"], anna["error_type"], anna["error"]) == ('ledger_failed', 'OSError', 'disk full')
+    assert anna["invNumber"] is not None
+    assert sorted(df_results["status"]) == ['ledger_failed', 'ledgered', 'ledgered', 'skipped']
+    assert len(ev.invoice.store) == 3
+
+
+def test_aborted_submit_still_flushes_the_ledger(mig, club, ev, tmp_path, monkeypatch):
+    send_invoice = mig.send_invoice
+
+    def crashing_send(invoice, items, **kwargs):
+        if len(ev.invoice.store) == 1:
+            raise RuntimeError('connection lost')
+        return send_invoice(invoice, items, **kwargs)
+
+    monkeypatch.setattr(mig, 'send_invoice', crashing_send)
+
+    with pytest.raises(RuntimeError):
+        mig.main(contacts_ttl_hours=0, trace_memory=False, ledger_backend='sqlite', **club)
+
+    # Anna kommt als erste dran, ihre Buchungen stehen trotz fsync_every=20 in der Gesamtübersicht
+    df_alltime = read_alltime(tmp_path / 'alltime.csv')
+    assert sorted(set(df_alltime["Vorname"])) == ['Anna', 'Max']
+    assert len(ev.invoice.store) == 1
+
+
+def test_numbers_are_taken_only_when_an_invoice_is_sent(mig, club, ev, monkeypatch):
+    allocators = []
+
+    class RecordingAllocator(mig.InvoiceNumberAllocator):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            allocators.append(self)
+
+    def crashing_send(invoice, items, **kwargs):
+        raise RuntimeError('connection lost')
+
+    monkeypatch.setattr(mig, 'InvoiceNumberAllocator', RecordingAllocator)
+    monkeypatch.setattr(mig, 'send_invoice', crashing_send)
+
+    with pytest.raises(RuntimeError):
+        mig.main(contacts_ttl_hours=0, trace_memory=False, **club)
+
+    assert allocators[-1].known_invoice_nr == 1  # nur die Rechnung, deren Senden abgebrochen ist
+
+
+def test_submit_reads_two_contacts_per_worker_ahead(mig, monkeypatch):
+    read = []
+    billed = []
+
+    def contacts():
+        for i in range(7):
+            read.append(i)
+            yield {"Vorname": 'Max%s' % i, "Nachname": 'Müller', "Gruppe": None}
+
+    def recording_bill_contact(contact, **kwargs):
+        billed.append(len(read))
+        return {"Vorname": contact["Vorname"], "Nachname": contact["Nachname"], "Gruppe": None, "status": "skipped"}
+
+    monkeypatch.setattr(mig, 'bill_contact', recording_bill_contact)
+
+    mig.submit_invoices(contacts(), completion_date=None, dryrun=True, allocator=None, ledger=None, index=None)
+
+    assert billed == [2, 2, 4, 4, 6, 6, 7]
+
+
+def test_item_fields_are_validated_despite_model_copy(mig):
+    builder = mig.InvoiceBatchBuilder(completion_date=None)
+    guest = {"_Preis": ['zwei Euro'], "Buchungszeit": ['01.06.2024 18:00'], "Dauer": ['1h']}
+
+    with pytest.raises(ValueError):
+        builder.items(guest, art='Gast')
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from conftest import MITGLIEDER, BUCHUNGEN, FakeEasyverein, write_buchungen
+
+TENANT = {"name": 'tcanderswo', "api_key": 'key', "api_version": 'v2.0', "reference_url": 'https://ev.example/api/',
+          "groups": {"Gast": 11, "Mitglied": 12, "not": 13}, "billing_accounts": {"Gast": 21, "Getränk": 22},
+          "selection_acc": 31, "requests_per_minute": 600}
+
+
+def test_tenant_config_leaves_the_module_settings_alone(mig):
+    before = (mig.ev_client, mig.rate_limiter, mig.GROUP_ID_GAST, mig.BILLING_ACCOUNT_GETRAENK)
+
+    config = mig.TenantConfig.from_dict(TENANT)
+
+    assert (mig.ev_client, mig.rate_limiter, mig.GROUP_ID_GAST, mig.BILLING_ACCOUNT_GETRAENK) == before
+    assert config.contact_groups == {'https://ev.example/api/v2.0/contact-details-group/11': 'Gast',
+                                     'https://ev.example/api/v2.0/contact-details-group/12': 'Mitglied'}
+    assert config.contact_details_url % {"id": 5} == 'https://ev.example/api/v2.0/contact-details/5'
+    assert config.billing_account_url % {"id": 22} == 'https://ev.example/api/v2.0/billing-account/22'
+    assert config.rate_limiter is not mig.rate_limiter
+
+
+def test_run_bills_through_the_tenant_client_with_its_urls(mig, ev, tmp_path):
+    client = FakeEasyverein()
+    tenant = mig.TenantConfig.from_dict(TENANT)
+    tenant.ev_client = client
+    max_mueller = client.contact_details.add(firstName='Max', familyName='Müller', zip='82269',
+                                             salutation='Herr', street='Hauptstraße 1', city='Grafrath',
+                                             methodOfPayment=2, contactDetailsGroups=[
+                                                 'https://ev.example/api/v2.0/contact-details-group/12'])
+    write_buchungen(tmp_path / 'getraenkeliste.csv', BUCHUNGEN[:3])
+    MITGLIEDER.to_csv(tmp_path / 'mitgliederliste.csv', sep=';', encoding='latin1', index=False)
+    write_buchungen(tmp_path / 'alltime.csv', [])
+
+    df_results = mig.main(csv_file_path=str(tmp_path) + os.sep, filename_buchungen='getraenkeliste.csv',
+                          filename_mitglieder='mitgliederliste.csv', buchungen_alltime='alltime.csv',
+                          completion_date=None, contacts_ttl_hours=0, tenant=tenant)
+
+    assert list(df_results["status"]) == ['ledgered']
+    assert ev.calls == []  # der Verein aus den Modul-Einstellungen bleibt unberührt
+    (invoice,) = client.invoice.store.values()
+    assert str(invoice.relatedAddress) == 'https://ev.example/api/v2.0/contact-details/%s' % max_mueller.id
+    assert invoice.selectionAcc == 31
+    assert {str(item.billingAccount) for item in client.invoice_item.store.values()} == {
+        'https://ev.example/api/v2.0/billing-account/22'}
+    assert tenant.rate_limiter.requests == len(client.calls)
+
+
+@pytest.mark.parametrize('error, reported', [(ValueError('csv kaputt'), True), (TypeError('bug'), False)])
+def test_run_tenant_reports_only_expected_errors(mig, tmp_path, monkeypatch, error, reported):
+    def failing_main(**kwargs):
+        raise error
+
+    monkeypatch.setattr(mig, 'main', failing_main)
+    tenant = dict(TENANT, csv_file_path=str(tmp_path) + os.sep)
+
+    if reported:
+        result = mig.run_tenant(tenant)
+        assert (result["error_type"], result["error"]) == ('ValueError', 'csv kaputt')
+        assert 'ValueError: csv kaputt' in open(result["log_path"], encoding='utf-8').read()
+    else:
+        with pytest.raises(TypeError):
+            mig.run_tenant(tenant)